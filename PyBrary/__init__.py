@@ -1,12 +1,11 @@
 # STANDARD LIBRARY
+import contextlib
 import json
-import os
-
-# 3RD PARTY MODULES
-from tinydb import TinyDB, Query
 
 # LOCAL MODULES
-from PyBrary import config
+from PyBrary import backends, config, db
+from PyBrary.backup import BackupStore
+from PyBrary.coordination import ProcessCoordinator
 
 
 # GLOBAL
@@ -20,19 +19,73 @@ BOOKS = config.BOOKS_TABLE_NAME
 def initialize_database(env:str=None) -> bool:
     """Initializes environments database to only contain contents of 'example_data.json'
     """
-    if env:
-        db_path = config.ENVIRONMENTS[env]['DATABASE']
+    env = env or ENV
+    with open(EXAMPLE_DATA) as f:
+        data = json.load(f)
+    replace_database(env, data)
+    return True
+
+def replace_database(env:str, data:dict) -> None:
+    """Replaces the database of `env` with the USERS and BOOKS in `data`, wherever it is shared
+
+    If `env` is the open environment, it is reloaded on next use; any other
+    open environment is left as it is.
+    """
+    db_path = config.ENVIRONMENTS[env]['DATABASE']
+    if env == db._environment:
+        # release the shared handle so it reloads the rebuilt database on next use
+        db.close_database()
+    if config.ENVIRONMENTS[env].get('MULTIPROCESS'):
+        # rebuild under the writer lock and tell other processes to reload
+        coordinator = ProcessCoordinator(db_path)
+        with coordinator.exclusive():
+            load_database(env, data)
+            coordinator.publish()
+    else:
+        load_database(env, data)
+
+def load_database(env:str, data:dict) -> None:
+    """Replaces the database of `env` with the USERS and BOOKS in `data`
+    """
+    backends.get_backend_class(env).destroy(config.ENVIRONMENTS[env]['DATABASE'])
+    backend = backends.open_backend(env)
+    try:
+        backend.load({USERS: data[USERS], BOOKS: data[BOOKS]})
+    finally:
+        backend.close()
+
+def read_database(env:str) -> dict:
+    """Returns {table_name: {doc_id: document}} for the USERS and BOOKS of `env`, read from a backend of its own
+
+    Where `env` is shared between processes the read holds off their writers.
+    """
+    if config.ENVIRONMENTS[env].get('MULTIPROCESS'):
+        lock = ProcessCoordinator(config.ENVIRONMENTS[env]['DATABASE']).shared()
+    else:
+        lock = contextlib.nullcontext()
+    with lock:
+        backend = backends.open_backend(env)
+        try:
+            return {table_name: dict(backend.table(table_name).page()) for table_name in (USERS, BOOKS)}
+        finally:
+            backend.close()
+
+def backup_database(env:str=None, store:BackupStore=None) -> dict:
+    """Stores a point-in-time backup of the database of `env` (the open one by default); returns its manifest
+
+    Writers keep going while the open database is backed up (see
+    db.export_tables). Any other environment is read with `read_database`,
+    leaving the open one as it is.
+    """
+    if env is None or env == db._environment:
+        tables = db.export_tables()
+        env = db._environment
     else:
-        db_path = DATABASE
-    if os.path.exists(db_path):
-        os.remove(db_path)
-    with TinyDB(db_path) as database:
-        with open(EXAMPLE_DATA) as f:
-            data = json.load(f)
-        # USERS
-        users_table = database.table(USERS)
-        users_table.insert_multiple(data[USERS])
-        # BOOKS
-        books_table = database.table(BOOKS)
-        books_table.insert_multiple(data[BOOKS])
-    return True
\ No newline at end of file
+        tables = read_database(env)
+    return (store or BackupStore()).save(tables, environment=env)
+
+def restore_database(backup_id:str, env:str=None, store:BackupStore=None) -> bool:
+    """Replaces the database of `env` with the contents of a backup, which may come from any environment
+    """
+    replace_database(env or ENV, (store or BackupStore()).read(backup_id))
+    return True
@@ -0,0 +1,94 @@
+# STANDARD LIBRARY
+import asyncio
+import concurrent.futures
+import functools
+from typing import AsyncIterator, Iterator
+
+# LOCAL MODULES
+from PyBrary import config, db
+
+
+# SETUP
+# Storage access is blocking and serialized by db.py's connection lock, so a
+# handful of threads is enough; waiting callers cost a coroutine, not a thread.
+_executor = None
+
+
+# UTILITY FUNCTIONS
+def get_executor() -> concurrent.futures.ThreadPoolExecutor:
+    """Returns the bounded executor that runs blocking db.py calls, creating it on first use
+    """
+    global _executor
+    if _executor is None:
+        _executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=config.ASYNC_WORKERS, thread_name_prefix='pybrary-db')
+    return _executor
+
+def shutdown_executor() -> None:
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=True)
+        _executor = None
+
+async def run(func, *args, **kwargs):
+    """Runs the blocking `func` on the db executor and awaits its result
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_executor(), functools.partial(func, *args, **kwargs))
+
+def asynchronous(func):
+    """Wraps a blocking db.py function as a coroutine function running on the db executor
+    """
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        return await run(func, *args, **kwargs)
+    return wrapper
+
+async def iterate(iterator:Iterator, batch_size:int=None) -> AsyncIterator:
+    """Drains a blocking iterator on the db executor, `batch_size` items per hop
+    """
+    batch_size = batch_size or config.EXPORT_BATCH_SIZE
+    take = lambda: [item for _, item in zip(range(batch_size), iterator)]
+    while True:
+        batch = await run(take)
+        for item in batch:
+            yield item
+        if len(batch) < batch_size:
+            return
+
+
+# PUBLIC FUNCTIONS
+# Same signatures and make_response payloads as their db.py counterparts.
+get_version = asynchronous(db.get_version)
+# USERS
+get_user = asynchronous(db.get_user)
+get_all_users = asynchronous(db.get_all_users)
+add_user = asynchronous(db.add_user)
+update_user = asynchronous(db.update_user)
+remove_user = asynchronous(db.remove_user)
+add_users = asynchronous(db.add_users)
+# WISHLISTS
+get_wishlist = asynchronous(db.get_wishlist)
+add_to_wishlist = asynchronous(db.add_to_wishlist)
+remove_from_wishlist = asynchronous(db.remove_from_wishlist)
+reconcile_wishlists = asynchronous(db.reconcile_wishlists)
+# BOOKS
+get_book = asynchronous(db.get_book)
+get_books = asynchronous(db.get_books)
+get_all_books = asynchronous(db.get_all_books)
+search_books = asynchronous(db.search_books)
+add_book = asynchronous(db.add_book)
+add_books = asynchronous(db.add_books)
+get_wishers = asynchronous(db.get_wishers)
+remove_book = asynchronous(db.remove_book)
+# AUTHORS
+get_authors = asynchronous(db.get_authors)
+get_books_by_author = asynchronous(db.get_books_by_author)
+# CHANGES
+get_changes = asynchronous(db.get_changes)
+
+def iter_users(batch_size:int=None) -> AsyncIterator[dict]:
+    return iterate(db.iter_users(batch_size), batch_size)
+
+def iter_books(batch_size:int=None) -> AsyncIterator[dict]:
+    return iterate(db.iter_books(batch_size), batch_size)
@@ -0,0 +1,633 @@
+# STANDARD LIBRARY
+import logging
+import os
+import sqlite3
+import threading
+
+# 3RD PARTY MODULES
+from tinydb import TinyDB
+from tinydb.middlewares import CachingMiddleware
+from tinydb.storages import JSONStorage, MemoryStorage
+
+# LOCAL MODULES
+from PyBrary import config
+from PyBrary.compact import CompactStorage, InternedColumn, InternedMapColumn, TextColumn, packed
+from PyBrary.index import DuplicateKeyError, KeyedTable
+from PyBrary.snapshot import SnapshotStorage
+from PyBrary.wal import WriteAheadLog
+
+
+# GLOBAL
+logger = logging.getLogger(__name__)
+USERS_TABLE = config.USERS_TABLE_NAME
+BOOKS_TABLE = config.BOOKS_TABLE_NAME
+TABLE_KEYS = {
+    USERS_TABLE: 'email',
+    BOOKS_TABLE: 'isbn'
+}
+DEFAULT_BACKEND = 'tinydb'
+# column layout of each table under the `compact` backend, see compact.py
+COMPACT_SCHEMAS = {
+    USERS_TABLE: {
+        'first_name': InternedColumn,
+        'last_name': InternedColumn,
+        'email': TextColumn,
+        'password': TextColumn,
+        'wishlist': InternedMapColumn
+    },
+    BOOKS_TABLE: {
+        'title': InternedColumn,
+        'author': InternedColumn,
+        'isbn': packed(13),
+        'publication_date': packed(10)
+    }
+}
+
+
+# BACKEND INTERFACE
+class StorageBackend:
+    """Storage engine behind the public functions in db.py
+
+    A backend hands out one table object per table name. Tables are addressed
+    by their unique key (`TABLE_KEYS`) and provide `get`, `get_many`, `contains`, `all`,
+    `page`, `insert`, `update`, `remove` and `len()`, returning plain document
+    dicts and raising `DuplicateKeyError` when a write would duplicate a key.
+    `page` walks the table in insertion order, pushing filters (see
+    index.FILTER_OPERATORS) and field projection down into the engine.
+    Writes between `begin` and `commit` form one atomic unit of work.
+
+    Backends are not thread safe; db.py serializes access to them.
+    """
+    # whether several processes may open the same path, see coordination.py
+    MULTIPROCESS_SAFE = True
+
+    def __init__(self, path:str, **options):
+        self.path = path
+        self.options = options
+
+    @classmethod
+    def destroy(cls, path:str) -> None:
+        """Deletes every file the backend keeps at `path`
+        """
+        if os.path.exists(path):
+            os.remove(path)
+
+    def table(self, name:str):
+        raise NotImplementedError
+
+    def load(self, data:dict) -> None:
+        """Bulk loads {table_name: [document, ...]} without key checks, for seeding
+        """
+        raise NotImplementedError
+
+    def begin(self) -> None:
+        raise NotImplementedError
+
+    def commit(self):
+        """Commits the unit of work, returning a token to pass to `sync`
+        """
+        raise NotImplementedError
+
+    def sync(self, token) -> None:
+        """Returns once the commit identified by `token` is durable
+
+        Called after the connection lock is released, so backends that make
+        commits durable lazily can share that work between committers.
+        """
+
+    def rollback(self) -> None:
+        raise NotImplementedError
+
+    def changes(self) -> list:
+        """Returns [table_name, doc_id, before, after] for every document the open unit of work changed
+
+        Other processes sharing the database apply these to catch up with the
+        commit (see coordination.py). None if the backend can't tell, in which
+        case they reload everything instead.
+        """
+        return None
+
+    def apply(self, changes:list) -> None:
+        """Brings the in-memory state up to date with `changes` another process has committed
+        """
+        raise NotImplementedError
+
+    def flush(self) -> None:
+        """Pushes any buffered writes to disk
+        """
+
+    def close(self) -> None:
+        raise NotImplementedError
+
+
+# TINYDB BACKEND
+class TinyDBBackend(StorageBackend):
+    """TinyDB JSON file kept in memory through `CachingMiddleware`
+
+    Writes reach the file every `WRITE_CACHE_SIZE` commits, on flush and on close.
+    """
+    STORAGE = JSONStorage
+
+    def __init__(self, path:str, **options):
+        super().__init__(path, **options)
+        storage = CachingMiddleware(self.STORAGE)
+        storage.WRITE_CACHE_SIZE = options.get('WRITE_CACHE_SIZE', CachingMiddleware.WRITE_CACHE_SIZE)
+        self.conn = TinyDB(path, storage=storage, **self._storage_options())
+        self._tables = {}
+        # read the file now rather than on first use, while the caller may hold a lock against writers
+        for name in TABLE_KEYS:
+            self.table(name)
+
+    def _storage_options(self) -> dict:
+        return {}
+
+    def table(self, name:str) -> KeyedTable:
+        if name not in self._tables:
+            self._tables[name] = KeyedTable(self.conn.table(name), key=TABLE_KEYS[name])
+        return self._tables[name]
+
+    def load(self, data:dict) -> None:
+        for name, documents in data.items():
+            self.conn.table(name).insert_multiple(documents)
+        for table in self._tables.values():
+            table.rebuild()
+        self.flush()
+
+    def begin(self) -> None:
+        for name in TABLE_KEYS:
+            self.table(name).begin()
+
+    def commit(self) -> None:
+        for name in TABLE_KEYS:
+            self.table(name).commit()
+
+    def rollback(self) -> None:
+        for name in TABLE_KEYS:
+            self.table(name).rollback()
+
+    def changes(self) -> list:
+        return [[name, doc_id, before, after]
+                for name in TABLE_KEYS for doc_id, before, after in self.table(name).changes()]
+
+    def apply(self, changes:list) -> None:
+        for name, doc_id, _, after in changes:
+            self.table(name).apply(doc_id, after)
+
+    def flush(self) -> None:
+        self.conn.storage.flush()
+
+    def close(self) -> None:
+        self.conn.close()
+        self._tables = {}
+
+
+# SNAPSHOT BACKEND
+class SnapshotBackend(TinyDBBackend):
+    """TinyDB over a binary snapshot file (see snapshot.py) instead of JSON
+
+    Opening memory-maps the file and parses only its header index; each
+    document is decoded the first time it is read. Writes are cached and
+    flushed like the `tinydb` backend, copying undecoded records as-is.
+    """
+    STORAGE = SnapshotStorage
+
+    def _storage_options(self) -> dict:
+        return {'keys': TABLE_KEYS}
+
+
+# COMPACT BACKEND
+class CompactBackend(TinyDBBackend):
+    """TinyDB JSON file held in memory column by column instead of as one dict per document
+
+    Books and users are stored per `COMPACT_SCHEMAS` (see compact.py): names,
+    authors, titles and wishlist titles are interned in a shared pool, and
+    ISBNs and dates are packed into fixed-width buffers. Documents are only
+    built as dicts when read. The file format and write caching are the
+    same as the `tinydb` backend.
+    """
+    STORAGE = CompactStorage
+
+    def _storage_options(self) -> dict:
+        return {'schemas': COMPACT_SCHEMAS}
+
+
+# WRITE-AHEAD LOG BACKEND
+class WALBackend(StorageBackend):
+    """In-memory TinyDB made durable by a write-ahead log (see wal.py)
+
+    The file at `path` is a TinyDB JSON snapshot. Each commit appends the
+    documents it changed to the log instead of rewriting the snapshot, so
+    write cost is independent of the dataset size, and commits are fsynced
+    in groups (`WAL_SYNC`). A background thread rotates the log once a
+    segment passes `WAL_COMPACT_BYTES` and folds closed segments into the
+    snapshot. Opening the backend replays the log over the snapshot.
+    """
+    # each process would replay and compact the log on its own
+    MULTIPROCESS_SAFE = False
+
+    def __init__(self, path:str, **options):
+        super().__init__(path, **options)
+        self.log = WriteAheadLog(path, fsync=options.get('WAL_SYNC', True))
+        self.conn = TinyDB(storage=MemoryStorage)
+        self.conn.storage.write(self.log.recover())
+        self._tables = {}
+        self._changed = {}
+        self._compact_bytes = options.get('WAL_COMPACT_BYTES', 16 * 1024 * 1024)
+        self._stopping = threading.Event()
+        self._compactor = threading.Thread(
+            target=self._compact_periodically,
+            args=(options.get('WAL_COMPACT_INTERVAL', 5),),
+            name='pybrary-wal-compactor',
+            daemon=True)
+        self._compactor.start()
+
+    @classmethod
+    def destroy(cls, path:str) -> None:
+        super().destroy(path)
+        WriteAheadLog.destroy(path)
+
+    def _note_change(self, table_name:str, doc_id:str) -> None:
+        self._changed.setdefault(table_name, set()).add(doc_id)
+
+    def _compact_periodically(self, interval:float) -> None:
+        while not self._stopping.wait(interval):
+            try:
+                if self.log.size >= self._compact_bytes:
+                    self.log.rotate()
+                    self.log.compact()
+            except Exception:
+                logger.exception("write-ahead log compaction failed")
+
+    def table(self, name:str) -> KeyedTable:
+        if name not in self._tables:
+            self._tables[name] = KeyedTable(
+                self.conn.table(name), key=TABLE_KEYS[name], on_change=self._note_change)
+        return self._tables[name]
+
+    def load(self, data:dict) -> None:
+        for name, documents in data.items():
+            self.conn.table(name).insert_multiple(documents)
+        for table in self._tables.values():
+            table.rebuild()
+        self.log.checkpoint(self.conn.storage.read())
+
+    def begin(self) -> None:
+        self._changed = {}
+        for name in TABLE_KEYS:
+            self.table(name).begin()
+
+    def commit(self) -> int:
+        operations = []
+        for name, doc_ids in self._changed.items():
+            table = self.table(name)
+            for doc_id in sorted(doc_ids, key=int):
+                operations.append([name, doc_id, table.raw(doc_id)])
+        self._changed = {}
+        for name in TABLE_KEYS:
+            self.table(name).commit()
+        if not operations:
+            return None
+        return self.log.append(operations)
+
+    def sync(self, token:int) -> None:
+        if token is not None:
+            self.log.sync(token)
+
+    def rollback(self) -> None:
+        self._changed = {}
+        for name in TABLE_KEYS:
+            self.table(name).rollback()
+
+    def flush(self) -> None:
+        self.log.rotate()
+
+    def close(self) -> None:
+        self._stopping.set()
+        self._compactor.join()
+        self.log.checkpoint(self.conn.storage.read())
+        self.log.close()
+        self._tables = {}
+
+
+# SQLITE BACKEND
+SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS books (
+    id INTEGER PRIMARY KEY,
+    isbn TEXT NOT NULL,
+    title TEXT,
+    author TEXT,
+    publication_date TEXT
+);
+CREATE INDEX IF NOT EXISTS books_isbn ON books (isbn);
+CREATE INDEX IF NOT EXISTS books_author ON books (author);
+CREATE TABLE IF NOT EXISTS users (
+    id INTEGER PRIMARY KEY,
+    email TEXT NOT NULL,
+    first_name TEXT,
+    last_name TEXT,
+    password TEXT
+);
+CREATE INDEX IF NOT EXISTS users_email ON users (email);
+CREATE TABLE IF NOT EXISTS wishlist (
+    user_id INTEGER NOT NULL REFERENCES users (id) ON DELETE CASCADE,
+    isbn TEXT NOT NULL,
+    title TEXT,
+    PRIMARY KEY (user_id, isbn)
+);
+CREATE INDEX IF NOT EXISTS wishlist_isbn ON wishlist (isbn);
+"""
+
+SQL_OPERATORS = {
+    'eq': '=',
+    'ge': '>=',
+    'le': '<='
+}
+# keys per IN (...) query, well under SQLite's bound-parameter limit
+SQLITE_BATCH_SIZE = 500
+
+class SQLiteTable:
+    """A table of the SQLite backend addressed by its indexed key column
+
+    The key columns use plain rather than UNIQUE indexes so legacy data with
+    duplicate keys (example_data.json has one) still loads; uniqueness of new
+    writes is enforced here, and the lowest id wins on duplicates, as it does
+    in the TinyDB backend. Fields outside `columns` are not stored.
+
+    While `journal` is a dict, the state of each row before the open
+    transaction first touched it is saved there under its id, so the
+    transaction's changes can be published to other processes.
+    """
+    def __init__(self, conn:sqlite3.Connection, sql_name:str, key:str, columns:tuple):
+        self.conn = conn
+        self.sql_name = sql_name
+        self.key = key
+        self.columns = columns
+        self.journal = None
+
+    def __len__(self) -> int:
+        return self.conn.execute(f"SELECT COUNT(*) FROM {self.sql_name}").fetchone()[0]
+
+    def _columns(self, fields:list=None) -> list:
+        return [column for column in self.columns if fields is None or column in fields]
+
+    def _select(self, fields:list=None) -> str:
+        return f"SELECT {', '.join(['id'] + self._columns(fields))} FROM {self.sql_name}"
+
+    def _documents(self, rows:list, fields:list=None) -> list:
+        columns = self._columns(fields)
+        return [dict(zip(columns, row[1:])) for row in rows]
+
+    def _row_id(self, key) -> int:
+        row = self.conn.execute(
+            f"SELECT id FROM {self.sql_name} WHERE {self.key} = ? ORDER BY id LIMIT 1", (key,)).fetchone()
+        return row[0] if row else None
+
+    def _fetch(self, row_id:int) -> dict:
+        documents = self._documents(self.conn.execute(f"{self._select()} WHERE id = ?", (row_id,)).fetchall())
+        return documents[0] if documents else None
+
+    def _record(self, row_ids:list) -> None:
+        if self.journal is None:
+            return
+        for row_id in row_ids:
+            if row_id not in self.journal:
+                self.journal[row_id] = self._fetch(row_id)
+
+    def changes(self) -> list:
+        """Returns (id, before, after) for every row the open transaction changed, in id order
+        """
+        changes = []
+        for row_id in sorted(self.journal):
+            before, after = self.journal[row_id], self._fetch(row_id)
+            if before != after:
+                changes.append((row_id, before, after))
+        return changes
+
+    def _insert_row(self, document:dict) -> int:
+        values = [document.get(column) for column in self.columns]
+        cursor = self.conn.execute(
+            f"INSERT INTO {self.sql_name} ({', '.join(self.columns)}) "
+            f"VALUES ({', '.join('?' for _ in self.columns)})", values)
+        return cursor.lastrowid
+
+    def contains(self, key) -> bool:
+        return self._row_id(key) is not None
+
+    def get(self, key) -> dict:
+        rows = self.conn.execute(
+            f"{self._select()} WHERE {self.key} = ? ORDER BY id LIMIT 1", (key,)).fetchall()
+        documents = self._documents(rows)
+        return documents[0] if documents else None
+
+    def get_many(self, keys:list) -> dict:
+        """Returns {key: document} for every key in `keys` that exists, using one query per 500 keys
+        """
+        documents = {}
+        keys = list(dict.fromkeys(keys))
+        for start in range(0, len(keys), SQLITE_BATCH_SIZE):
+            chunk = keys[start:start + SQLITE_BATCH_SIZE]
+            rows = self.conn.execute(
+                f"{self._select()} WHERE {self.key} IN ({', '.join('?' for _ in chunk)}) ORDER BY id",
+                chunk).fetchall()
+            for document in self._documents(rows):
+                documents.setdefault(document[self.key], document)
+        return documents
+
+    def get_rows(self, keys:list) -> list:
+        """Returns (id, document) for every row under one of `keys`, legacy duplicates included, in id order
+        """
+        results = []
+        keys = list(dict.fromkeys(keys))
+        for start in range(0, len(keys), SQLITE_BATCH_SIZE):
+            chunk = keys[start:start + SQLITE_BATCH_SIZE]
+            rows = self.conn.execute(
+                f"{self._select()} WHERE {self.key} IN ({', '.join('?' for _ in chunk)}) ORDER BY id",
+                chunk).fetchall()
+            results.extend((row[0], document) for row, document in zip(rows, self._documents(rows)))
+        results.sort(key=lambda row: row[0])
+        return results
+
+    def all(self) -> list:
+        return self._documents(self.conn.execute(f"{self._select()} ORDER BY id").fetchall())
+
+    def page(self, after:int=None, limit:int=None, filters:list=(), fields:list=None) -> list:
+        """Returns up to `limit` (id, document) pairs with ids above `after` that match `filters`
+        """
+        clauses, params = ["id > ?"], [after or 0]
+        for field, operator, value in filters:
+            if field not in self.columns:
+                raise ValueError(f"cannot filter {self.sql_name} on {field!r}")
+            clauses.append(f"{field} {SQL_OPERATORS[operator]} ?")
+            params.append(value)
+        sql = f"{self._select(fields)} WHERE {' AND '.join(clauses)} ORDER BY id"
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(limit)
+        rows = self.conn.execute(sql, params).fetchall()
+        return [(row[0], document) for row, document in zip(rows, self._documents(rows, fields))]
+
+    def insert(self, document:dict) -> int:
+        if self.contains(document[self.key]):
+            raise DuplicateKeyError(document[self.key])
+        row_id = self._insert_row(document)
+        if self.journal is not None:
+            # a row removed earlier in the transaction may have freed this id
+            self.journal.setdefault(row_id, None)
+        return row_id
+
+    def update(self, key, fields:dict) -> bool:
+        row_id = self._row_id(key)
+        if row_id is None:
+            return False
+        new_key = fields.get(self.key, key)
+        if new_key != key and self.contains(new_key):
+            raise DuplicateKeyError(new_key)
+        self._record([row_id])
+        columns = [column for column in self.columns if column in fields]
+        if columns:
+            self.conn.execute(
+                f"UPDATE {self.sql_name} SET {', '.join(f'{column} = ?' for column in columns)} WHERE id = ?",
+                [fields[column] for column in columns] + [row_id])
+        return True
+
+    def remove(self, key) -> bool:
+        """Removes every row stored under `key`, legacy duplicates included
+        """
+        if self.journal is not None:
+            self._record([row[0] for row in self.conn.execute(
+                f"SELECT id FROM {self.sql_name} WHERE {self.key} = ?", (key,))])
+        cursor = self.conn.execute(f"DELETE FROM {self.sql_name} WHERE {self.key} = ?", (key,))
+        return cursor.rowcount > 0
+
+
+class SQLiteUsersTable(SQLiteTable):
+    """Users table whose `wishlist` field is stored in the normalized `wishlist` join table
+    """
+    def __init__(self, conn:sqlite3.Connection):
+        super().__init__(conn, 'users', key='email', columns=('first_name', 'last_name', 'email', 'password'))
+
+    def _documents(self, rows:list, fields:list=None) -> list:
+        documents = super()._documents(rows, fields)
+        if not rows or (fields is not None and 'wishlist' not in fields):
+            return documents
+        wishlists = {row[0]: {} for row in rows}
+        entries = self.conn.execute(
+            "SELECT user_id, isbn, title FROM wishlist WHERE user_id BETWEEN ? AND ? ORDER BY rowid",
+            (min(wishlists), max(wishlists)))
+        for user_id, isbn, title in entries:
+            if user_id in wishlists:
+                wishlists[user_id][isbn] = title
+        for row, document in zip(rows, documents):
+            document['wishlist'] = wishlists[row[0]]
+        return documents
+
+    def _write_wishlist(self, row_id:int, wishlist:dict) -> None:
+        self.conn.execute("DELETE FROM wishlist WHERE user_id = ?", (row_id,))
+        self.conn.executemany(
+            "INSERT INTO wishlist (user_id, isbn, title) VALUES (?, ?, ?)",
+            [(row_id, isbn, title) for isbn, title in dict(wishlist or {}).items()])
+
+    def _insert_row(self, document:dict) -> int:
+        row_id = super()._insert_row(document)
+        self._write_wishlist(row_id, document.get('wishlist'))
+        return row_id
+
+    def update(self, key, fields:dict) -> bool:
+        if not super().update(key, fields):
+            return False
+        if 'wishlist' in fields:
+            self._write_wishlist(self._row_id(fields.get(self.key, key)), fields['wishlist'])
+        return True
+
+
+class SQLiteBackend(StorageBackend):
+    """Stdlib `sqlite3` database in WAL mode
+
+    One connection is shared by the process; db.py serializes access to it.
+    In MULTIPROCESS environments each unit of work also journals the rows it
+    touches, for `changes`.
+    """
+    def __init__(self, path:str, **options):
+        super().__init__(path, **options)
+        self._track = bool(options.get('MULTIPROCESS'))
+        self.conn = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode = WAL")
+        self.conn.execute("PRAGMA synchronous = NORMAL")
+        self.conn.execute("PRAGMA foreign_keys = ON")
+        self.conn.executescript(SQLITE_SCHEMA)
+        self._tables = {
+            USERS_TABLE: SQLiteUsersTable(self.conn),
+            BOOKS_TABLE: SQLiteTable(self.conn, 'books', key='isbn',
+                                     columns=('title', 'author', 'isbn', 'publication_date'))
+        }
+
+    @classmethod
+    def destroy(cls, path:str) -> None:
+        for suffix in ('', '-wal', '-shm'):
+            super().destroy(path + suffix)
+
+    def table(self, name:str) -> SQLiteTable:
+        return self._tables[name]
+
+    def load(self, data:dict) -> None:
+        self.begin()
+        try:
+            for name, documents in data.items():
+                for document in documents:
+                    self._tables[name]._insert_row(document)
+        except BaseException:
+            self.rollback()
+            raise
+        self.commit()
+
+    def begin(self) -> None:
+        self.conn.execute("BEGIN IMMEDIATE")
+        if self._track:
+            for table in self._tables.values():
+                table.journal = {}
+
+    def commit(self) -> None:
+        self.conn.execute("COMMIT")
+        for table in self._tables.values():
+            table.journal = None
+
+    def rollback(self) -> None:
+        self.conn.execute("ROLLBACK")
+        for table in self._tables.values():
+            table.journal = None
+
+    def changes(self) -> list:
+        if not self._track:
+            return None
+        return [[name, row_id, before, after]
+                for name, table in self._tables.items() for row_id, before, after in table.changes()]
+
+    def apply(self, changes:list) -> None:
+        # every process reads the same database file, so the rows are up to date already
+        pass
+
+    def close(self) -> None:
+        self.conn.close()
+
+
+# REGISTRY
+BACKENDS = {
+    'tinydb': TinyDBBackend,
+    'snapshot': SnapshotBackend,
+    'compact': CompactBackend,
+    'sqlite': SQLiteBackend,
+    'wal': WALBackend
+}
+
+def get_backend_class(env:str=None) -> type:
+    """Returns the backend class configured for `env` in config.ENVIRONMENTS
+    """
+    env_config = config.ENVIRONMENTS[env or config.ENV]
+    return BACKENDS[env_config.get('BACKEND', DEFAULT_BACKEND)]
+
+def open_backend(env:str=None) -> StorageBackend:
+    """Opens the backend configured for `env` in config.ENVIRONMENTS
+    """
+    env_config = config.ENVIRONMENTS[env or config.ENV]
+    options = {name: value for name, value in env_config.items() if name not in ('DATABASE', 'BACKEND')}
+    return get_backend_class(env)(env_config['DATABASE'], **options)
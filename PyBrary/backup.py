@@ -0,0 +1,199 @@
+# STANDARD LIBRARY
+import argparse
+import hashlib
+import json
+import os
+import time
+import uuid
+import zlib
+
+# LOCAL MODULES
+from PyBrary import config
+from PyBrary.cache import MISSING, LRUCache
+
+
+# GLOBAL
+# Store layout:
+#   <path>/chunks/<first 2 hex digits>/<sha256>   zlib compressed chunk
+#   <path>/backups/<backup id>.json              manifest
+# A chunk is the JSON list of [doc_id, document] pairs of one table whose
+# doc_ids fall in the same BACKUP_CHUNK_SIZE wide range, named by the hash of
+# that JSON. Doc ids only grow, so between two backups only the chunks holding
+# changed documents (and the last chunk, for inserts) get new contents; every
+# other chunk hashes the same and is stored once for all backups.
+CHUNKS_DIRECTORY = 'chunks'
+MANIFESTS_DIRECTORY = 'backups'
+
+
+# EXCEPTIONS
+class BackupNotFound(Exception):
+    """Raised for a backup id with no manifest in the store
+    """
+
+
+# UTILITY FUNCTIONS
+def encode_chunk(records:list) -> bytes:
+    return json.dumps(records, sort_keys=True, separators=(',', ':')).encode()
+
+def split_chunks(documents:dict, chunk_size:int) -> dict:
+    """Groups {doc_id: document} into {chunk number: [[doc_id, document], ...]} by doc_id range
+    """
+    chunks = {}
+    for doc_id in sorted(documents, key=int):
+        chunks.setdefault(int(doc_id) // chunk_size, []).append([int(doc_id), documents[doc_id]])
+    return chunks
+
+def write_file(path:str, data:bytes) -> None:
+    """Atomically writes `data` to `path`
+    """
+    temp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    with open(temp_path, 'wb') as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp_path, path)
+
+
+# STORE
+class BackupStore:
+    """Directory of incremental backups sharing content-hashed chunks
+
+    Chunks are immutable once written, so decoded chunk contents are cached
+    (up to BACKUP_CACHE_SIZE of them) and restoring the same backup again
+    reads nothing from disk.
+    """
+    def __init__(self, path:str=None, chunk_size:int=None, cache_size:int=None):
+        self.path = path or config.BACKUP_STORE
+        self.chunk_size = chunk_size or config.BACKUP_CHUNK_SIZE
+        self._chunks = LRUCache(config.BACKUP_CACHE_SIZE if cache_size is None else cache_size)
+        os.makedirs(os.path.join(self.path, CHUNKS_DIRECTORY), exist_ok=True)
+        os.makedirs(os.path.join(self.path, MANIFESTS_DIRECTORY), exist_ok=True)
+
+    def _chunk_path(self, digest:str) -> str:
+        return os.path.join(self.path, CHUNKS_DIRECTORY, digest[:2], digest)
+
+    def _manifest_path(self, backup_id:str) -> str:
+        return os.path.join(self.path, MANIFESTS_DIRECTORY, f"{backup_id}.json")
+
+    def _write_chunk(self, records:list) -> tuple:
+        """Stores one chunk unless an identical one is stored already; returns (digest, written)
+        """
+        data = encode_chunk(records)
+        digest = hashlib.sha256(data).hexdigest()
+        path = self._chunk_path(digest)
+        if os.path.exists(path):
+            return digest, False
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        write_file(path, zlib.compress(data))
+        self._chunks.put(digest, data)
+        return digest, True
+
+    def _read_chunk(self, digest:str) -> list:
+        data = self._chunks.get(digest)
+        if data is MISSING:
+            with open(self._chunk_path(digest), 'rb') as f:
+                data = zlib.decompress(f.read())
+            if hashlib.sha256(data).hexdigest() != digest:
+                raise ValueError(f"chunk {digest} is corrupt")
+            self._chunks.put(digest, data)
+        # decoded on every read so callers get documents of their own
+        return json.loads(data)
+
+    def save(self, tables:dict, environment:str=None) -> dict:
+        """Stores {table_name: {doc_id: document}} as a new backup and returns its manifest
+
+        The manifest's 'written' counts the chunks this backup had to add;
+        the others were already in the store.
+        """
+        manifest = {
+            'id': f"{time.strftime('%Y%m%dT%H%M%S')}-{uuid.uuid4().hex[:8]}",
+            'created': time.time(),
+            'environment': environment,
+            'chunk_size': self.chunk_size,
+            'tables': {},
+            'records': 0,
+            'chunks': 0,
+            'written': 0
+        }
+        for table_name, documents in tables.items():
+            entries = manifest['tables'][table_name] = []
+            for number, records in sorted(split_chunks(documents, self.chunk_size).items()):
+                digest, written = self._write_chunk(records)
+                entries.append({'chunk': number, 'hash': digest, 'records': len(records)})
+                manifest['records'] += len(records)
+                manifest['chunks'] += 1
+                manifest['written'] += written
+        write_file(self._manifest_path(manifest['id']), json.dumps(manifest, indent=2).encode())
+        return manifest
+
+    def manifest(self, backup_id:str) -> dict:
+        try:
+            with open(self._manifest_path(backup_id)) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            raise BackupNotFound(backup_id) from None
+
+    def read(self, backup_id:str) -> dict:
+        """Returns {table_name: [document, ...]} of a backup, documents in doc_id order
+        """
+        return {table_name: [document for entry in entries for _, document in self._read_chunk(entry['hash'])]
+                for table_name, entries in self.manifest(backup_id)['tables'].items()}
+
+    def list(self) -> list:
+        """Returns the manifests of every backup, oldest first
+        """
+        manifests = []
+        for name in os.listdir(os.path.join(self.path, MANIFESTS_DIRECTORY)):
+            if name.endswith('.json'):
+                manifests.append(self.manifest(name[:-len('.json')]))
+        return sorted(manifests, key=lambda manifest: (manifest['created'], manifest['id']))
+
+    def delete(self, backup_id:str) -> None:
+        """Removes a backup's manifest; its chunks stay until `collect_garbage`
+        """
+        try:
+            os.remove(self._manifest_path(backup_id))
+        except FileNotFoundError:
+            raise BackupNotFound(backup_id) from None
+
+    def collect_garbage(self) -> int:
+        """Removes the chunks no backup refers to and returns how many were removed
+        """
+        referenced = {entry['hash'] for manifest in self.list()
+                      for entries in manifest['tables'].values() for entry in entries}
+        removed = 0
+        chunks_path = os.path.join(self.path, CHUNKS_DIRECTORY)
+        for directory in os.listdir(chunks_path):
+            for digest in os.listdir(os.path.join(chunks_path, directory)):
+                if digest not in referenced and not digest.endswith('.tmp'):
+                    os.remove(os.path.join(chunks_path, directory, digest))
+                    self._chunks.invalidate(digest)
+                    removed += 1
+        return removed
+
+
+if __name__ == '__main__':
+    from PyBrary import backup_database, restore_database
+    parser = argparse.ArgumentParser(description="Back up and restore environment databases")
+    parser.add_argument('--store', default=config.BACKUP_STORE)
+    commands = parser.add_subparsers(dest='command', required=True)
+    commands.add_parser('list')
+    command = commands.add_parser('backup')
+    command.add_argument('env', choices=config.ENVIRONMENTS)
+    command = commands.add_parser('restore')
+    command.add_argument('backup_id')
+    command.add_argument('env', choices=config.ENVIRONMENTS)
+    command = commands.add_parser('delete')
+    command.add_argument('backup_id')
+    arguments = parser.parse_args()
+    store = BackupStore(arguments.store)
+    if arguments.command == 'list':
+        for manifest in store.list():
+            print(manifest['id'], manifest['environment'], manifest['records'], 'records')
+    elif arguments.command == 'backup':
+        print(backup_database(arguments.env, store)['id'])
+    elif arguments.command == 'restore':
+        restore_database(arguments.backup_id, arguments.env, store)
+    else:
+        store.delete(arguments.backup_id)
+        print(store.collect_garbage(), 'chunks removed')
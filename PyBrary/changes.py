@@ -0,0 +1,110 @@
+# STANDARD LIBRARY
+import collections
+import threading
+
+
+# EXCEPTIONS
+class ChangesExpired(LookupError):
+    """Raised when a cursor points before the retained changes or into an earlier epoch
+
+    The consumer has missed changes and must resynchronize from a full export.
+    """
+
+
+# UTILITY FUNCTIONS
+def diff_fields(before:dict, after:dict) -> list:
+    """Returns the sorted top-level fields that differ between two versions of a document
+    """
+    before, after = before or {}, after or {}
+    return sorted(field for field in set(before) | set(after) if before.get(field) != after.get(field))
+
+
+# CHANGE LOG
+class ChangeLog:
+    """Bounded, sequenced log of committed changes that consumers can follow from a cursor
+
+    Every change gets a sequence number, exposed as "<epoch>.<n>" like the
+    versions in db.py. A new epoch (after the database is reopened or reloaded)
+    empties the log, so cursors from an earlier epoch raise ChangesExpired, as
+    do cursors older than the last `max_size` changes.
+    """
+    def __init__(self, max_size:int, epoch:str=''):
+        self._changes = collections.deque(maxlen=max_size)
+        self._condition = threading.Condition()
+        self.epoch = epoch
+        self._last = 0
+        self._listeners = set()
+
+    def subscribe(self, listener) -> None:
+        """Calls `listener()` after every append or reset, e.g. to wake an asyncio waiter
+        """
+        with self._condition:
+            self._listeners.add(listener)
+
+    def unsubscribe(self, listener) -> None:
+        with self._condition:
+            self._listeners.discard(listener)
+
+    def _notify(self) -> None:
+        self._condition.notify_all()
+        for listener in list(self._listeners):
+            listener()
+
+    def reset(self, epoch:str) -> None:
+        with self._condition:
+            self._changes.clear()
+            self.epoch = epoch
+            self._last = 0
+            self._notify()
+
+    def append(self, changes:list) -> None:
+        """Publishes `changes` (dicts), stamping each with its SEQ cursor, and wakes waiting readers
+        """
+        if not changes:
+            return
+        with self._condition:
+            for change in changes:
+                self._last += 1
+                self._changes.append(dict(change, SEQ=f"{self.epoch}.{self._last}"))
+            self._notify()
+
+    def head(self) -> str:
+        """Returns the cursor of the latest change, for reading only the changes that follow it
+        """
+        with self._condition:
+            return f"{self.epoch}.{self._last}"
+
+    def _position(self, cursor:str) -> int:
+        if cursor is None:
+            return self._last - len(self._changes)
+        epoch, _, position = cursor.rpartition('.')
+        if not position.isdigit():
+            raise ValueError(f"malformed change cursor {cursor!r}")
+        if epoch != self.epoch:
+            raise ChangesExpired(cursor)
+        position = int(position)
+        if position > self._last:
+            raise ValueError(f"change cursor {cursor!r} is ahead of the log")
+        if position < self._last - len(self._changes):
+            raise ChangesExpired(cursor)
+        return position
+
+    def read(self, after:str=None, limit:int=None, timeout:float=0) -> tuple:
+        """Returns (changes after cursor `after`, next cursor), waiting up to `timeout` seconds for one
+
+        Without a cursor reading starts at the oldest retained change. Raises
+        ValueError for a malformed cursor and ChangesExpired if changes after
+        it are no longer retained.
+        """
+        with self._condition:
+            epoch = self.epoch
+            position = self._position(after)
+            if timeout:
+                self._condition.wait_for(lambda: self._last > position or self.epoch != epoch, timeout)
+                if self.epoch != epoch:
+                    raise ChangesExpired(after)
+            start = position - (self._last - len(self._changes))
+            stop = len(self._changes) if limit is None else min(len(self._changes), start + limit)
+            changes = [self._changes[i] for i in range(start, stop)]
+            next_cursor = changes[-1]['SEQ'] if changes else f"{self.epoch}.{position}"
+            return changes, next_cursor
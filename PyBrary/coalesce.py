@@ -0,0 +1,163 @@
+# STANDARD LIBRARY
+import collections
+import math
+import threading
+import time
+
+
+# EXCEPTIONS
+class QueueFull(Exception):
+    """Raised when a WriteQueue already holds its maximum number of writes
+
+    `retry_after` is how many seconds the queue expects to need to drain.
+    """
+    def __init__(self, retry_after:int):
+        super().__init__(f"write queue full, retry after {retry_after}s")
+        self.retry_after = retry_after
+
+
+# SINGLE FLIGHT
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Runs one call per key at a time; callers arriving while it runs wait for and share its result
+
+    Followers get `share(result)`, e.g. a copy, instead of the leader's
+    object. `forget` detaches a running call from its key so callers
+    arriving afterwards start a fresh one, for when the data it is reading
+    has just changed.
+    """
+    def __init__(self, share=None):
+        self.share = share or (lambda result: result)
+        self.shared = 0
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._calls)
+
+    def do(self, key, func):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+            else:
+                self.shared += 1
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return self.share(call.result)
+        try:
+            call.result = func()
+        except BaseException as error:
+            call.error = error
+            raise
+        finally:
+            with self._lock:
+                if self._calls.get(key) is call:
+                    del self._calls[key]
+            call.done.set()
+        return call.result
+
+    def forget(self, key) -> None:
+        with self._lock:
+            self._calls.pop(key, None)
+
+
+# WRITE QUEUE
+class _Write:
+    def __init__(self, func, args:tuple, kwargs:dict):
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+        self.done = False
+        self.result = None
+        self.error = None
+
+
+class WriteQueue:
+    """Bounded queue of writes committed together, up to `max_batch` at a time
+
+    `commit` takes a list of (func, args, kwargs) and returns their results
+    in order, applying them as one unit. There is no background thread: the
+    first waiting caller commits the queued writes, its own included, while
+    the others wait for their results (as with the WAL's group commit). If a
+    batch fails its writes are committed one by one, so a bad write only
+    fails its own caller.
+
+    Once `max_depth` writes are waiting, `submit` raises QueueFull with a
+    Retry-After estimate from the recent commit times.
+    """
+    def __init__(self, commit, max_depth:int, max_batch:int):
+        self.commit = commit
+        self.max_depth = max_depth
+        self.max_batch = max_batch
+        self.batches = 0
+        self.rejected = 0
+        self._batch_seconds = 0.0
+        self._pending = collections.deque()
+        self._committing = False
+        self._condition = threading.Condition()
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    def retry_after(self) -> int:
+        """Seconds until the queued writes are expected to be committed, at least 1
+        """
+        batches = math.ceil((len(self._pending) + 1) / self.max_batch)
+        return max(1, math.ceil(batches * self._batch_seconds))
+
+    def submit(self, func, *args, **kwargs):
+        """Queues `func(*args, **kwargs)` and returns its result once committed
+        """
+        write = _Write(func, args, kwargs)
+        with self._condition:
+            if len(self._pending) >= self.max_depth:
+                self.rejected += 1
+                raise QueueFull(self.retry_after())
+            self._pending.append(write)
+        while True:
+            with self._condition:
+                while not write.done and self._committing:
+                    self._condition.wait()
+                if write.done:
+                    break
+                self._committing = True
+                batch = [self._pending.popleft() for _ in range(min(self.max_batch, len(self._pending)))]
+            try:
+                self._commit(batch)
+            finally:
+                with self._condition:
+                    self._committing = False
+                    self._condition.notify_all()
+        if write.error is not None:
+            raise write.error
+        return write.result
+
+    def _commit(self, batch:list) -> None:
+        started = time.perf_counter()
+        try:
+            results = self.commit([(write.func, write.args, write.kwargs) for write in batch])
+        except Exception as error:
+            if len(batch) == 1:
+                batch[0].error = error
+            else:
+                for write in batch:
+                    self._commit([write])
+        else:
+            for write, result in zip(batch, results):
+                write.result = result
+        finally:
+            for write in batch:
+                write.done = True
+            # smoothed, so one slow commit doesn't dominate the estimate
+            self._batch_seconds = 0.8 * self._batch_seconds + 0.2 * (time.perf_counter() - started)
+            self.batches += 1
@@ -0,0 +1,260 @@
+# STANDARD LIBRARY
+import array
+import functools
+from collections.abc import MutableMapping
+from typing import Iterator
+
+# 3RD PARTY MODULES
+from tinydb.storages import JSONStorage
+
+
+# STRING POOL
+class StringPool:
+    """Interns strings as small integer ids, shared by every column of a storage
+
+    Strings stay in the pool once added, so a value that comes back (a title
+    re-added, a name reused) keeps its id.
+    """
+    def __init__(self):
+        self._strings = []
+        self._ids = {}
+
+    def __len__(self) -> int:
+        return len(self._strings)
+
+    def __getitem__(self, string_id:int) -> str:
+        return self._strings[string_id]
+
+    def intern(self, string:str) -> int:
+        string_id = self._ids.get(string)
+        if string_id is None:
+            string_id = self._ids[string] = len(self._strings)
+            self._strings.append(string)
+        return string_id
+
+
+# COLUMNS
+# One value per row. `fits` tells whether a value can be held by the column;
+# documents with a value that doesn't fit are kept as plain dicts instead.
+class InternedColumn:
+    """Strings that repeat across rows (names, authors, titles), stored as 4-byte pool ids
+    """
+    EMPTY = ''
+
+    def __init__(self, pool:StringPool):
+        self.pool = pool
+        self._ids = array.array('I')
+
+    def fits(self, value) -> bool:
+        return isinstance(value, str)
+
+    def append(self, value:str) -> None:
+        self._ids.append(self.pool.intern(value))
+
+    def __getitem__(self, row:int) -> str:
+        return self.pool[self._ids[row]]
+
+    def __setitem__(self, row:int, value:str) -> None:
+        self._ids[row] = self.pool.intern(value)
+
+
+class TextColumn:
+    """Strings unique to their row (emails, passwords), stored as they are
+    """
+    EMPTY = ''
+
+    def __init__(self, pool:StringPool):
+        self._values = []
+
+    def fits(self, value) -> bool:
+        return isinstance(value, str)
+
+    def append(self, value:str) -> None:
+        self._values.append(value)
+
+    def __getitem__(self, row:int) -> str:
+        return self._values[row]
+
+    def __setitem__(self, row:int, value:str) -> None:
+        self._values[row] = value
+
+
+class PackedColumn:
+    """Short ASCII strings (ISBNs, dates) packed into one buffer of `width` bytes per row, NUL padded
+    """
+    EMPTY = ''
+
+    def __init__(self, pool:StringPool, width:int):
+        self.width = width
+        self._buffer = bytearray()
+
+    def fits(self, value) -> bool:
+        return (isinstance(value, str) and len(value) <= self.width
+                and value.isascii() and '\0' not in value)
+
+    def append(self, value:str) -> None:
+        self._buffer += value.encode('ascii').ljust(self.width, b'\0')
+
+    def __getitem__(self, row:int) -> str:
+        start = row * self.width
+        return self._buffer[start:start + self.width].rstrip(b'\0').decode('ascii')
+
+    def __setitem__(self, row:int, value:str) -> None:
+        start = row * self.width
+        self._buffer[start:start + self.width] = value.encode('ascii').ljust(self.width, b'\0')
+
+
+class InternedMapColumn:
+    """{string: string} mappings (wishlists), stored as packed pairs of pool ids
+    """
+    EMPTY = {}
+
+    def __init__(self, pool:StringPool):
+        self.pool = pool
+        self._pairs = []
+
+    def fits(self, value) -> bool:
+        return isinstance(value, dict) and all(
+            isinstance(key, str) and isinstance(item, str) for key, item in value.items())
+
+    def _pack(self, mapping:dict) -> bytes:
+        intern = self.pool.intern
+        return array.array('I', [string_id for key, item in mapping.items()
+                                 for string_id in (intern(key), intern(item))]).tobytes()
+
+    def append(self, value:dict) -> None:
+        self._pairs.append(self._pack(value))
+
+    def __getitem__(self, row:int) -> dict:
+        ids = array.array('I')
+        ids.frombytes(self._pairs[row])
+        pool = self.pool
+        return {pool[ids[i]]: pool[ids[i + 1]] for i in range(0, len(ids), 2)}
+
+    def __setitem__(self, row:int, value:dict) -> None:
+        self._pairs[row] = self._pack(value)
+
+
+def packed(width:int):
+    """Returns a factory for PackedColumns `width` bytes wide, for use in a schema
+    """
+    return functools.partial(PackedColumn, width=width)
+
+
+# DOCUMENTS
+class CompactDocuments(MutableMapping):
+    """{doc_id: document} mapping that holds documents column by column instead of as dicts
+
+    `schema` maps each field to the column factory holding it, in field
+    order. A document with exactly those fields, in that order, and values
+    every column can hold is stored as one row across the columns; anything
+    else is kept as the dict itself. Reading a row builds a new dict, so
+    changing a document means assigning it back. Rows freed by deletes are
+    reused; iteration order is insertion order, like the dict TinyDB would
+    otherwise hold.
+    """
+    def __init__(self, schema:dict, pool:StringPool, documents:dict=None):
+        self._fields = tuple(schema)
+        self._columns = tuple(factory(pool) for factory in schema.values())
+        self._entries = {}
+        self._free = []
+        self._size = 0
+        if documents:
+            self.update(documents)
+
+    def _fits(self, document) -> bool:
+        return (isinstance(document, dict) and tuple(document) == self._fields
+                and all(column.fits(value) for column, value in zip(self._columns, document.values())))
+
+    def _release(self, row:int) -> None:
+        for column in self._columns:
+            column[row] = column.EMPTY
+        self._free.append(row)
+
+    def __getitem__(self, doc_id:str) -> dict:
+        entry = self._entries[doc_id]
+        if not isinstance(entry, int):
+            return entry
+        return {field: column[entry] for field, column in zip(self._fields, self._columns)}
+
+    def __setitem__(self, doc_id:str, document:dict) -> None:
+        entry = self._entries.get(doc_id)
+        if not self._fits(document):
+            if isinstance(entry, int):
+                self._release(entry)
+            self._entries[doc_id] = document
+            return
+        if isinstance(entry, int):
+            row = entry
+        elif self._free:
+            row = self._free.pop()
+        else:
+            row = self._size
+            self._size += 1
+            for column, value in zip(self._columns, document.values()):
+                column.append(value)
+            self._entries[doc_id] = row
+            return
+        for column, value in zip(self._columns, document.values()):
+            column[row] = value
+        self._entries[doc_id] = row
+
+    def __delitem__(self, doc_id:str) -> None:
+        entry = self._entries.pop(doc_id)
+        if isinstance(entry, int):
+            self._release(entry)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._entries)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, doc_id) -> bool:
+        return doc_id in self._entries
+
+    def compacted(self) -> int:
+        """Returns how many documents are held in columns rather than as dicts
+        """
+        return sum(isinstance(entry, int) for entry in self._entries.values())
+
+    def field_items(self, field:str) -> Iterator[tuple]:
+        """Yields (doc_id, document[field]), reading the field's column without building documents
+        """
+        if field not in self._fields:
+            for doc_id, entry in self._entries.items():
+                yield doc_id, self[doc_id][field]
+            return
+        column = self._columns[self._fields.index(field)]
+        for doc_id, entry in self._entries.items():
+            yield doc_id, column[entry] if isinstance(entry, int) else entry[field]
+
+
+# STORAGE
+class CompactStorage(JSONStorage):
+    """TinyDB JSON file storage whose tables are held as CompactDocuments once read
+
+    `schemas` maps table names to their CompactDocuments schema; other tables
+    stay plain dicts. All tables share one string pool, so a title stored
+    in both a book and a wishlist is held once. Meant to sit under
+    `CachingMiddleware`, which keeps the tables returned by `read`. The file
+    itself is still parsed to and encoded from plain dicts, so reads and
+    flushes briefly hold the dict form as well.
+    """
+    def __init__(self, path:str, schemas:dict=None, **kwargs):
+        super().__init__(path, **kwargs)
+        self.schemas = schemas or {}
+        self.pool = StringPool()
+
+    def read(self) -> dict:
+        data = super().read()
+        if data is None:
+            return None
+        for table_name, schema in self.schemas.items():
+            if table_name in data:
+                data[table_name] = CompactDocuments(schema, self.pool, data[table_name])
+        return data
+
+    def write(self, data:dict) -> None:
+        super().write({table_name: dict(documents.items()) if isinstance(documents, CompactDocuments) else documents
+                       for table_name, documents in data.items()})
@@ -1,11 +1,65 @@
+# STANDARD LIBRARY
+import os
+
 # ENVIRONMENT
-ENV = "TEST"
+# How durable a committed transaction is depends on the backend:
+#   tinydb, snapshot, compact  the file is rewritten (and fsynced) every WRITE_CACHE_SIZE
+#       commits, TinyDB's default of 1000 when unset, and on close; a crash loses the
+#       commits made since. EXAMPLE, BENCHMARK and BENCHMARK_COMPACT trade durability for
+#       speed this way. MULTIPROCESS environments write the file on every commit.
+#   wal      every commit is fsynced before the transaction returns, unless WAL_SYNC is False
+#   sqlite   WAL journal with synchronous=NORMAL: commits survive a process crash, but the
+#       last ones can be lost on power failure
+ENV = os.environ.get("PYBRARY_ENV", "TEST")
 ENVIRONMENTS = {
     "TEST": {
-        "DATABASE": "data/test_db.json"
+        "DATABASE": "data/test_db.json",
+        "BACKEND": "tinydb",
+        "WRITE_CACHE_SIZE": 1
+    },
+    "TEST_SQLITE": {
+        "DATABASE": "data/test_db.sqlite3",
+        "BACKEND": "sqlite"
+    },
+    "TEST_SNAPSHOT": {
+        "DATABASE": "data/test_db.snapshot",
+        "BACKEND": "snapshot",
+        "WRITE_CACHE_SIZE": 1
+    },
+    "TEST_COMPACT": {
+        "DATABASE": "data/test_compact_db.json",
+        "BACKEND": "compact",
+        "WRITE_CACHE_SIZE": 1
+    },
+    "TEST_WAL": {
+        "DATABASE": "data/test_wal_db.json",
+        "BACKEND": "wal",
+        "WAL_SYNC": False
+    },
+    "TEST_MULTIPROCESS": {
+        "DATABASE": "data/test_mp_db.json",
+        "BACKEND": "tinydb",
+        "MULTIPROCESS": True
+    },
+    "SERVER": {
+        "DATABASE": "data/server_db.json",
+        "BACKEND": "compact",
+        "MULTIPROCESS": True
+    },
+    "BENCHMARK": {
+        "DATABASE": "data/benchmark_db.json",
+        "BACKEND": "tinydb",
+        "WRITE_CACHE_SIZE": 100
+    },
+    "BENCHMARK_COMPACT": {
+        "DATABASE": "data/benchmark_compact_db.json",
+        "BACKEND": "compact",
+        "WRITE_CACHE_SIZE": 100
     },
     "EXAMPLE": {
-        "DATABASE": "data/example_db.json"
+        "DATABASE": "data/example_db.json",
+        "BACKEND": "tinydb",
+        "WRITE_CACHE_SIZE": 100
     }
 }
 EXAMPLE_DATA = "data/example_data.json"
@@ -14,6 +68,74 @@ EXAMPLE_DATA = "data/example_data.json"
 USERS_TABLE_NAME = "USERS"
 BOOKS_TABLE_NAME = "BOOKS"
 
+# CACHING
+CACHE_SIZE = 10000
+CACHE_TTL = 60
+
+# SERIALIZATION
+# encoded documents kept per table for building responses (see serialize.py)
+FRAGMENT_CACHE_SIZE = 10000
+
+# PAGINATION
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+EXPORT_BATCH_SIZE = 500
+
+# CHANGE FEED
+CHANGE_LOG_SIZE = 10000
+# longest a change feed request may wait for a change, in seconds
+MAX_CHANGE_WAIT = 30
+# seconds between keepalive comments on an idle event stream
+SSE_KEEPALIVE = 15
+
+# BATCH GET
+MAX_BATCH_SIZE = 1000
+
+# WISHLIST RECONCILIATION
+# seconds between background runs repairing stale wishlist titles
+RECONCILE_INTERVAL = 5
+RECONCILE_BATCH_SIZE = 500
+
+# SEARCH
+DEFAULT_SEARCH_LIMIT = 20
+# query terms shorter than this only match whole words, not every word they start
+SEARCH_MIN_PREFIX = 2
+
+# BULK IMPORT
+BULK_BATCH_SIZE = 1000
+
+# METRICS
+# histogram bucket upper bounds, in seconds
+METRICS_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+# db operations and requests slower than this many seconds are logged; None disables the log
+SLOW_OPERATION_THRESHOLD = None
+
+# ASYNC
+# threads running blocking storage calls for the ASGI app (see aio.py)
+ASYNC_WORKERS = 4
+
+# MULTI-PROCESS
+# times a write is retried after losing a commit race to another process
+MAX_CONFLICT_RETRIES = 10
+# size past which the journal processes catch up from is started afresh; a process
+# that falls further behind reloads the whole database instead
+MULTIPROCESS_JOURNAL_BYTES = 4 * 1024 * 1024
+
+# ADMISSION CONTROL
+# wishlist writes waiting to commit before new ones get 429 Too Many Requests
+WRITE_QUEUE_DEPTH = 1000
+# queued writes committed per transaction
+WRITE_BATCH_SIZE = 100
+
+# BACKUPS
+# directory of the backup store (see backup.py)
+BACKUP_STORE = "data/backups"
+# documents per chunk, by doc_id range; a chunk is stored again whenever any of its documents changes
+BACKUP_CHUNK_SIZE = 512
+# decoded chunks kept in memory for repeated restores
+BACKUP_CACHE_SIZE = 256
+
 # TESTING
+TEST_ENVIRONMENTS = ["TEST", "TEST_SQLITE", "TEST_SNAPSHOT", "TEST_COMPACT", "TEST_WAL", "TEST_MULTIPROCESS"]
 TEST_USERS_FILE = "data/test_users.json"
 TEST_BOOKS_FILE = "data/test_books.json"
\ No newline at end of file
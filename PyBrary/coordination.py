@@ -0,0 +1,150 @@
+# STANDARD LIBRARY
+import contextlib
+import json
+import os
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - not available on Windows
+    fcntl = None
+
+# LOCAL MODULES
+from PyBrary import config
+
+
+# EXCEPTIONS
+class WriteConflict(RuntimeError):
+    """Raised when another process committed while a transaction was running on stale data
+    """
+
+
+# COORDINATOR
+class ProcessCoordinator:
+    """Coordinates several processes serving the same database file
+
+    Writers commit under an exclusive `flock` on `<path>.lock` and then bump
+    the integer in `<path>.generation`. Each process remembers the generation
+    its in-memory state was loaded at; reads never lock, and a process that
+    finds the generation has moved catches up under a shared lock, which
+    only waits for a commit that is being written at that moment.
+
+    Each commit also appends the documents it changed to `<path>.journal`,
+    one JSON line of [generation, changes] per commit, so other processes
+    can apply just those instead of reloading everything. Once the journal
+    passes `journal_bytes` the next commit starts it afresh; a process that
+    falls further behind than the journal reaches, or a commit published
+    without its changes, means reloading the whole database.
+    """
+    def __init__(self, path:str, journal_bytes:int=None):
+        if fcntl is None:
+            raise RuntimeError("multi-process mode needs fcntl file locking")
+        self.lock_path = path + '.lock'
+        self.generation_path = path + '.generation'
+        self.journal_path = path + '.journal'
+        self.journal_bytes = config.MULTIPROCESS_JOURNAL_BYTES if journal_bytes is None else journal_bytes
+        # where reading the journal left off: (generation of its first line, byte offset)
+        self._journal_position = (None, 0)
+        self.loaded = self.current()
+
+    def current(self) -> int:
+        """Returns the latest published generation, 0 if nothing was published yet
+        """
+        try:
+            with open(self.generation_path) as f:
+                return int(f.read() or 0)
+        except FileNotFoundError:
+            return 0
+
+    def is_stale(self) -> bool:
+        return self.current() != self.loaded
+
+    def mark_loaded(self) -> None:
+        """Records that the in-memory state now reflects the latest generation
+        """
+        self.loaded = self.current()
+
+    def publish(self, changes:list=None) -> None:
+        """Announces a commit to the other processes; call with the exclusive lock held
+
+        `changes` lists the [table_name, doc_id, before, after] documents the
+        commit changed. Without them other processes reload everything.
+        """
+        generation = self.current() + 1
+        line = json.dumps([generation, changes]).encode() + b'\n'
+        try:
+            size = os.path.getsize(self.journal_path)
+        except FileNotFoundError:
+            size = 0
+        if size and size < self.journal_bytes:
+            with open(self.journal_path, 'ab') as f:
+                f.write(line)
+            first, offset = self._journal_position
+            if offset == size and first is not None:
+                # this process had read everything before its own line, so it can skip that too
+                self._journal_position = (first, size + len(line))
+        else:
+            temp_path = self.journal_path + '.tmp'
+            with open(temp_path, 'wb') as f:
+                f.write(line)
+            os.replace(temp_path, self.journal_path)
+            self._journal_position = (generation, len(line))
+        temp_path = self.generation_path + '.tmp'
+        with open(temp_path, 'w') as f:
+            f.write(str(generation))
+        os.replace(temp_path, self.generation_path)
+        self.loaded = generation
+
+    def read_changes(self) -> list:
+        """Returns the changes published since this process loaded, oldest first; call with a lock held
+
+        Returns None if the journal doesn't hold every commit since, and the
+        database has to be reloaded instead.
+        """
+        current = self.current()
+        expected = self.loaded + 1
+        changes = []
+        try:
+            f = open(self.journal_path, 'rb')
+        except FileNotFoundError:
+            return None if current >= expected else changes
+        with f:
+            first_line = f.readline()
+            if not first_line:
+                return None if current >= expected else changes
+            first = json.loads(first_line)[0]
+            known, offset = self._journal_position
+            offset = offset if known == first else 0
+            f.seek(offset)
+            for line in f:
+                generation, entry = json.loads(line)
+                if generation >= expected:
+                    if generation != expected or entry is None:
+                        return None
+                    changes.extend(entry)
+                    expected += 1
+                offset += len(line)
+                if generation >= current:
+                    break
+        if expected != current + 1:
+            return None
+        self._journal_position = (first, offset)
+        return changes
+
+    @contextlib.contextmanager
+    def _locked(self, operation:int):
+        with open(self.lock_path, 'a') as f:
+            fcntl.flock(f.fileno(), operation)
+            try:
+                yield
+            finally:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+    def shared(self):
+        """Holds the lock against writers while reloading the database file
+        """
+        return self._locked(fcntl.LOCK_SH)
+
+    def exclusive(self):
+        """Holds the lock while committing, excluding other writers and reloading readers
+        """
+        return self._locked(fcntl.LOCK_EX)
@@ -1,27 +1,143 @@
 # STANDARD LIBRARY
+import base64
+import binascii
+import contextlib
+import copy
+import functools
+import itertools
 import json
+import logging
+import math
 import os
+import threading
+import time
+import uuid
+from typing import Iterable, Iterator
 
 # 3RD PARTY MODULES
 from flask import Flask
-from tinydb import TinyDB, Query
 
 # LOCAL MODULES
-from PyBrary import config
+from PyBrary import config, metrics, serialize
+from PyBrary.backends import TABLE_KEYS, StorageBackend, open_backend
+from PyBrary.cache import MISSING, LRUCache
+from PyBrary.changes import ChangeLog, ChangesExpired, diff_fields
+from PyBrary.coalesce import QueueFull, SingleFlight, WriteQueue
+from PyBrary.coordination import ProcessCoordinator, WriteConflict
+from PyBrary.index import DuplicateKeyError, GroupIndex, InvertedIndex, KeyedTable, LookupIndex
 
 # SETUP
+logger = logging.getLogger(__name__)
 DATABASE = config.ENVIRONMENTS[config.ENV]['DATABASE']
 EXAMPLE_DATA = config.EXAMPLE_DATA
-USER = Query()
-BOOK = Query()
 USERS_TABLE = config.USERS_TABLE_NAME
 BOOKS_TABLE = config.BOOKS_TABLE_NAME
+DEFAULT_PAGE_SIZE = config.DEFAULT_PAGE_SIZE
+MAX_PAGE_SIZE = config.MAX_PAGE_SIZE
+EXPORT_BATCH_SIZE = config.EXPORT_BATCH_SIZE
+BULK_BATCH_SIZE = config.BULK_BATCH_SIZE
+MAX_CONFLICT_RETRIES = config.MAX_CONFLICT_RETRIES
+DEFAULT_SEARCH_LIMIT = config.DEFAULT_SEARCH_LIMIT
+MAX_CHANGE_WAIT = config.MAX_CHANGE_WAIT
+MAX_BATCH_SIZE = config.MAX_BATCH_SIZE
+RECONCILE_INTERVAL = config.RECONCILE_INTERVAL
+RECONCILE_BATCH_SIZE = config.RECONCILE_BATCH_SIZE
+USER_FIELDS = ('first_name', 'last_name', 'email', 'password', 'wishlist')
+BOOK_FIELDS = ('title', 'author', 'isbn', 'publication_date')
+
+# CONNECTION STATE
+# A single storage backend (see backends.py) is opened per process and shared
+# by every request thread; `_connection_lock` serializes access to it.
+_connection = None
+_connection_lock = threading.RLock()
+_transaction_depth = 0
+_transaction_writes = False
+_pending_changes = []
+# (table_name, key, before, after) of each change in the open transaction, for `rollback`
+_undo_log = []
+
+# MULTI-PROCESS STATE
+# Set when the environment has MULTIPROCESS enabled (see coordination.py).
+# Several worker processes then share the database file: each keeps its own
+# backend, caches and indexes and reloads them when another process commits.
+_environment = None
+_coordinator = None
+
+# VERSIONS
+# Every mutation bumps a counter for its table and for each key it touches.
+# Versions are only comparable within one epoch, which is renewed whenever
+# the backend is (re)opened since the data may have changed underneath.
+_epoch = uuid.uuid4().hex[:8]
+_table_versions = {table_name: 0 for table_name in TABLE_KEYS}
+_record_versions = {table_name: {} for table_name in TABLE_KEYS}
+
+# CHANGE LOG
+# Committed mutations in order, for consumers following the change feed.
+# Changes are buffered per transaction and published when it commits; the log
+# shares the version epoch and is emptied whenever a new epoch starts.
+CHANGES = ChangeLog(config.CHANGE_LOG_SIZE, _epoch)
+
+# CACHES
+# Read-through caches for single-document lookups, keyed like their table.
+# Entries are invalidated by every mutation of that key and dropped wholesale
+# on rollback or when the backend is closed.
+CACHES = {
+    USERS_TABLE: LRUCache(config.CACHE_SIZE, ttl=config.CACHE_TTL),
+    BOOKS_TABLE: LRUCache(config.CACHE_SIZE, ttl=config.CACHE_TTL)
+}
+# Cache misses in flight, keyed like their table: concurrent misses of one key
+# share a single storage read. Mutating a key detaches its flight so lookups
+# arriving after the write read again.
+FLIGHTS = {
+    USERS_TABLE: SingleFlight(share=copy.deepcopy),
+    BOOKS_TABLE: SingleFlight(share=copy.deepcopy)
+}
+
+# SECONDARY INDEXES
+# In-memory indexes over fields other than the key. Each is built from the
+# backend the first time it is used (see `secondary_index`) and maintained by
+# `record_change` from then on, so opening the backend decodes no documents
+# for indexes nothing asks for.
+def normalize_name(name:str) -> str:
+    """Case- and whitespace-insensitive form of a name, used as an index key
+    """
+    return ' '.join(name.split()).casefold()
+
+def book_authors(book:dict) -> list:
+    return [book.get('author')]
+
+def wishlist_isbns(user:dict) -> list:
+    return list(user.get('wishlist') or ())
+
+SECONDARY_INDEXES = {
+    USERS_TABLE: {
+        'wishers': GroupIndex(wishlist_isbns)
+    },
+    BOOKS_TABLE: {
+        'author': GroupIndex(book_authors, normalize=normalize_name),
+        'search': InvertedIndex({'title': 2.0, 'author': 1.0}, min_prefix=config.SEARCH_MIN_PREFIX),
+        'title': LookupIndex('title')
+    }
+}
+# (table_name, index_name) of the SECONDARY_INDEXES built since the backend was opened
+_built_indexes = set()
+
+# TITLE RECONCILIATION
+# Wishlists store {isbn: title}, but reads resolve each title from the books'
+# `title` index, so the stored copy only shows once its book is gone. A book
+# change that retitles a wished-for ISBN marks it stale here, and a background
+# job (see `start_reconciler`) rewrites the stored copies in batches.
+_stale_titles = set()
+_reconciler = None
+_reconciler_stopping = threading.Event()
 
 # RESPONSE DEFINITIONS
 class Response:
     # GENERAL
     SUCCESS = "SUCCESS"
     FAILURE = "FAILURE"
+    INVALID_REQUEST = "INVALID REQUEST"
+    BUSY = "SERVER BUSY"
     # USER
     USER_CREATED = "USER CREATED"
     USER_NONEXISTENT = "USER DOES NOT EXIST"
@@ -36,21 +152,436 @@ class Response:
     BOOK_UPDATED = "BOOK UPDATED"
     # WISHLIST
     WISHLIST_UPDATED = "WISHLIST UPDATED"
+    # AUTHOR
+    AUTHOR_NONEXISTENT = "AUTHOR DOES NOT EXIST"
+    # CHANGES
+    CHANGES_EXPIRED = "CHANGES EXPIRED"
+
+# CONNECTION LIFECYCLE
+def open_database(env:str=None) -> StorageBackend:
+    """Opens the process-wide storage backend configured for `env`, replacing any backend already open
+    """
+    global _connection, _environment, _coordinator
+    env = env or config.ENV
+    with _connection_lock:
+        close_database()
+        _environment = env
+        if config.ENVIRONMENTS[env].get('MULTIPROCESS'):
+            _coordinator = ProcessCoordinator(config.ENVIRONMENTS[env]['DATABASE'])
+            with _coordinator.shared():
+                _coordinator.mark_loaded()
+                _connection = open_backend(env)
+        else:
+            _connection = open_backend(env)
+        if _coordinator is not None and not _connection.MULTIPROCESS_SAFE:
+            close_database()
+            raise ValueError(f"the {config.ENVIRONMENTS[env]['BACKEND']} backend can't be shared between processes")
+        reset_indexes()
+    return _connection
+
+def refresh_database() -> None:
+    """Catches up with commits other processes made since this one last loaded
+
+    Their changes are read from the coordinator's journal and applied to the
+    backend, then recorded like local ones, so only the documents they
+    touched are dropped from the caches and re-indexed and they reach the
+    change log. If the journal can't account for every commit since, e.g.
+    after another process replaced the database, the backend, caches and
+    indexes are reloaded instead. A no-op outside multi-process mode and
+    inside a transaction.
+    """
+    global _connection
+    with _connection_lock:
+        if _coordinator is None or _transaction_depth or not _coordinator.is_stale():
+            return
+        with _coordinator.shared():
+            changes = _coordinator.read_changes()
+            if changes is not None:
+                _connection.apply(changes)
+            else:
+                _connection.close()
+                _connection = open_backend(_environment)
+            _coordinator.mark_loaded()
+        if changes is None:
+            clear_caches()
+            reset_versions()
+            reset_indexes()
+            return
+        for table_name, _, before, after in changes:
+            record_change(table_name, (before or after)[TABLE_KEYS[table_name]], before, after)
+
+def get_connection() -> StorageBackend:
+    """Returns the process-wide storage backend, opening it on first use
+
+    After `close_database` the environment open before is opened again.
+    """
+    with _connection_lock:
+        if _connection is None:
+            return open_database(_environment)
+        return _connection
+
+def flush_database() -> None:
+    """Writes any buffered mutations to disk without closing the backend
+    """
+    with _connection_lock:
+        if _connection is not None:
+            _connection.flush()
+
+def close_database() -> None:
+    """Flushes and closes the process-wide storage backend
+    """
+    global _connection, _coordinator
+    with _connection_lock:
+        if _connection is not None:
+            _connection.close()
+            _connection = None
+        _coordinator = None
+        clear_caches()
+        reset_versions()
+
+def owns_connection() -> bool:
+    """Returns True if the calling thread holds the connection lock, e.g. inside a transaction
+    """
+    return _connection_lock._is_owned()
+
+def get_table(table_name:str) -> KeyedTable:
+    """Returns the keyed table for `table_name` on the shared backend
+    """
+    return get_connection().table(table_name)
+
+
+@contextlib.contextmanager
+def transaction():
+    """Runs the enclosed block as a single unit of work on the shared backend
+
+    The connection lock is held for the whole block, so its reads and writes
+    can't interleave with another thread's. The backend commits the block's
+    writes atomically when the outermost transaction exits; an exception
+    rolls them back instead. Nested transactions join the enclosing one.
+
+    The block returns once the backend has committed the writes, which is
+    not always once they are on disk: environments with a WRITE_CACHE_SIZE
+    above 1 (EXAMPLE, BENCHMARK, BENCHMARK_COMPACT) buffer commits in memory
+    and can lose the latest ones in a crash. See the durability notes in
+    config.py; `flush_database` forces buffered commits to disk.
+
+    In multi-process mode a transaction first catches up with commits from
+    other processes, and one that wrote anything commits under the
+    cross-process lock. If another process committed in the meantime its
+    writes are rolled back and WriteConflict is raised; see `run_transaction`.
+    """
+    global _transaction_depth, _transaction_writes
+    started = time.perf_counter()
+    with _connection_lock:
+        refresh_database()
+        backend = get_connection()
+        if _transaction_depth:
+            _transaction_depth += 1
+            try:
+                yield
+            finally:
+                _transaction_depth -= 1
+            return
+        backend.begin()
+        _transaction_depth = 1
+        _transaction_writes = False
+        try:
+            with metrics.phase('query'):
+                metrics.add_phase('open', time.perf_counter() - started)
+                yield
+        except BaseException:
+            rollback(backend)
+            raise
+        else:
+            committing = time.perf_counter()
+            if _coordinator is not None and _transaction_writes:
+                token = commit_shared(backend)
+            else:
+                token = backend.commit()
+            publish_changes()
+        finally:
+            _transaction_depth = 0
+    # wait for durability outside the lock so concurrent commits can share it
+    backend.sync(token)
+    metrics.add_phase('write', time.perf_counter() - committing)
+
+
+def rollback(backend:StorageBackend) -> None:
+    """Undoes the current transaction, and the in-memory state it touched
+
+    The undo log is replayed backwards against the secondary indexes and
+    only the keys it touched are dropped from the caches, so a rollback
+    costs as much as the transaction did rather than a rebuild.
+    """
+    _pending_changes.clear()
+    backend.rollback()
+    while _undo_log:
+        table_name, key, before, after = _undo_log.pop()
+        keys = changed_keys(table_name, key, after)
+        invalidate(table_name, *keys)
+        for index in built_indexes(table_name):
+            if after is not None:
+                index.unindex(keys[-1], after)
+            if before is not None:
+                index.index(key, before)
+
+def publish_changes() -> None:
+    """Appends the changes of the committed transaction to the change log
+    """
+    CHANGES.append(_pending_changes)
+    _pending_changes.clear()
+    _undo_log.clear()
+
+def commit_shared(backend:StorageBackend):
+    """Commits the current transaction to a database shared with other processes
+    """
+    with _coordinator.exclusive():
+        if _coordinator.is_stale():
+            rollback(backend)
+            raise WriteConflict("another process committed first")
+        changes = backend.changes()
+        token = backend.commit()
+        backend.flush()
+        _coordinator.publish(changes)
+    return token
+
+def run_transaction(func, *args, **kwargs):
+    """Calls `func` in a transaction, re-running it on fresh data after a WriteConflict
+    """
+    for attempt in itertools.count(1):
+        try:
+            with transaction():
+                return func(*args, **kwargs)
+        except WriteConflict:
+            if attempt >= MAX_CONFLICT_RETRIES:
+                raise
+
+def commit_writes(table_name:str, writes:list) -> list:
+    """Applies queued (func, args, kwargs) writes to `table_name` in one transaction, returning their results
+    """
+    def apply():
+        table = get_table(table_name)
+        return [func(table, *args, **kwargs) for func, args, kwargs in writes]
+    return run_transaction(apply)
+
+# WRITE QUEUES
+# Writes to hot records (see `queued_write`) wait here to share a commit, so a
+# burst of them costs one transaction per WRITE_BATCH_SIZE writes instead of
+# one each. Past WRITE_QUEUE_DEPTH waiting writes new ones are turned away.
+WRITE_QUEUES = {
+    USERS_TABLE: WriteQueue(functools.partial(commit_writes, USERS_TABLE),
+                            max_depth=config.WRITE_QUEUE_DEPTH, max_batch=config.WRITE_BATCH_SIZE)
+}
+
+
+# CHANGE TRACKING
+def invalidate(table_name:str, *keys) -> None:
+    """Drops the cached documents, and their cached encodings, stored under `keys`
+    """
+    for key in keys:
+        CACHES[table_name].invalidate(key)
+        FLIGHTS[table_name].forget(key)
+    serialize.invalidate(table_name, *keys)
+
+def clear_caches() -> None:
+    for cache in CACHES.values():
+        cache.clear()
+    serialize.clear()
+
+def reset_versions() -> None:
+    """Starts a new version epoch, making every previously issued version stale
+    """
+    global _epoch
+    with _connection_lock:
+        _epoch = uuid.uuid4().hex[:8]
+        for table_name in TABLE_KEYS:
+            _table_versions[table_name] = 0
+            _record_versions[table_name].clear()
+        CHANGES.reset(_epoch)
+
+def get_version(table_name:str, key=None) -> str:
+    """Returns an opaque version of a whole table, or of the document under `key`
+
+    The version changes whenever the table (or document) is mutated, so it
+    can be compared against a client's copy without loading any data.
+    """
+    # opening the backend starts a new epoch, so make sure it is open and current first
+    get_connection()
+    refresh_database()
+    if key is None:
+        return f"{_epoch}.{_table_versions[table_name]}"
+    return f"{_epoch}.{_record_versions[table_name].get(key, 0)}"
+
+def changed_keys(table_name:str, key, after:dict=None) -> list:
+    """Returns the keys a change to the document under `key` touches: `key`, then its new key if it moved
+    """
+    if after is not None and after[TABLE_KEYS[table_name]] != key:
+        return [key, after[TABLE_KEYS[table_name]]]
+    return [key]
+
+def record_change(table_name:str, key, before:dict=None, after:dict=None) -> None:
+    """Notes that the document under `key` went from `before` to `after` (None if absent)
+
+    Bumps versions, drops cached copies, updates the secondary indexes and
+    queues the change for the change log. A retitled book that is on some
+    wishlist is marked stale for the reconciler. Called by every mutating
+    function in this module with the lock held.
+    """
+    global _transaction_writes
+    _transaction_writes = True
+    fields = diff_fields(before, after)
+    _pending_changes.append({
+        'TABLE': table_name,
+        'KEY': key,
+        'OP': 'insert' if before is None else 'remove' if after is None else 'update',
+        'FIELDS': fields,
+        'DATA': copy.deepcopy(after)
+    })
+    if _transaction_depth:
+        _undo_log.append((table_name, key, before, after))
+    else:
+        publish_changes()
+    keys = changed_keys(table_name, key, after)
+    _table_versions[table_name] += 1
+    record_versions = _record_versions[table_name]
+    for changed_key in keys:
+        record_versions[changed_key] = record_versions.get(changed_key, 0) + 1
+    invalidate(table_name, *keys)
+    for index in built_indexes(table_name):
+        if before is not None:
+            index.unindex(key, before)
+        if after is not None:
+            index.index(keys[-1], after)
+    if (table_name == BOOKS_TABLE and after is not None and 'title' in fields
+            and secondary_index(USERS_TABLE, 'wishers').count(keys[-1])):
+        _stale_titles.add(keys[-1])
+
+def secondary_index(table_name:str, name:str):
+    """Returns SECONDARY_INDEXES[table_name][name], building it from the backend on first use
+
+    Must be called with the connection lock held.
+    """
+    if (table_name, name) not in _built_indexes:
+        build_index(table_name, name)
+    return SECONDARY_INDEXES[table_name][name]
+
+def built_indexes(table_name:str) -> list:
+    """Returns the secondary indexes of `table_name` built so far, which changes have to maintain
+    """
+    return [index for name, index in SECONDARY_INDEXES[table_name].items() if (table_name, name) in _built_indexes]
+
+def build_index(table_name:str, name:str) -> None:
+    """Builds one secondary index from the backend in one pass over its table
+
+    Where legacy data holds duplicate keys only the first document is
+    indexed, matching what key lookups return.
+    """
+    with _connection_lock:
+        index = SECONDARY_INDEXES[table_name][name]
+        index.clear()
+        key = TABLE_KEYS[table_name]
+        seen = set()
+        for _, document in get_connection().table(table_name).page():
+            if document[key] in seen:
+                continue
+            seen.add(document[key])
+            index.index(document[key], document)
+        _built_indexes.add((table_name, name))
+
+def reset_indexes() -> None:
+    """Drops every secondary index, so each is rebuilt from the backend when next used
+    """
+    with _connection_lock:
+        for indexes in SECONDARY_INDEXES.values():
+            for index in indexes.values():
+                index.clear()
+        _built_indexes.clear()
+
+def cache_stats() -> dict:
+    """Returns the hit, miss and eviction counters of every table cache
+    """
+    return {table_name: cache.stats() for table_name, cache in CACHES.items()}
+
 
 # DECORATORS
+def read_through(table_name:str):
+    """Serves a lookup by `table_name` key from the table's cache, filling it on a miss
+
+    The wrapped function takes the key as its only argument and returns a
+    response. Misses are resolved under the connection lock so a concurrent
+    write can't slip a stale document into the cache; hits skip the lock.
+    Concurrent misses of the same key share one call (see FLIGHTS). Callers
+    always get their own copy of the document.
+
+    A miss from a thread that already holds the lock (e.g. inside a
+    transaction) reads directly instead: a flight led by another thread may
+    be waiting for that very lock.
+
+    In multi-process mode the cache is only trusted once this process has
+    caught up with the others' commits (see `refresh_database`).
+    """
+    def inner(func):
+        @metrics.instrumented
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            key = args[0] if args else kwargs[TABLE_KEYS[table_name]]
+            coordinator = _coordinator
+            if coordinator is not None and coordinator.is_stale():
+                refresh_database()
+            cache = CACHES[table_name]
+            document = cache.get(key)
+            if document is not MISSING:
+                return make_response(status=Response.SUCCESS, data=copy.deepcopy(document))
+
+            def load():
+                with _connection_lock:
+                    response = func(*args, **kwargs)
+                    if response['STATUS'] == Response.SUCCESS:
+                        cache.put(key, copy.deepcopy(response['DATA']))
+                return response
+            if owns_connection():
+                return load()
+            return FLIGHTS[table_name].do(key, load)
+        return wrapper
+    return inner
+
 def db_handler(table_name=None):
-    """Sets up and returns a connection with the database
+    """Runs the wrapped function in a transaction, passing it the shared handle or one of its tables
     """
     def inner(func):
+        def call(*args, **kwargs):
+            if table_name in TABLE_KEYS:
+                table = get_table(table_name)
+            else:
+                table = get_connection()
+            return func(table, *args, **kwargs)
+
+        @functools.wraps(func)
         def wrapper(*args, **kwargs):
-            with TinyDB(DATABASE) as conn:
-                if table_name == USERS_TABLE:
-                    table = conn.table(table_name)
-                elif table_name == BOOKS_TABLE:
-                    table = conn.table(table_name)
-                else:
-                    table = conn
-                return func(table, *args, **kwargs)
+            with metrics.operation(func.__name__):
+                return run_transaction(call, *args, **kwargs)
+        return wrapper
+    return inner
+
+def queued_write(table_name:str):
+    """Like `db_handler`, but commits concurrent calls together through WRITE_QUEUES[table_name]
+
+    When the queue is full the call is turned away with a BUSY response
+    whose DATA holds the seconds to wait before retrying. Called with the
+    connection lock held, e.g. inside a transaction, the function joins
+    that transaction (or runs in its own) directly instead.
+    """
+    def inner(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with metrics.operation(func.__name__):
+                if owns_connection():
+                    # queueing would wait on the commit of a batch that needs this thread's lock
+                    return run_transaction(lambda: func(get_table(table_name), *args, **kwargs))
+                try:
+                    return WRITE_QUEUES[table_name].submit(func, *args, **kwargs)
+                except QueueFull as error:
+                    return make_response(status=Response.BUSY, data={'retry_after': error.retry_after})
         return wrapper
     return inner
 
@@ -61,29 +592,189 @@ def make_response(status:str, data:dict=None) -> dict:
     """
     return {'STATUS': status, 'DATA': data}
 
+def encode_cursor(position:int) -> str:
+    """Encodes a table position as an opaque pagination cursor
+    """
+    return base64.urlsafe_b64encode(str(position).encode()).decode()
+
+def decode_cursor(cursor:str) -> int:
+    """Decodes a pagination cursor, raising ValueError if it is malformed
+    """
+    try:
+        return int(base64.urlsafe_b64decode(cursor.encode()).decode())
+    except (binascii.Error, UnicodeError) as error:
+        raise ValueError(cursor) from error
+
+def get_page(table:KeyedTable, limit:int=None, cursor:str=None, fields:list=None, filters:list=()) -> dict:
+    """Returns the documents of `table` matching `filters`, one page at a time
+
+    Without `limit` or `cursor` every match is returned. Otherwise at most
+    `limit` (default DEFAULT_PAGE_SIZE, capped at MAX_PAGE_SIZE) documents are
+    returned and the response carries a 'NEXT_CURSOR' token for the following
+    page, or None on the last one.
+    """
+    if limit is None and cursor is None:
+        if fields is None and not filters:
+            return make_response(status=Response.SUCCESS, data=table.all())
+        rows = table.page(filters=filters, fields=fields)
+        return make_response(status=Response.SUCCESS, data=[document for _, document in rows])
+    try:
+        after = decode_cursor(cursor) if cursor else None
+    except ValueError:
+        return make_response(status=Response.INVALID_REQUEST)
+    limit = DEFAULT_PAGE_SIZE if limit is None else limit
+    if not isinstance(limit, int) or limit < 1:
+        return make_response(status=Response.INVALID_REQUEST)
+    limit = min(limit, MAX_PAGE_SIZE)
+    # fetch one extra row to tell whether another page follows
+    rows = table.page(after=after, limit=limit + 1, filters=filters, fields=fields)
+    next_cursor = encode_cursor(rows[limit - 1][0]) if len(rows) > limit else None
+    response = make_response(status=Response.SUCCESS, data=[document for _, document in rows[:limit]])
+    response['NEXT_CURSOR'] = next_cursor
+    return response
+
+
+def iter_table(table_name:str, batch_size:int=None) -> Iterator[dict]:
+    """Lazily yields every document of `table_name` in insertion order
+
+    Documents are read `batch_size` at a time, each batch in its own short
+    transaction, so memory stays flat and writers are only held up for the
+    duration of one batch read.
+    """
+    batch_size = batch_size or EXPORT_BATCH_SIZE
+    after = None
+    while True:
+        with transaction():
+            rows = get_table(table_name).page(after=after, limit=batch_size)
+        for _, document in rows:
+            yield document
+        if len(rows) < batch_size:
+            return
+        after = rows[-1][0]
+
+
+def export_tables(batch_size:int=None) -> dict:
+    """Returns {table_name: {doc_id: document}} for every table as of a single point in time
+
+    Tables are read `batch_size` documents at a time in short transactions,
+    like `iter_table`, so writers are never held up for a whole read. The
+    documents changed meanwhile are then looked up in the change log and
+    read again by key, together, in one last short transaction. If the
+    change log can't account for everything (it overflowed, or another
+    process committed) that transaction reads everything instead.
+    """
+    batch_size = batch_size or EXPORT_BATCH_SIZE
+    with _connection_lock:
+        get_connection()
+        refresh_database()
+        head = CHANGES.head()
+    tables = {}
+    for table_name in TABLE_KEYS:
+        documents = tables[table_name] = {}
+        after = None
+        while True:
+            with transaction():
+                rows = get_table(table_name).page(after=after, limit=batch_size)
+            documents.update(rows)
+            if len(rows) < batch_size:
+                break
+            after = rows[-1][0]
+    with transaction():
+        try:
+            changes, _ = CHANGES.read(head)
+        except ChangesExpired:
+            return {table_name: dict(get_table(table_name).page()) for table_name in TABLE_KEYS}
+        changed = {table_name: set() for table_name in TABLE_KEYS}
+        for change in changes:
+            changed[change['TABLE']].add(change['KEY'])
+            if change['DATA'] is not None:
+                changed[change['TABLE']].add(change['DATA'][TABLE_KEYS[change['TABLE']]])
+        rows = {table_name: get_table(table_name).get_rows(keys) for table_name, keys in changed.items() if keys}
+    for table_name, table_rows in rows.items():
+        key_field = TABLE_KEYS[table_name]
+        keys = changed[table_name]
+        documents = tables[table_name]
+        for doc_id in [doc_id for doc_id, document in documents.items() if document.get(key_field) in keys]:
+            del documents[doc_id]
+        documents.update(table_rows)
+    return {table_name: dict(sorted(documents.items())) for table_name, documents in tables.items()}
+
+
+def bulk_insert(table_name:str, records:Iterable[dict], fields:tuple,
+                created:str, already_exists:str, batch_size:int=None) -> dict:
+    """Inserts many records, committing `batch_size` at a time
+
+    Records are consumed lazily, so `records` may be a generator over a large
+    upload. Duplicates are caught by the table's unique key index, both
+    against stored documents and earlier records in the same upload. Returns
+    one {key: ..., 'STATUS': ...} entry per record, in input order, or
+    INVALID_REQUEST without inserting anything if `batch_size` isn't a
+    positive integer.
+    """
+    key = TABLE_KEYS[table_name]
+    batch_size = BULK_BATCH_SIZE if batch_size is None else batch_size
+    if not isinstance(batch_size, int) or batch_size < 1:
+        return make_response(status=Response.INVALID_REQUEST)
+    records = iter(records)
+
+    def insert_batch(batch:list) -> list:
+        table = get_table(table_name)
+        batch_results = []
+        for record in batch:
+            try:
+                document = {field: record[field] for field in fields}
+            except (KeyError, TypeError):
+                record_key = record.get(key) if isinstance(record, dict) else None
+                batch_results.append({key: record_key, 'STATUS': Response.INVALID_REQUEST})
+                continue
+            try:
+                table.insert(document)
+            except DuplicateKeyError:
+                batch_results.append({key: document[key], 'STATUS': already_exists})
+            else:
+                record_change(table_name, document[key], after=document)
+                batch_results.append({key: document[key], 'STATUS': created})
+        return batch_results
+
+    results = []
+    while True:
+        batch = list(itertools.islice(records, batch_size))
+        if not batch:
+            break
+        results.extend(run_transaction(insert_batch, batch))
+    return make_response(status=Response.SUCCESS, data=results)
+
 
 # USERS SECTION
+@read_through(USERS_TABLE)
 @db_handler(table_name=USERS_TABLE)
-def get_user(table:TinyDB.table, email:str) -> dict:
+def get_user(table:KeyedTable, email:str) -> dict:
     """Get user details
     """
-    if not table.contains(USER.email == email):
+    data = table.get(email)
+    if data is None:
         return make_response(status=Response.USER_NONEXISTENT)
-    data = table.get(USER.email == email)
     return make_response(status=Response.SUCCESS, data=data)
 
 @db_handler(table_name=USERS_TABLE)
-def get_all_users(table:TinyDB.table) -> dict:
+def get_all_users(table:KeyedTable, limit:int=None, cursor:str=None, fields:list=None,
+                  first_name:str=None, last_name:str=None) -> dict:
     """Returns a dict with all users in DB
+
+    Supports the pagination and `fields` projection of `get_page`, plus
+    exact-match `first_name` / `last_name` filters.
     """
-    return make_response(status=Response.SUCCESS, data=table.all())
+    filters = []
+    if first_name is not None:
+        filters.append(('first_name', 'eq', first_name))
+    if last_name is not None:
+        filters.append(('last_name', 'eq', last_name))
+    return get_page(table, limit=limit, cursor=cursor, fields=fields, filters=filters)
 
 @db_handler(table_name=USERS_TABLE)
-def add_user(table:TinyDB.table, first_name:str, last_name:str, email:str, password:str, wishlist:dict) -> dict:
+def add_user(table:KeyedTable, first_name:str, last_name:str, email:str, password:str, wishlist:dict) -> dict:
     """Adds new user to database
     """
-    if table.contains(USER.email == email):
-        return make_response(status=Response.USER_ALREADY_EXISTS)
     user = {
         'first_name': first_name,
         'last_name': last_name,
@@ -91,11 +782,15 @@ def add_user(table:TinyDB.table, first_name:str, last_name:str, email:str, passw
         'password': password,
         'wishlist': wishlist
     }
-    table.insert(user)
+    try:
+        table.insert(user)
+    except DuplicateKeyError:
+        return make_response(status=Response.USER_ALREADY_EXISTS)
+    record_change(USERS_TABLE, email, after=user)
     return make_response(status=Response.USER_CREATED)
 
 @db_handler(table_name=USERS_TABLE)
-def update_user(table:TinyDB.table, email:str, data:dict) -> dict:
+def update_user(table:KeyedTable, email:str, data:dict) -> dict:
     """Update user fields
 
     for `data`, expecting a dict representing a user, e.g.:
@@ -107,98 +802,394 @@ def update_user(table:TinyDB.table, email:str, data:dict) -> dict:
             "wishlist": []
         }
     """
-    if not table.contains(USER.email == email):
+    before = table.get(email)
+    if before is None:
         return make_response(status=Response.USER_NONEXISTENT)
-    result = table.update(data, USER.email == email)
+    try:
+        table.update(email, data)
+    except DuplicateKeyError:
+        return make_response(status=Response.USER_ALREADY_EXISTS)
+    record_change(USERS_TABLE, email, before=before, after=table.get(data.get('email', email)))
     return make_response(status=Response.USER_UPDATED)
 
 @db_handler(table_name=USERS_TABLE)
-def remove_user(table:TinyDB.table, email:str) -> dict:
+def remove_user(table:KeyedTable, email:str) -> dict:
     """Removes a user by email
     """
-    if not table.contains(USER.email == email):
+    before = table.get(email)
+    if before is None:
         return make_response(status=Response.USER_NONEXISTENT)
-    table.remove(USER.email == email)
+    table.remove(email)
+    record_change(USERS_TABLE, email, before=before)
     return make_response(status=Response.USER_REMOVED)
 
+def iter_users(batch_size:int=None) -> Iterator[dict]:
+    """Lazily yields every user in DB, for streaming exports
+    """
+    return iter_table(USERS_TABLE, batch_size=batch_size)
+
+@metrics.instrumented
+def add_users(users:Iterable[dict], batch_size:int=None) -> dict:
+    """Adds many users, reporting a status per user
+
+    Each user is a dict with the same fields `add_user` takes.
+    """
+    return bulk_insert(USERS_TABLE, users, USER_FIELDS, created=Response.USER_CREATED,
+                       already_exists=Response.USER_ALREADY_EXISTS, batch_size=batch_size)
+
 # WISHLIST SECTION
-@db_handler(table_name=USERS_TABLE)
-def get_wishlist(table:TinyDB.table, email:str) -> dict:
+@metrics.instrumented
+def get_wishlist(email:str, expand:bool=False) -> dict:
     """Retrieve wishlist for specific user
+
+    DATA maps each ISBN on the wishlist to the book's current title, or the
+    title stored with the entry if the book no longer exists. With `expand`,
+    it maps each ISBN to its full book record (None if the book no longer
+    exists) instead.
     """
-    user_search_results = get_user(email=email)
-    if user_search_results['STATUS'] == Response.USER_NONEXISTENT:
-        return user_search_results
-    return make_response(status=Response.SUCCESS, data=user_search_results['DATA']['wishlist'])
+    with transaction():
+        user_search_results = get_user(email=email)
+        if user_search_results['STATUS'] != Response.SUCCESS:
+            return user_search_results
+        wishlist = user_search_results['DATA']['wishlist']
+        if not expand:
+            return make_response(status=Response.SUCCESS, data=resolve_titles(wishlist))
+        return make_response(status=Response.SUCCESS, data=fetch_books(list(wishlist)))
 
-@db_handler(table_name=USERS_TABLE)
-def add_to_wishlist(table:TinyDB.table, email:str, isbn:str) -> dict:
+@queued_write(USERS_TABLE)
+def add_to_wishlist(table:KeyedTable, email:str, isbn:str) -> dict:
     """Add book to user's wishlist
     """
-    user_search_results = get_user(email=email)
-    if user_search_results['STATUS'] != Response.SUCCESS:
-        return user_search_results
-    book_search_results = get_book(isbn=isbn)
-    if book_search_results['STATUS'] != Response.SUCCESS:
-        return book_search_results
-    book_title = book_search_results['DATA']['title']
-    user_data = user_search_results['DATA']
-    user_data['wishlist'].setdefault(isbn, book_title)
-    update_results = update_user(email=email, data=user_data)
-    if update_results['STATUS'] == Response.USER_UPDATED:
-        return make_response(status=Response.WISHLIST_UPDATED)
-    return update_results
+    user = table.get(email)
+    if user is None:
+        return make_response(status=Response.USER_NONEXISTENT)
+    titles = secondary_index(BOOKS_TABLE, 'title')
+    if isbn not in titles:
+        return make_response(status=Response.BOOK_NONEXISTENT)
+    if isbn not in user['wishlist']:
+        wishlist = dict(user['wishlist'], **{isbn: titles.get(isbn)})
+        table.update(email, {'wishlist': wishlist})
+        record_change(USERS_TABLE, email, before=user, after=dict(user, wishlist=wishlist))
+    return make_response(status=Response.WISHLIST_UPDATED)
 
-@db_handler(table_name=USERS_TABLE)
-def remove_from_wishlist(table:TinyDB.table, email:str, isbn:str) -> dict:
+@queued_write(USERS_TABLE)
+def remove_from_wishlist(table:KeyedTable, email:str, isbn:str) -> dict:
     """Remove book from user's wishlist
     """
-    user_search_results = get_user(email=email)
-    if user_search_results['STATUS'] != Response.SUCCESS:
-        return user_search_results
-    user_data = user_search_results['DATA']
-    user_data['wishlist'].pop(isbn, None)
-    update_results = update_user(email=email, data=user_data)
-    if update_results['STATUS'] == Response.USER_UPDATED:
-        return make_response(status=Response.WISHLIST_UPDATED)
-    return update_results
+    user = table.get(email)
+    if user is None:
+        return make_response(status=Response.USER_NONEXISTENT)
+    if isbn in user['wishlist']:
+        wishlist = {key: title for key, title in user['wishlist'].items() if key != isbn}
+        table.update(email, {'wishlist': wishlist})
+        record_change(USERS_TABLE, email, before=user, after=dict(user, wishlist=wishlist))
+    return make_response(status=Response.WISHLIST_UPDATED)
+
+def resolve_titles(wishlist:dict) -> dict:
+    """Returns `wishlist` with every book's current title, keeping the stored title of books that no longer exist
+
+    Must be called with the connection lock held.
+    """
+    titles = secondary_index(BOOKS_TABLE, 'title')
+    return {isbn: titles.get(isbn, title) for isbn, title in wishlist.items()}
+
+def repair_titles(emails:list) -> int:
+    """Rewrites the wishlists of `emails` whose stored titles are stale, returning how many changed
+
+    Must be called in a transaction.
+    """
+    users = get_table(USERS_TABLE)
+    updated = 0
+    for email in emails:
+        user = users.get(email)
+        if user is None:
+            continue
+        wishlist = resolve_titles(user['wishlist'])
+        if wishlist != user['wishlist']:
+            users.update(email, {'wishlist': wishlist})
+            record_change(USERS_TABLE, email, before=user, after=dict(user, wishlist=wishlist))
+            updated += 1
+    return updated
+
+@metrics.instrumented
+def reconcile_wishlists(full:bool=False, batch_size:int=None) -> dict:
+    """Brings the titles stored in wishlists up to date with their books
+
+    Only the wishlists holding an ISBN marked stale are checked, or with
+    `full` every wishlist, e.g. after importing data written elsewhere. Users
+    are repaired `batch_size` at a time, each batch in its own transaction,
+    so writers are only held up for one batch. DATA reports how many
+    wishlists changed.
+    """
+    batch_size = batch_size or RECONCILE_BATCH_SIZE
+    with _connection_lock:
+        get_connection()
+        refresh_database()
+        wishers = secondary_index(USERS_TABLE, 'wishers')
+        isbns = set(wishers.groups()) if full else set(_stale_titles)
+        _stale_titles.difference_update(isbns)
+        emails = list(dict.fromkeys(email for isbn in isbns for email in wishers.get(isbn)))
+    updated = 0
+    try:
+        for start in range(0, len(emails), batch_size):
+            updated += run_transaction(repair_titles, emails[start:start + batch_size])
+    except BaseException:
+        # leave the rest for the next run
+        with _connection_lock:
+            _stale_titles.update(isbns)
+        raise
+    return make_response(status=Response.SUCCESS, data={'wishlists_updated': updated})
+
+def start_reconciler(interval:float=None) -> None:
+    """Starts a background thread running `reconcile_wishlists` every `interval` seconds while titles are stale
+    """
+    global _reconciler
+    with _connection_lock:
+        if _reconciler is not None:
+            return
+        _reconciler_stopping.clear()
+        _reconciler = threading.Thread(
+            target=reconcile_periodically,
+            args=(interval or RECONCILE_INTERVAL,),
+            name='pybrary-reconciler',
+            daemon=True)
+        _reconciler.start()
+
+def stop_reconciler() -> None:
+    global _reconciler
+    if _reconciler is None:
+        return
+    _reconciler_stopping.set()
+    _reconciler.join()
+    _reconciler = None
+
+def reconcile_periodically(interval:float) -> None:
+    while not _reconciler_stopping.wait(interval):
+        if not _stale_titles:
+            continue
+        try:
+            reconcile_wishlists()
+        except Exception:
+            logger.exception("wishlist title reconciliation failed")
 
 # BOOKS SECTION
+@read_through(BOOKS_TABLE)
 @db_handler(table_name=BOOKS_TABLE)
-def get_book(table:TinyDB.table, isbn:str) -> dict:
+def get_book(table:KeyedTable, isbn:str) -> dict:
     """Get book details
     """
-    if not table.contains(BOOK.isbn == isbn):
+    data = table.get(isbn)
+    if data is None:
         return make_response(status=Response.BOOK_NONEXISTENT)
-    data = table.get(BOOK.isbn == isbn)
     return make_response(status=Response.SUCCESS, data=data)
 
+def fetch_books(isbns:list) -> dict:
+    """Returns {isbn: book or None} for `isbns`, from the cache where possible and otherwise in one table pass
+
+    Must be called in a transaction.
+    """
+    cache = CACHES[BOOKS_TABLE]
+    books = {}
+    misses = []
+    for isbn in isbns:
+        document = cache.get(isbn)
+        if document is MISSING:
+            misses.append(isbn)
+        else:
+            books[isbn] = copy.deepcopy(document)
+    for isbn, document in get_table(BOOKS_TABLE).get_many(misses).items():
+        cache.put(isbn, copy.deepcopy(document))
+        books[isbn] = document
+    return {isbn: books.get(isbn) for isbn in isbns}
+
+@db_handler(table_name=BOOKS_TABLE)
+def get_books(table:KeyedTable, isbns:list) -> dict:
+    """Get the details of up to MAX_BATCH_SIZE books at once
+
+    DATA maps every requested ISBN to its book, or None if there is no such book.
+    """
+    if (not isinstance(isbns, list) or len(isbns) > MAX_BATCH_SIZE
+            or not all(isinstance(isbn, str) for isbn in isbns)):
+        return make_response(status=Response.INVALID_REQUEST)
+    return make_response(status=Response.SUCCESS, data=fetch_books(isbns))
+
 @db_handler(table_name=BOOKS_TABLE)
-def get_all_books(table:TinyDB.table) -> dict:
+def get_all_books(table:KeyedTable, limit:int=None, cursor:str=None, fields:list=None,
+                  author:str=None, published_after:str=None, published_before:str=None) -> dict:
     """Returns a dict with all books in DB
+
+    Supports the pagination and `fields` projection of `get_page`, plus an
+    exact-match `author` filter and an inclusive `publication_date` range
+    given as YYYY-MM-DD strings.
+    """
+    filters = []
+    if author is not None:
+        filters.append(('author', 'eq', author))
+    if published_after is not None:
+        filters.append(('publication_date', 'ge', published_after))
+    if published_before is not None:
+        filters.append(('publication_date', 'le', published_before))
+    return get_page(table, limit=limit, cursor=cursor, fields=fields, filters=filters)
+
+def iter_books(batch_size:int=None) -> Iterator[dict]:
+    """Lazily yields every book in DB, for streaming exports
+    """
+    return iter_table(BOOKS_TABLE, batch_size=batch_size)
+
+@metrics.instrumented
+def search_books(query:str, limit:int=None) -> dict:
+    """Full-text search over book titles and authors, best matches first
+
+    Every word of `query` must match a word of the title or author, either
+    whole or, from SEARCH_MIN_PREFIX letters on, as its prefix; title and
+    whole-word matches rank higher. Only the index lookup holds the lock:
+    the matches are ranked outside it and the books then fetched in their
+    own transaction, leaving out any removed in between.
     """
-    return make_response(status=Response.SUCCESS, data=table.all())
+    limit = DEFAULT_SEARCH_LIMIT if limit is None else limit
+    if not query or not query.strip() or not isinstance(limit, int) or limit < 1:
+        return make_response(status=Response.INVALID_REQUEST)
+    limit = min(limit, MAX_PAGE_SIZE)
+    with transaction():
+        scores = secondary_index(BOOKS_TABLE, 'search').lookup(query, limit)
+    isbns = [isbn for isbn, _ in InvertedIndex.rank(scores, limit)]
+    with transaction():
+        books = fetch_books(isbns)
+    return make_response(status=Response.SUCCESS, data=[book for book in books.values() if book is not None])
 
 @db_handler(table_name=BOOKS_TABLE)
-def add_book(table:TinyDB.table, title:str, author:str, isbn:str, publication_date:str) -> dict:
+def add_book(table:KeyedTable, title:str, author:str, isbn:str, publication_date:str) -> dict:
     """Adds new book to database
     """
-    if table.contains(BOOK.isbn == isbn):
-        return make_response(status=Response.BOOK_ALREADY_EXISTS)
     book = {
         'title': title,
         'author': author,
         'isbn': isbn,
         'publication_date': publication_date
     }
-    table.insert(book)
+    try:
+        table.insert(book)
+    except DuplicateKeyError:
+        return make_response(status=Response.BOOK_ALREADY_EXISTS)
+    record_change(BOOKS_TABLE, isbn, after=book)
     return make_response(status=Response.BOOK_CREATED)
 
+@metrics.instrumented
+def add_books(books:Iterable[dict], batch_size:int=None) -> dict:
+    """Adds many books, reporting a status per book
+
+    Each book is a dict with the same fields `add_book` takes.
+    """
+    return bulk_insert(BOOKS_TABLE, books, BOOK_FIELDS, created=Response.BOOK_CREATED,
+                       already_exists=Response.BOOK_ALREADY_EXISTS, batch_size=batch_size)
+
 @db_handler(table_name=BOOKS_TABLE)
-def remove_book(table:TinyDB.table, isbn:str) -> dict:
+def get_wishers(table:KeyedTable, isbn:str, limit:int=None, cursor:str=None) -> dict:
+    """Returns how many users have a book on their wishlist, and a page of their emails
+
+    DATA is {'count': ..., 'users': [...]}; `limit` and `cursor` page through
+    the users as in `get_page`.
+    """
+    if not table.contains(isbn):
+        return make_response(status=Response.BOOK_NONEXISTENT)
+    try:
+        start = decode_cursor(cursor) if cursor else 0
+    except ValueError:
+        return make_response(status=Response.INVALID_REQUEST)
+    limit = DEFAULT_PAGE_SIZE if limit is None else limit
+    if not isinstance(limit, int) or limit < 1 or start < 0:
+        return make_response(status=Response.INVALID_REQUEST)
+    limit = min(limit, MAX_PAGE_SIZE)
+    wishers = secondary_index(USERS_TABLE, 'wishers')
+    count = wishers.count(isbn)
+    users = wishers.slice(isbn, start, start + limit)
+    response = make_response(status=Response.SUCCESS, data={'count': count, 'users': users})
+    response['NEXT_CURSOR'] = encode_cursor(start + limit) if start + limit < count else None
+    return response
+
+@db_handler(table_name=BOOKS_TABLE)
+def remove_book(table:KeyedTable, isbn:str, cascade:bool=False) -> dict:
     """Removes a book by isbn
+
+    With `cascade`, the book is also removed from every wishlist holding it,
+    in the same transaction, and DATA reports how many wishlists changed.
     """
-    if not table.contains(BOOK.isbn == isbn):
+    before = table.get(isbn)
+    if before is None:
         return make_response(status=Response.BOOK_NONEXISTENT)
-    table.remove(BOOK.isbn == isbn)
-    return make_response(status=Response.BOOK_REMOVED)
\ No newline at end of file
+    table.remove(isbn)
+    record_change(BOOKS_TABLE, isbn, before=before)
+    if not cascade:
+        return make_response(status=Response.BOOK_REMOVED)
+    users = get_table(USERS_TABLE)
+    emails = secondary_index(USERS_TABLE, 'wishers').get(isbn)
+    for email in emails:
+        user = users.get(email)
+        wishlist = {key: title for key, title in user['wishlist'].items() if key != isbn}
+        users.update(email, {'wishlist': wishlist})
+        record_change(USERS_TABLE, email, before=user, after=dict(user, wishlist=wishlist))
+    return make_response(status=Response.BOOK_REMOVED, data={'wishlists_updated': len(emails)})
+
+# AUTHORS SECTION
+@metrics.instrumented
+def get_authors() -> dict:
+    """Returns every author with the number of their books, sorted by name
+    """
+    with _connection_lock:
+        get_connection()
+        groups = secondary_index(BOOKS_TABLE, 'author').groups()
+    authors = [{'author': author, 'book_count': count} for author, count in groups.items()]
+    authors.sort(key=lambda entry: normalize_name(entry['author']))
+    return make_response(status=Response.SUCCESS, data=authors)
+
+@db_handler(table_name=BOOKS_TABLE)
+def get_books_by_author(table:KeyedTable, author:str) -> dict:
+    """Returns every book by `author`, matched case-insensitively
+    """
+    isbns = secondary_index(BOOKS_TABLE, 'author').get(author)
+    if not isbns:
+        return make_response(status=Response.AUTHOR_NONEXISTENT)
+    return make_response(status=Response.SUCCESS, data=[table.get(isbn) for isbn in isbns])
+
+# CHANGES SECTION
+def get_changes(after:str=None, limit:int=None, wait:float=0) -> dict:
+    """Get committed changes following cursor `after`, oldest first
+
+    Each change is {'SEQ', 'TABLE', 'KEY', 'OP', 'FIELDS', 'DATA'}: the cursor
+    of the change, the table and key of the document, 'insert', 'update' or
+    'remove', the top-level fields that changed and the document afterwards
+    (None when removed). Without `after` reading starts at the oldest change
+    still held. If there are none yet, waits up to `wait` seconds (capped at
+    MAX_CHANGE_WAIT) for one. The response carries a 'NEXT_CURSOR' to resume
+    from; CHANGES_EXPIRED means changes were missed and the consumer has to
+    resynchronize from a full export.
+    """
+    limit = DEFAULT_PAGE_SIZE if limit is None else limit
+    if not isinstance(limit, int) or limit < 0 or wait is None or not math.isfinite(wait) or wait < 0:
+        return make_response(status=Response.INVALID_REQUEST)
+    # a reload from another process starts a new epoch, so catch up first
+    get_connection()
+    refresh_database()
+    try:
+        changes, next_cursor = CHANGES.read(after, min(limit, MAX_PAGE_SIZE), min(wait, MAX_CHANGE_WAIT))
+    except ChangesExpired:
+        return make_response(status=Response.CHANGES_EXPIRED)
+    except ValueError:
+        return make_response(status=Response.INVALID_REQUEST)
+    response = make_response(status=Response.SUCCESS, data=changes)
+    response['NEXT_CURSOR'] = next_cursor
+    return response
+
+def iter_changes(after:str=None, wait:float=None) -> Iterator[dict]:
+    """Yields committed changes following cursor `after` as they happen, or None every `wait` seconds without one
+
+    Raises ChangesExpired, or ValueError for a malformed cursor.
+    """
+    wait = MAX_CHANGE_WAIT if wait is None else wait
+    get_connection()
+    while True:
+        refresh_database()
+        changes, after = CHANGES.read(after, MAX_PAGE_SIZE, wait)
+        if not changes:
+            yield None
+        yield from changes
@@ -0,0 +1,639 @@
+# STANDARD LIBRARY
+import bisect
+import copy
+import heapq
+import itertools
+import operator
+import re
+import sys
+from typing import Callable, Iterable
+
+# 3RD PARTY MODULES
+from tinydb.table import Document, Table
+
+
+# GLOBAL
+TOKEN_PATTERN = re.compile(r"\w+")
+# Filters are (field, operator, value) triples understood by every backend
+FILTER_OPERATORS = {
+    'eq': operator.eq,
+    'ge': operator.ge,
+    'le': operator.le
+}
+
+
+# EXCEPTIONS
+class DuplicateKeyError(KeyError):
+    """Raised when a write would give two documents the same unique key
+    """
+
+
+# UTILITY FUNCTIONS
+def matches(document:dict, filters:list) -> bool:
+    """Checks `document` against (field, operator, value) filters; missing fields never match
+    """
+    for field, op, value in filters:
+        field_value = document.get(field)
+        if field_value is None or not FILTER_OPERATORS[op](field_value, value):
+            return False
+    return True
+
+def project(document:dict, fields:list=None) -> dict:
+    """Copies `document`, keeping only `fields` if given
+    """
+    if fields is None:
+        return copy.deepcopy(document)
+    return {field: copy.deepcopy(document[field]) for field in fields if field in document}
+
+
+# INDEXES
+class HashIndex:
+    """Unique index mapping a field value to the id of the document holding it
+
+    Duplicates found in legacy data are kept aside as shadowed ids of their
+    value, so removing the value can remove every document holding it.
+    """
+    def __init__(self, field:str):
+        self.field = field
+        self._doc_ids = {}
+        self._shadowed = {}
+
+    def __contains__(self, value) -> bool:
+        return value in self._doc_ids
+
+    def __len__(self) -> int:
+        return len(self._doc_ids)
+
+    def build(self, documents:dict) -> None:
+        """Rebuilds the index from a {doc_id: document} mapping
+
+        Data written before the index existed may already hold duplicate keys;
+        the lowest id wins, matching what a TinyDB `Query` lookup returns.
+        """
+        self._doc_ids = {}
+        self._shadowed = {}
+        if hasattr(documents, 'field_items'):
+            # snapshot-backed tables can supply keys without decoding each document
+            pairs = documents.field_items(self.field)
+        else:
+            pairs = ((doc_id, document[self.field]) for doc_id, document in documents.items())
+        for doc_id, value in pairs:
+            self.restore(value, doc_id)
+
+    def get(self, value) -> str:
+        """Returns the doc id stored under `value`, or None
+        """
+        return self._doc_ids.get(value)
+
+    def doc_ids(self, value) -> list:
+        """Returns the ids of every document holding `value`, the indexed one first
+        """
+        doc_id = self._doc_ids.get(value)
+        if doc_id is None:
+            return []
+        return [doc_id] + self._shadowed.get(value, [])
+
+    def check(self, value, doc_id:str=None) -> None:
+        """Raises DuplicateKeyError if `value` is held by a document other than `doc_id`
+        """
+        holder = self._doc_ids.get(value)
+        if holder is not None and holder != doc_id:
+            raise DuplicateKeyError(value)
+
+    def add(self, value, doc_id:str) -> None:
+        self.check(value, doc_id)
+        self._doc_ids[value] = doc_id
+
+    def discard(self, value) -> None:
+        """Forgets `value` and every document holding it
+        """
+        self._doc_ids.pop(value, None)
+        self._shadowed.pop(value, None)
+
+    def move(self, value, new_value, doc_id:str) -> None:
+        """Re-indexes `doc_id` from `value` under `new_value`; a shadowed duplicate takes over `value`
+        """
+        self.check(new_value, doc_id)
+        self.forget(value, doc_id)
+        self._doc_ids[new_value] = doc_id
+
+    def forget(self, value, doc_id:str) -> None:
+        """Drops `doc_id` from under `value`, promoting its next shadowed duplicate if it was the indexed one
+        """
+        shadowed = self._shadowed.get(value, [])
+        if self._doc_ids.get(value) == doc_id:
+            if shadowed:
+                self._doc_ids[value] = shadowed.pop(0)
+            else:
+                self._doc_ids.pop(value, None)
+        elif doc_id in shadowed:
+            shadowed.remove(doc_id)
+        if not shadowed:
+            self._shadowed.pop(value, None)
+
+    def restore(self, value, doc_id:str) -> None:
+        """Indexes `doc_id` under `value` without a uniqueness check, the lowest id winning over duplicates
+        """
+        holder = self._doc_ids.setdefault(value, doc_id)
+        if holder == doc_id:
+            return
+        if int(doc_id) < int(holder):
+            self._doc_ids[value], doc_id = doc_id, holder
+        shadowed = self._shadowed.setdefault(value, [])
+        shadowed.append(doc_id)
+        shadowed.sort(key=int)
+
+
+class GroupIndex:
+    """Non-unique index grouping document keys by the (normalized) values a document holds
+
+    `values` extracts the indexed values from a document and `normalize`
+    turns each into its index key; the first spelling seen for a normalized
+    key is kept as its label. Lookups cost time proportional to the size of
+    the group, not the table. Members keep their insertion order.
+    """
+    def __init__(self, values:Callable[[dict], Iterable], normalize:Callable=None):
+        self.values = values
+        self.normalize = normalize or (lambda value: value)
+        self._groups = {}
+        self._labels = {}
+
+    def __len__(self) -> int:
+        return len(self._groups)
+
+    def clear(self) -> None:
+        self._groups = {}
+        self._labels = {}
+
+    def get(self, value) -> list:
+        """Returns the keys of the documents holding `value`
+        """
+        return list(self._groups.get(self.normalize(value), ()))
+
+    def count(self, value) -> int:
+        return len(self._groups.get(self.normalize(value), ()))
+
+    def slice(self, value, start:int=0, stop:int=None) -> list:
+        """Returns the keys of the documents holding `value` from position `start` to `stop`
+        """
+        return list(itertools.islice(self._groups.get(self.normalize(value), ()), start, stop))
+
+    def groups(self) -> dict:
+        """Returns {label: member count} for every non-empty group
+        """
+        return {self._labels[group]: len(members) for group, members in self._groups.items()}
+
+    def index(self, key, document:dict) -> None:
+        for value in self.values(document):
+            if value is None:
+                continue
+            group = self.normalize(value)
+            self._groups.setdefault(group, {})[key] = None
+            self._labels.setdefault(group, value)
+
+    def unindex(self, key, document:dict) -> None:
+        for value in self.values(document):
+            if value is None:
+                continue
+            group = self.normalize(value)
+            members = self._groups.get(group)
+            if members is None:
+                continue
+            members.pop(key, None)
+            if not members:
+                del self._groups[group]
+                del self._labels[group]
+
+
+class LookupIndex:
+    """Maps each document key to the value of one of its fields, so it can be read without touching storage
+
+    String values are interned: a value held by many documents, or copied
+    from this index into other documents, is kept in memory once.
+    """
+    def __init__(self, field:str):
+        self.field = field
+        self._values = {}
+
+    def __contains__(self, key) -> bool:
+        return key in self._values
+
+    def __len__(self) -> int:
+        return len(self._values)
+
+    def clear(self) -> None:
+        self._values = {}
+
+    def get(self, key, default=None):
+        return self._values.get(key, default)
+
+    def index(self, key, document:dict) -> None:
+        value = document.get(self.field)
+        self._values[key] = sys.intern(value) if isinstance(value, str) else value
+
+    def unindex(self, key, document:dict) -> None:
+        self._values.pop(key, None)
+
+
+class InvertedIndex:
+    """Tokenized full-text index over some text fields of a document, with prefix matching
+
+    `fields` maps each indexed field to the weight of a match in it. A query
+    matches documents holding every query term, either as a whole token or
+    as a token prefix (worth `PREFIX_WEIGHT` of a whole-token match), and
+    results are ranked by summed weight. The vocabulary is kept sorted so
+    prefix expansion is a binary search; `max_expansions` caps how many
+    tokens a prefix may expand to, and terms shorter than `min_prefix` only
+    match whole tokens.
+
+    Searching is split in two so the caller can release whatever guards the
+    index in between: `lookup` scores the matching documents into a fresh
+    dict and `rank` orders them.
+    """
+    PREFIX_WEIGHT = 0.5
+
+    def __init__(self, fields:dict, max_expansions:int=100, min_prefix:int=1):
+        self.fields = fields
+        self.max_expansions = max_expansions
+        self.min_prefix = min_prefix
+        self._postings = {}
+        self._vocabulary = []
+
+    def __len__(self) -> int:
+        return len(self._vocabulary)
+
+    @staticmethod
+    def tokenize(text:str) -> list:
+        return TOKEN_PATTERN.findall(text.casefold())
+
+    def clear(self) -> None:
+        self._postings = {}
+        self._vocabulary = []
+
+    def _weights(self, document:dict) -> dict:
+        weights = {}
+        for field, weight in self.fields.items():
+            text = document.get(field)
+            if not isinstance(text, str):
+                continue
+            for token in self.tokenize(text):
+                weights[token] = max(weights.get(token, 0), weight)
+        return weights
+
+    def index(self, key, document:dict) -> None:
+        for token, weight in self._weights(document).items():
+            postings = self._postings.get(token)
+            if postings is None:
+                postings = self._postings[token] = {}
+                bisect.insort(self._vocabulary, token)
+            postings[key] = weight
+
+    def unindex(self, key, document:dict) -> None:
+        for token in self._weights(document):
+            postings = self._postings.get(token)
+            if postings is None:
+                continue
+            postings.pop(key, None)
+            if not postings:
+                del self._postings[token]
+                position = bisect.bisect_left(self._vocabulary, token)
+                del self._vocabulary[position]
+
+    def _expand(self, term:str) -> list:
+        """Returns the vocabulary tokens `term` matches, `term` itself first if present
+        """
+        if len(term) < self.min_prefix:
+            return [term] if term in self._postings else []
+        start = bisect.bisect_left(self._vocabulary, term)
+        tokens = []
+        for token in itertools.islice(self._vocabulary, start, start + self.max_expansions):
+            if not token.startswith(term):
+                break
+            tokens.append(token)
+        return tokens
+
+    def _matches(self, term:str, tokens:list) -> dict:
+        """Returns {key: score} for every document holding one of `tokens`, the expansion of `term`
+        """
+        scores = {}
+        for token in tokens:
+            factor = 1.0 if token == term else self.PREFIX_WEIGHT
+            for key, weight in self._postings[token].items():
+                scores[key] = max(scores.get(key, 0), weight * factor)
+        return scores
+
+    def _score(self, key, term:str, tokens:list) -> float:
+        """Returns the score of the document under `key` for `term`, 0 if it doesn't match
+        """
+        score = 0
+        for token in tokens:
+            weight = self._postings[token].get(key)
+            if weight is not None:
+                score = max(score, weight * (1.0 if token == term else self.PREFIX_WEIGHT))
+        return score
+
+    def lookup(self, query:str, limit:int=None) -> dict:
+        """Returns {key: score} for the documents matching every term of `query`, unranked
+
+        Only the documents matching the term with the fewest postings are
+        candidates, and the other terms are checked against just those. Once
+        `limit` candidates have the best possible score no other can outrank
+        them, so the rest are skipped.
+        """
+        terms = []
+        for term in dict.fromkeys(self.tokenize(query)):
+            tokens = self._expand(term)
+            if not tokens:
+                return {}
+            terms.append((sum(len(self._postings[token]) for token in tokens), term, tokens))
+        if not terms:
+            return {}
+        terms.sort(key=lambda item: item[0])
+        top = max(self.fields.values())
+        best = sum(top * (1.0 if tokens[0] == term else self.PREFIX_WEIGHT) for _, term, tokens in terms)
+        (_, first, first_tokens), rest = terms[0], terms[1:]
+        scores = {}
+        perfect = 0
+        for key, score in self._matches(first, first_tokens).items():
+            for _, term, tokens in rest:
+                term_score = self._score(key, term, tokens)
+                if not term_score:
+                    break
+                score += term_score
+            else:
+                scores[key] = score
+                if score == best:
+                    perfect += 1
+                    if perfect == limit:
+                        break
+        return scores
+
+    @staticmethod
+    def rank(scores:dict, limit:int=None) -> list:
+        """Returns the (key, score) pairs of `scores` best first, the first `limit` of them if given
+        """
+        ranked = ((key, score) for key, score in scores.items())
+        if limit is None:
+            return sorted(ranked, key=lambda item: -item[1])
+        return heapq.nsmallest(limit, ranked, key=lambda item: -item[1])
+
+    def search(self, query:str, limit:int=None) -> list:
+        """Returns (key, score) pairs for documents matching every term of `query`, best first
+        """
+        return self.rank(self.lookup(query, limit), limit)
+
+
+# TABLES
+class KeyedTable:
+    """A TinyDB table addressed by a unique key field
+
+    Documents are read and written directly against the table's raw storage
+    dict, so with a caching storage every point operation is O(1) instead of
+    the full-table scan a TinyDB `Query` needs. The key index is kept up to
+    date on insert, update and remove and enforces uniqueness of the key.
+
+    Document ids are also kept in a sorted list, so `page` seeks straight to
+    the first id after its cursor instead of skipping the ids before it.
+
+    Between `begin` and `commit` writes only touch the in-memory cache and are
+    recorded in an undo journal, so a unit of work reaches storage in a single
+    write or is undone entirely by `rollback`.
+
+    `on_change`, if given, is called with (table name, doc_id) after every
+    document insert, update or remove.
+    """
+    def __init__(self, table:Table, key:str, on_change:Callable=None):
+        self.name = table.name
+        self.key = key
+        self.on_change = on_change
+        self._storage = table.storage
+        self._index = HashIndex(key)
+        self._ids = []
+        self._next_id = 1
+        self._begin_id = 1
+        self._journal = None
+        self._dirty = False
+        self.rebuild()
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    def _tables(self) -> dict:
+        tables = self._storage.read()
+        if tables is None:
+            tables = {}
+        tables.setdefault(self.name, {})
+        return tables
+
+    def _documents(self) -> dict:
+        return self._tables()[self.name]
+
+    def _write(self, tables:dict) -> None:
+        if self._journal is not None:
+            self._dirty = True
+            return
+        self._storage.write(tables)
+
+    def _record(self, doc_id:str) -> None:
+        """Saves the pre-transaction state of `doc_id` the first time it is touched
+        """
+        if self._journal is not None and doc_id not in self._journal:
+            document = self._documents().get(doc_id)
+            self._journal[doc_id] = copy.deepcopy(document)
+        if self.on_change is not None:
+            self.on_change(self.name, doc_id)
+
+    def raw(self, doc_id:str) -> dict:
+        """Returns the stored document with id `doc_id` without copying it, or None
+
+        Storages that don't hold documents as dicts (see compact.py) build a
+        new one, so changes to it must be written back.
+        """
+        return self._documents().get(doc_id)
+
+    # TRANSACTIONS
+    def begin(self) -> None:
+        self._journal = {}
+        self._dirty = False
+        self._begin_id = self._next_id
+
+    def commit(self) -> None:
+        """Ends the transaction, writing its changes to storage in one go
+        """
+        dirty = self._dirty
+        self._journal = None
+        self._dirty = False
+        if dirty:
+            self._storage.write(self._tables())
+
+    def rollback(self) -> None:
+        """Ends the transaction, restoring every document it touched
+
+        The key index and id list are put back from the journal too, so the
+        cost is proportional to the documents touched, not the table.
+        """
+        documents = self._documents()
+        # unindex everything first, in case the transaction swapped keys between documents
+        for doc_id in self._journal:
+            document = documents.get(doc_id)
+            if document is not None:
+                self._index.forget(document[self.key], doc_id)
+        for doc_id, document in self._journal.items():
+            exists = doc_id in documents
+            if document is None:
+                if exists:
+                    del documents[doc_id]
+                    del self._ids[bisect.bisect_left(self._ids, int(doc_id))]
+                continue
+            documents[doc_id] = document
+            if not exists:
+                bisect.insort(self._ids, int(doc_id))
+            self._index.restore(document[self.key], doc_id)
+        self._next_id = self._begin_id
+        self._journal = None
+        self._dirty = False
+
+    def changes(self) -> list:
+        """Returns (doc_id, before, after) for every document the open transaction changed, in id order
+
+        `after` is None for removed documents and `before` for inserted ones.
+        """
+        documents = self._documents()
+        changes = []
+        for doc_id in sorted(self._journal, key=int):
+            before, after = self._journal[doc_id], documents.get(doc_id)
+            if before != after:
+                changes.append((doc_id, before, after))
+        return changes
+
+    def apply(self, doc_id:str, document:dict) -> None:
+        """Puts `document` (None to remove it) at `doc_id` as committed by another process
+
+        Only the in-memory state changes: the other process has already
+        written the change to storage.
+        """
+        documents = self._documents()
+        current = documents.get(doc_id)
+        if current is not None:
+            self._index.forget(current[self.key], doc_id)
+            if document is None:
+                del documents[doc_id]
+                del self._ids[bisect.bisect_left(self._ids, int(doc_id))]
+        if document is not None:
+            documents[doc_id] = document
+            if current is None:
+                bisect.insort(self._ids, int(doc_id))
+            self._index.restore(document[self.key], doc_id)
+        self._next_id = max(self._next_id, int(doc_id) + 1)
+
+    def rebuild(self) -> None:
+        """Rebuilds the key index from storage
+        """
+        documents = self._documents()
+        self._index.build(documents)
+        self._ids = sorted(int(doc_id) for doc_id in documents)
+        self._next_id = (self._ids[-1] if self._ids else 0) + 1
+
+    def contains(self, key) -> bool:
+        return key in self._index
+
+    def get(self, key) -> Document:
+        """Returns a copy of the document stored under `key`, or None
+        """
+        doc_id = self._index.get(key)
+        if doc_id is None:
+            return None
+        return Document(copy.deepcopy(self._documents()[doc_id]), int(doc_id))
+
+    def get_many(self, keys:Iterable) -> dict:
+        """Returns {key: copy of document} for every key in `keys` that exists
+        """
+        documents = {}
+        for key in keys:
+            doc_id = self._index.get(key)
+            if doc_id is not None:
+                documents[key] = Document(copy.deepcopy(self._documents()[doc_id]), int(doc_id))
+        return documents
+
+    def get_rows(self, keys:Iterable) -> list:
+        """Returns (doc_id, copy of document) for every document under one of `keys`, legacy duplicates included, in id order
+        """
+        doc_ids = sorted(int(doc_id) for key in dict.fromkeys(keys) for doc_id in self._index.doc_ids(key))
+        documents = self._documents()
+        return [(doc_id, project(documents[str(doc_id)])) for doc_id in doc_ids]
+
+    def all(self) -> list:
+        documents = self._documents()
+        return [Document(copy.deepcopy(documents[str(doc_id)]), doc_id) for doc_id in self._ids]
+
+    def page(self, after:int=None, limit:int=None, filters:list=(), fields:list=None) -> list:
+        """Returns up to `limit` (doc_id, document) pairs with ids above `after` that match `filters`
+
+        Only the documents on the page are copied and projected to `fields`.
+        """
+        results = []
+        if limit is not None and limit <= 0:
+            return results
+        documents = self._documents()
+        start = 0 if after is None else bisect.bisect_right(self._ids, after)
+        for position in range(start, len(self._ids)):
+            doc_id = self._ids[position]
+            document = documents[str(doc_id)]
+            if not matches(document, filters):
+                continue
+            results.append((doc_id, project(document, fields)))
+            if limit is not None and len(results) >= limit:
+                break
+        return results
+
+    def insert(self, document:dict) -> int:
+        """Inserts a new document, raising DuplicateKeyError if its key is taken
+        """
+        doc_id = str(self._next_id)
+        self._index.add(document[self.key], doc_id)
+        self._record(doc_id)
+        tables = self._tables()
+        tables[self.name][doc_id] = copy.deepcopy(dict(document))
+        self._ids.append(self._next_id)
+        self._next_id += 1
+        self._write(tables)
+        return int(doc_id)
+
+    def update(self, key, fields:dict) -> bool:
+        """Updates the document stored under `key` with `fields`
+
+        Returns False if no such document exists. Raises DuplicateKeyError if
+        `fields` would move the document onto a key held by another document.
+        """
+        doc_id = self._index.get(key)
+        if doc_id is None:
+            return False
+        new_key = fields.get(self.key, key)
+        if new_key != key:
+            self._index.check(new_key, doc_id)
+        self._record(doc_id)
+        tables = self._tables()
+        documents = tables[self.name]
+        # assigned back rather than updated in place, for storages that don't hold dicts
+        documents[doc_id] = {**documents[doc_id], **copy.deepcopy(dict(fields))}
+        if new_key != key:
+            self._index.move(key, new_key, doc_id)
+        self._write(tables)
+        return True
+
+    def remove(self, key) -> bool:
+        """Removes the document stored under `key`, and any legacy duplicates of it
+
+        Returns False if there was none.
+        """
+        doc_ids = self._index.doc_ids(key)
+        if not doc_ids:
+            return False
+        tables = self._tables()
+        for doc_id in doc_ids:
+            self._record(doc_id)
+            del tables[self.name][doc_id]
+            del self._ids[bisect.bisect_left(self._ids, int(doc_id))]
+        self._index.discard(key)
+        self._write(tables)
+        return True
@@ -0,0 +1,152 @@
+# STANDARD LIBRARY
+import bisect
+import contextlib
+import functools
+import logging
+import threading
+import time
+
+# LOCAL MODULES
+from PyBrary import config
+
+
+# SETUP
+logger = logging.getLogger(__name__)
+_local = threading.local()
+
+
+# HISTOGRAMS
+class Histogram:
+    """Thread-safe Prometheus-style histogram with one series per combination of label values
+    """
+    def __init__(self, name:str, documentation:str, labelnames:tuple, buckets:tuple=None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets or config.METRICS_BUCKETS))
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value:float, **labels) -> None:
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                # per-bucket counts (last one is +Inf), then sum
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][bisect.bisect_left(self.buckets, value)] += 1
+            series[1] += value
+
+    def count(self, **labels) -> int:
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with self._lock:
+            series = self._series.get(key)
+            return sum(series[0]) if series else 0
+
+    def clear(self) -> None:
+        with self._lock:
+            self._series.clear()
+
+    def render(self) -> list:
+        """Returns the histogram in the Prometheus text exposition format, one line per item
+        """
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = sorted((key, list(counts), total) for key, (counts, total) in self._series.items())
+        for key, counts, total in series:
+            labels = [f'{name}="{escape(value)}"' for name, value in zip(self.labelnames, key)]
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                le = '+Inf' if bound == float('inf') else repr(float(bound))
+                bucket_labels = ','.join(labels + ['le="%s"' % le])
+                lines.append(f"{self.name}_bucket{{{bucket_labels}}} {cumulative}")
+            series_labels = ','.join(labels)
+            lines.append(f"{self.name}_sum{{{series_labels}}} {total!r}")
+            lines.append(f"{self.name}_count{{{series_labels}}} {cumulative}")
+        return lines
+
+
+# UTILITY FUNCTIONS
+def escape(value:str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def render() -> str:
+    """Returns every metric in the Prometheus text exposition format
+    """
+    lines = []
+    for histogram in HISTOGRAMS:
+        lines.extend(histogram.render())
+    return '\n'.join(lines) + '\n'
+
+def reset() -> None:
+    for histogram in HISTOGRAMS:
+        histogram.clear()
+
+def log_if_slow(kind:str, name:str, seconds:float, detail:dict=None) -> None:
+    """Logs a warning for operations slower than SLOW_OPERATION_THRESHOLD seconds (None disables it)
+    """
+    threshold = config.SLOW_OPERATION_THRESHOLD
+    if threshold is not None and seconds >= threshold:
+        breakdown = ' '.join(f"{key}={value * 1000:.1f}ms" for key, value in (detail or {}).items())
+        logger.warning("slow %s %s took %.1fms %s", kind, name, seconds * 1000, breakdown)
+
+
+# METRICS
+DB_OPERATION_SECONDS = Histogram(
+    'pybrary_db_operation_seconds',
+    "Time spent in db.py operations by phase: open (connection, lock and transaction start), "
+    "query (the operation itself), write (commit and sync) and total",
+    labelnames=('operation', 'phase'))
+HTTP_REQUEST_SECONDS = Histogram(
+    'pybrary_http_request_seconds',
+    "Time spent handling API requests, including response serialization",
+    labelnames=('route', 'method', 'status'))
+HISTOGRAMS = [DB_OPERATION_SECONDS, HTTP_REQUEST_SECONDS]
+
+@contextlib.contextmanager
+def operation(name:str):
+    """Times the enclosed db.py operation; nested operations are counted as part of the outermost one
+    """
+    if getattr(_local, 'phases', None) is not None:
+        yield
+        return
+    phases = _local.phases = {}
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - start
+        _local.phases = None
+        for phase_name, phase_seconds in phases.items():
+            DB_OPERATION_SECONDS.observe(phase_seconds, operation=name, phase=phase_name)
+        DB_OPERATION_SECONDS.observe(seconds, operation=name, phase='total')
+        log_if_slow('db operation', name, seconds, phases)
+
+def instrumented(func):
+    """Decorator timing every call of `func` as a db.py operation
+    """
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        with operation(func.__name__):
+            return func(*args, **kwargs)
+    return wrapper
+
+def add_phase(name:str, seconds:float) -> None:
+    """Adds `seconds` to phase `name` of the operation running on this thread, if any
+    """
+    phases = getattr(_local, 'phases', None)
+    if phases is not None:
+        phases[name] = phases.get(name, 0.0) + seconds
+
+@contextlib.contextmanager
+def phase(name:str):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        add_phase(name, time.perf_counter() - start)
+
+def observe_request(route:str, method:str, status:int, seconds:float) -> None:
+    HTTP_REQUEST_SECONDS.observe(seconds, route=route, method=method, status=status)
+    log_if_slow('request', f"{method} {route}", seconds)
@@ -0,0 +1,70 @@
+# Request and response helpers shared by the WSGI (app.py) and ASGI (asgi.py)
+# front ends, so both answer a request with the same status, headers and
+# payload without either importing the other.
+
+# STANDARD LIBRARY
+import json
+
+# LOCAL MODULES
+from PyBrary import db
+
+
+# GLOBAL
+STATUS_CODE = {
+    db.Response.SUCCESS: 200,
+    db.Response.FAILURE: 500,
+    db.Response.INVALID_REQUEST: 400,
+    db.Response.BUSY: 429,
+    db.Response.USER_CREATED: 201,
+    db.Response.USER_UPDATED: 200,
+    db.Response.USER_REMOVED: 200,
+    db.Response.USER_NONEXISTENT: 404,
+    db.Response.USER_ALREADY_EXISTS: 406,
+    db.Response.BOOK_CREATED: 201,
+    db.Response.BOOK_UPDATED: 200,
+    db.Response.BOOK_REMOVED: 200,
+    db.Response.BOOK_NONEXISTENT: 404,
+    db.Response.BOOK_ALREADY_EXISTS: 406,
+    db.Response.WISHLIST_UPDATED: 200,
+    db.Response.AUTHOR_NONEXISTENT: 404,
+    db.Response.CHANGES_EXPIRED: 410
+}
+
+
+# UTILITY FUNCTIONS
+def response_headers(action_results:dict) -> list:
+    """Returns the (name, value) headers a db response calls for, e.g. Retry-After when BUSY
+    """
+    if action_results['STATUS'] == db.Response.BUSY:
+        return [('Retry-After', str(action_results['DATA']['retry_after']))]
+    return []
+
+def int_argument(args, name:str):
+    """Returns query argument `name` as an int, None if absent, or as given if it isn't an integer
+
+    Malformed values are passed on rather than dropped, so the db function
+    answers INVALID_REQUEST instead of silently falling back to its default.
+    """
+    value = args.get(name)
+    try:
+        return None if value is None else int(value)
+    except ValueError:
+        return value
+
+def page_arguments(args) -> dict:
+    """Reads the `limit`, `cursor` and `fields` query arguments shared by list endpoints
+    """
+    fields = args.get('fields')
+    return {
+        'limit': int_argument(args, 'limit'),
+        'cursor': args.get('cursor'),
+        'fields': fields.split(',') if fields else None
+    }
+
+def parse_ndjson_line(line:bytes) -> dict:
+    """Parses one NDJSON line, returning None if it is not valid JSON
+    """
+    try:
+        return json.loads(line)
+    except ValueError:
+        return None
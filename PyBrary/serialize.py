@@ -0,0 +1,158 @@
+# STANDARD LIBRARY
+import json
+import threading
+
+# 3RD PARTY MODULES
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# LOCAL MODULES
+from PyBrary import config
+from PyBrary.backends import TABLE_KEYS
+
+
+# GLOBAL
+# the stdlib fallback, configured like Flask's JSON provider (which also escapes non-ASCII)
+STDLIB_ENCODER = json.JSONEncoder(sort_keys=True, separators=(',', ':'))
+
+
+# FRAGMENT CACHE
+class FragmentCache:
+    """Bounded {key: (document, encoded document)} map, dropping the oldest entries first
+
+    Lookups happen once per document of every list response, so unlike
+    cache.LRUCache they take no lock and keep no recency order or stats;
+    only writes are serialized.
+    """
+    def __init__(self, max_size:int):
+        self.max_size = max_size
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key) -> bool:
+        return key in self._entries
+
+    def get(self, key):
+        return self._entries.get(key)
+
+    def put(self, key, document:dict, encoded:bytes) -> None:
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._entries.pop(key, None)
+            while len(self._entries) >= self.max_size:
+                del self._entries[next(iter(self._entries))]
+            self._entries[key] = (document, encoded)
+
+    def invalidate(self, key) -> None:
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries = {}
+
+
+# Encoded documents, keyed like their table. Each entry keeps the document it
+# encodes, so a fragment is only reused for an equal document; db.py also
+# drops the entry of every mutated key.
+FRAGMENTS = {table_name: FragmentCache(config.FRAGMENT_CACHE_SIZE) for table_name in TABLE_KEYS}
+
+
+# ENCODING
+def _plain(value) -> bool:
+    """Checks that `value` only holds types orjson encodes exactly like the stdlib json module
+    """
+    if value is None or isinstance(value, (str, bool, int)):
+        return True
+    if isinstance(value, dict):
+        for key, item in value.items():
+            if not isinstance(key, str):
+                return False
+            if item.__class__ is not str and not _plain(item):
+                return False
+        return True
+    if isinstance(value, list):
+        return all(_plain(item) for item in value)
+    # floats are formatted differently
+    return False
+
+def encode(value) -> bytes:
+    """Encodes `value` like Flask's JSON provider: sorted keys, compact separators, ASCII only
+
+    Uses orjson when it is installed and the output is known to be
+    identical, the stdlib otherwise.
+    """
+    if orjson is not None and _plain(value):
+        try:
+            encoded = orjson.dumps(value, option=orjson.OPT_SORT_KEYS)
+        except TypeError:
+            pass
+        else:
+            # orjson writes non-ASCII characters and DEL unescaped
+            if encoded.isascii() and b'\x7f' not in encoded:
+                return encoded
+    return STDLIB_ENCODER.encode(value).encode('ascii')
+
+def encode_record(document:dict, table_name:str) -> bytes:
+    """Encodes a document of `table_name`, reusing its cached encoding if the document is unchanged
+    """
+    if not isinstance(document, dict) or TABLE_KEYS[table_name] not in document:
+        return encode(document)
+    key = document[TABLE_KEYS[table_name]]
+    entry = FRAGMENTS[table_name].get(key)
+    if entry is not None and entry[0] == document:
+        return entry[1]
+    encoded = encode(document)
+    FRAGMENTS[table_name].put(key, document, encoded)
+    return encoded
+
+def encode_data(data, table_name:str) -> bytes:
+    """Encodes the DATA of a response: one document of `table_name`, a list of them, or a mapping to them
+    """
+    if isinstance(data, list):
+        # the per-document hot path of list responses, so encode_record's hit path is inlined
+        key_field = TABLE_KEYS[table_name]
+        lookup = FRAGMENTS[table_name].get
+        parts = []
+        for document in data:
+            entry = lookup(document.get(key_field)) if isinstance(document, dict) else None
+            if entry is not None and entry[0] == document:
+                parts.append(entry[1])
+            else:
+                parts.append(encode_record(document, table_name))
+        return b'[' + b','.join(parts) + b']'
+    if isinstance(data, dict) and TABLE_KEYS[table_name] not in data and all(isinstance(key, str) for key in data):
+        return b'{' + b','.join(encode(key) + b':' + encode_record(data[key], table_name)
+                                for key in sorted(data)) + b'}'
+    return encode_record(data, table_name)
+
+def dumps(action_results:dict, table_name:str=None) -> bytes:
+    """Encodes a `make_response` payload byte for byte like a Flask JSON response, trailing newline included
+
+    With `table_name`, documents of that table in DATA are encoded from
+    their cached fragments.
+    """
+    if table_name is None:
+        return encode(action_results) + b'\n'
+    parts = []
+    for key in sorted(action_results):
+        value = action_results[key]
+        encoded = encode_data(value, table_name) if key == 'DATA' else encode(value)
+        parts.append(encode(key) + b':' + encoded)
+    return b'{' + b','.join(parts) + b'}\n'
+
+def invalidate(table_name:str, *keys) -> None:
+    """Drops the cached encodings of the documents stored under `keys`
+    """
+    for key in keys:
+        FRAGMENTS[table_name].invalidate(key)
+
+def clear() -> None:
+    for cache in FRAGMENTS.values():
+        cache.clear()
@@ -0,0 +1,207 @@
+# STANDARD LIBRARY
+import argparse
+import json
+import mmap
+import os
+import struct
+from collections.abc import MutableMapping
+from typing import Iterator
+
+# 3RD PARTY MODULES
+from tinydb.storages import Storage
+
+
+# GLOBAL
+# File layout:
+#   MAGIC | header length (uint32) | header (JSON) | record | record | ...
+# Every record is a uint32 byte length followed by one JSON document. The
+# header maps each table to [doc_id, key, offset, length] entries, offsets
+# relative to the first record, so a reader finds any document without
+# parsing the ones before it.
+MAGIC = b'PYBSNAP1'
+LENGTH = struct.Struct('<I')
+
+
+# EXCEPTIONS
+class SnapshotError(ValueError):
+    """Raised when a file is not a readable snapshot
+    """
+
+
+# UTILITY CLASSES
+class _Record:
+    """A stored document that has not been decoded yet
+    """
+    __slots__ = ('key', 'offset', 'length')
+
+    def __init__(self, key, offset:int, length:int):
+        self.key = key
+        self.offset = offset
+        self.length = length
+
+
+class LazyDocuments(MutableMapping):
+    """{doc_id: document} mapping over a snapshot buffer that decodes documents on first access
+
+    Documents written to the mapping replace their records; iteration order
+    is insertion order, like the dict TinyDB would otherwise hold.
+    """
+    def __init__(self, buffer, base:int, entries:list, key_field:str=None):
+        self._buffer = buffer
+        self._key_field = key_field
+        self._entries = {doc_id: _Record(key, base + offset, length)
+                         for doc_id, key, offset, length in entries}
+
+    def _decode(self, record:_Record) -> dict:
+        start = record.offset + LENGTH.size
+        return json.loads(bytes(self._buffer[start:start + record.length]))
+
+    def __getitem__(self, doc_id:str) -> dict:
+        entry = self._entries[doc_id]
+        if isinstance(entry, _Record):
+            entry = self._entries[doc_id] = self._decode(entry)
+        return entry
+
+    def __setitem__(self, doc_id:str, document:dict) -> None:
+        self._entries[doc_id] = document
+
+    def __delitem__(self, doc_id:str) -> None:
+        del self._entries[doc_id]
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._entries)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, doc_id) -> bool:
+        return doc_id in self._entries
+
+    def decoded(self) -> int:
+        """Returns how many documents have been decoded so far
+        """
+        return sum(not isinstance(entry, _Record) for entry in self._entries.values())
+
+    def field_items(self, field:str) -> Iterator[tuple]:
+        """Yields (doc_id, document[field]), reading the key field from the header without decoding
+        """
+        for doc_id, entry in self._entries.items():
+            if isinstance(entry, _Record) and field == self._key_field:
+                yield doc_id, entry.key
+            else:
+                yield doc_id, self[doc_id][field]
+
+    def encoded_items(self) -> Iterator[tuple]:
+        """Yields (doc_id, encoded document); undecoded records are copied without re-encoding
+        """
+        for doc_id, entry in self._entries.items():
+            if isinstance(entry, _Record):
+                start = entry.offset + LENGTH.size
+                yield doc_id, entry.key, bytes(self._buffer[start:start + entry.length])
+            else:
+                yield doc_id, entry.get(self._key_field), encode(entry)
+
+
+# UTILITY FUNCTIONS
+def encode(document:dict) -> bytes:
+    return json.dumps(document, separators=(',', ':')).encode('utf-8')
+
+def _encoded_items(documents, key_field:str) -> Iterator[tuple]:
+    if isinstance(documents, LazyDocuments):
+        return documents.encoded_items()
+    return ((doc_id, document.get(key_field), encode(document))
+            for doc_id, document in documents.items())
+
+def write_snapshot(path:str, tables:dict, keys:dict=None) -> None:
+    """Atomically writes {table_name: {doc_id: document}} to `path` as a snapshot
+
+    `keys` maps table names to the field stored in the header for each record.
+    """
+    keys = keys or {}
+    header = {'tables': {}}
+    records = []
+    offset = 0
+    for table_name, documents in tables.items():
+        entries = header['tables'][table_name] = []
+        for doc_id, key, data in _encoded_items(documents, keys.get(table_name)):
+            entries.append([doc_id, key, offset, len(data)])
+            records.append(LENGTH.pack(len(data)))
+            records.append(data)
+            offset += LENGTH.size + len(data)
+    header['keys'] = {table_name: keys.get(table_name) for table_name in tables}
+    encoded_header = encode(header)
+    temp_path = path + '.tmp'
+    with open(temp_path, 'wb') as f:
+        f.write(MAGIC)
+        f.write(LENGTH.pack(len(encoded_header)))
+        f.write(encoded_header)
+        f.writelines(records)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp_path, path)
+
+def read_snapshot(buffer) -> dict:
+    """Returns {table_name: LazyDocuments} for a snapshot held in `buffer`; only the header is parsed
+    """
+    if bytes(buffer[:len(MAGIC)]) != MAGIC:
+        raise SnapshotError("not a PyBrary snapshot")
+    start = len(MAGIC)
+    (header_length,) = LENGTH.unpack_from(buffer, start)
+    start += LENGTH.size
+    header = json.loads(bytes(buffer[start:start + header_length]))
+    base = start + header_length
+    return {table_name: LazyDocuments(buffer, base, entries, header['keys'].get(table_name))
+            for table_name, entries in header['tables'].items()}
+
+def convert(source:str, destination:str, keys:dict=None) -> None:
+    """Converts `example_data.json` ({table: [document, ...]}) or a TinyDB JSON file to a snapshot
+    """
+    with open(source) as f:
+        data = json.load(f)
+    tables = {}
+    for table_name, documents in data.items():
+        if isinstance(documents, list):
+            documents = {str(doc_id): document for doc_id, document in enumerate(documents, 1)}
+        tables[table_name] = documents
+    write_snapshot(destination, tables, keys)
+
+
+# STORAGE
+class SnapshotStorage(Storage):
+    """TinyDB storage backed by a memory-mapped snapshot file
+
+    Opening only parses the header; documents are decoded as TinyDB touches
+    them. Meant to sit under `CachingMiddleware`, which keeps the tables
+    returned by `read` and hands them back to `write` when flushing.
+    """
+    def __init__(self, path:str, keys:dict=None):
+        self.path = path
+        self.keys = keys or {}
+        self._file = None
+        self._buffer = None
+
+    def read(self) -> dict:
+        if not os.path.exists(self.path) or os.path.getsize(self.path) == 0:
+            return None
+        self._file = open(self.path, 'rb')
+        self._buffer = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        return read_snapshot(self._buffer)
+
+    def write(self, data:dict) -> None:
+        # the mapping of a replaced file stays valid, so undecoded records remain readable
+        write_snapshot(self.path, data, self.keys)
+
+    def close(self) -> None:
+        if self._buffer is not None:
+            self._buffer.close()
+            self._file.close()
+            self._buffer = self._file = None
+
+
+if __name__ == '__main__':
+    from PyBrary.backends import TABLE_KEYS
+    parser = argparse.ArgumentParser(description="Convert example data or a TinyDB file to a snapshot")
+    parser.add_argument('source')
+    parser.add_argument('destination')
+    arguments = parser.parse_args()
+    convert(arguments.source, arguments.destination, TABLE_KEYS)
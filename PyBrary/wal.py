@@ -0,0 +1,179 @@
+# STANDARD LIBRARY
+import glob
+import json
+import os
+import threading
+from typing import Iterator
+
+
+# UTILITY FUNCTIONS
+def apply_operations(data:dict, operations:list) -> None:
+    """Applies logged [table_name, doc_id, document] operations to TinyDB-style data in place
+
+    A None document is a delete. Operations carry whole documents, so
+    replaying a log over a snapshot that already contains it is harmless.
+    """
+    for table_name, doc_id, document in operations:
+        table = data.setdefault(table_name, {})
+        if document is None:
+            table.pop(doc_id, None)
+        else:
+            table[doc_id] = document
+
+def read_segment(path:str) -> Iterator[dict]:
+    """Yields the commit records of a log segment, stopping at the first unreadable line
+
+    An unreadable line is the tail of a commit torn by a crash, which was
+    never acknowledged to its caller.
+    """
+    with open(path) as f:
+        for line in f:
+            try:
+                yield json.loads(line)
+            except ValueError:
+                return
+
+def read_snapshot(path:str) -> dict:
+    if not os.path.exists(path) or os.path.getsize(path) == 0:
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+def write_snapshot(path:str, data:dict) -> None:
+    """Atomically replaces the snapshot at `path`, so a crash leaves the old one intact
+    """
+    temp_path = path + '.tmp'
+    with open(temp_path, 'w') as f:
+        json.dump(data, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp_path, path)
+
+
+# WRITE-AHEAD LOG
+class WriteAheadLog:
+    """Append-only log of committed transactions next to a JSON snapshot
+
+    Each commit is one JSON line, {"lsn": ..., "ops": [...]}, in the current
+    segment file `<path>.wal.<n>`. `sync` makes commits durable with group
+    commit: whichever committer gets to fsync first covers everything
+    appended so far, and committers whose records were covered return
+    without an fsync of their own. `rotate` closes the current segment and
+    `compact` folds closed segments into the snapshot, which readers of the
+    database never need to wait for.
+    """
+    def __init__(self, path:str, fsync:bool=True):
+        self.path = path
+        self.fsync = fsync
+        self._lsn = 0
+        self._synced_lsn = 0
+        self._append_lock = threading.Lock()
+        self._sync_lock = threading.Lock()
+        self._compact_lock = threading.Lock()
+        segments = self.segments()
+        self._segment = segments[-1][0] + 1 if segments else 1
+        self._file = open(self._segment_path(self._segment), 'a')
+
+    def _segment_path(self, number:int) -> str:
+        return f"{self.path}.wal.{number}"
+
+    @classmethod
+    def destroy(cls, path:str) -> None:
+        for segment_path in glob.glob(glob.escape(path) + '.wal.*'):
+            os.remove(segment_path)
+
+    def segments(self) -> list:
+        """Returns (number, path) for every segment on disk, oldest first
+        """
+        segments = []
+        for segment_path in glob.glob(glob.escape(self.path) + '.wal.*'):
+            suffix = segment_path.rsplit('.', 1)[1]
+            if suffix.isdigit():
+                segments.append((int(suffix), segment_path))
+        return sorted(segments)
+
+    @property
+    def size(self) -> int:
+        """Bytes written to the current segment
+        """
+        # `rotate` swaps the file under this lock
+        with self._append_lock:
+            return self._file.tell()
+
+    def recover(self) -> dict:
+        """Loads the snapshot and replays every segment over it
+        """
+        data = read_snapshot(self.path)
+        for _, segment_path in self.segments():
+            for record in read_segment(segment_path):
+                apply_operations(data, record['ops'])
+                self._lsn = max(self._lsn, record['lsn'])
+        self._synced_lsn = self._lsn
+        return data
+
+    def append(self, operations:list) -> int:
+        """Appends one commit's operations and returns its log sequence number
+        """
+        with self._append_lock:
+            self._lsn += 1
+            self._file.write(json.dumps({'lsn': self._lsn, 'ops': operations}) + '\n')
+            return self._lsn
+
+    def sync(self, lsn:int) -> None:
+        """Returns once the commit `lsn` is on disk, sharing fsyncs between concurrent committers
+        """
+        with self._sync_lock:
+            if self._synced_lsn >= lsn:
+                return
+            with self._append_lock:
+                target = self._lsn
+                self._file.flush()
+                fileno = self._file.fileno()
+            if self.fsync:
+                os.fsync(fileno)
+            self._synced_lsn = target
+
+    def rotate(self) -> None:
+        """Starts a new segment; earlier segments become eligible for compaction
+        """
+        with self._sync_lock, self._append_lock:
+            self._file.flush()
+            if self.fsync:
+                os.fsync(self._file.fileno())
+            self._synced_lsn = self._lsn
+            self._file.close()
+            self._segment += 1
+            self._file = open(self._segment_path(self._segment), 'a')
+
+    def compact(self) -> None:
+        """Folds every closed segment into the snapshot, then deletes those segments
+        """
+        with self._compact_lock:
+            closed = [(number, segment_path) for number, segment_path in self.segments()
+                      if number < self._segment]
+            if not closed:
+                return
+            data = read_snapshot(self.path)
+            for _, segment_path in closed:
+                for record in read_segment(segment_path):
+                    apply_operations(data, record['ops'])
+            write_snapshot(self.path, data)
+            for _, segment_path in closed:
+                os.remove(segment_path)
+
+    def checkpoint(self, data:dict) -> None:
+        """Writes `data`, the complete current state, as the snapshot and drops every segment
+        """
+        with self._compact_lock:
+            self.rotate()
+            write_snapshot(self.path, data)
+            for number, segment_path in self.segments():
+                if number < self._segment:
+                    os.remove(segment_path)
+
+    def close(self) -> None:
+        with self._sync_lock, self._append_lock:
+            self._file.flush()
+            if self.fsync:
+                os.fsync(self._file.fileno())
+            self._file.close()
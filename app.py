@@ -1,43 +1,128 @@
 # STANDARD LIBRARY
+import atexit
 import json
 import pdb
+import time
+from typing import Iterable, Iterator
 
 # 3RD PARTY MODULES
-from flask import Flask, request
+from flask import Flask, Response, g, request, stream_with_context
 
 # LOCAL MODULES
-from PyBrary import db
+from PyBrary import config, db, metrics, serialize
+from PyBrary.responses import STATUS_CODE, int_argument, page_arguments, parse_ndjson_line, response_headers
 
 
 # SETUP
 app = Flask(__name__)
+db.open_database()
+atexit.register(db.close_database)
+db.start_reconciler()
+atexit.register(db.stop_reconciler)
 
-STATUS_CODE = {
-    db.Response.SUCCESS: 200,
-    db.Response.FAILURE: 500,
-    db.Response.USER_CREATED: 201,
-    db.Response.USER_UPDATED: 200,
-    db.Response.USER_REMOVED: 200,
-    db.Response.USER_NONEXISTENT: 404,
-    db.Response.USER_ALREADY_EXISTS: 406,
-    db.Response.BOOK_CREATED: 201,
-    db.Response.BOOK_UPDATED: 200,
-    db.Response.BOOK_REMOVED: 200,
-    db.Response.BOOK_NONEXISTENT: 404,
-    db.Response.BOOK_ALREADY_EXISTS: 406,
-    db.Response.WISHLIST_UPDATED: 200
-}
+# UTILITY FUNCTIONS
+def ndjson_response(documents:Iterator[dict]) -> Response:
+    """Streams documents to the client as chunked newline-delimited JSON
+    """
+    lines = (json.dumps(document) + '\n' for document in documents)
+    return Response(stream_with_context(lines), mimetype='application/x-ndjson')
+
+def bulk_records() -> Iterable[dict]:
+    """Reads the records of a bulk upload, or returns None if the body is unusable
+
+    Accepts a JSON array, or newline-delimited JSON (`application/x-ndjson`)
+    which is parsed lazily from the request stream.
+    """
+    if request.mimetype == 'application/x-ndjson':
+        return (parse_ndjson_line(line) for line in request.stream if line.strip())
+    records = request.get_json(silent=True)
+    if not isinstance(records, list):
+        return None
+    return records
+
+def not_modified(version:str) -> Response:
+    """Returns a 304 response if the client's copy (If-None-Match) is at `version`, otherwise None
+    """
+    if request.if_none_match.contains_weak(version):
+        response = Response(status=304)
+        response.set_etag(version)
+        return response
+    return None
+
+def json_response(action_results:dict, table_name:str=None) -> Response:
+    """Builds the usual JSON response, encoding documents of `table_name` in DATA from cached fragments
+
+    Output is byte for byte what Flask's JSON provider would produce; when
+    the provider is configured to format differently (e.g. pretty printed
+    in debug mode) it is used instead.
+    """
+    status = STATUS_CODE[action_results['STATUS']]
+    headers = response_headers(action_results)
+    provider = app.json
+    pretty = provider.compact is False or (provider.compact is None and app.debug)
+    if pretty or not getattr(provider, 'sort_keys', False) or not getattr(provider, 'ensure_ascii', False):
+        return app.make_response((action_results, status, headers))
+    return Response(serialize.dumps(action_results, table_name), status=status, headers=headers,
+                    mimetype=provider.mimetype)
+
+def tagged_response(action_results:dict, version:str, table_name:str=None) -> Response:
+    """Builds the usual JSON response, tagging successful ones with `version` as their ETag
+    """
+    response = json_response(action_results, table_name)
+    if response.status_code == 200:
+        response.set_etag(version)
+    return response
+
+def sse_events(after:str) -> Iterator[str]:
+    """Formats the change feed after cursor `after` as Server-Sent Events, with keepalive comments
+    """
+    try:
+        for change in db.iter_changes(after, wait=config.SSE_KEEPALIVE):
+            if change is None:
+                yield ": keepalive\n\n"
+            else:
+                yield f"id: {change['SEQ']}\nevent: change\ndata: {json.dumps(change)}\n\n"
+    except db.ChangesExpired:
+        yield "event: expired\ndata: {}\n\n"
+
+# INSTRUMENTATION
+@app.before_request
+def start_timer():
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def record_request_time(response:Response) -> Response:
+    """Records the time spent on the request, by route pattern, once the response body is built
+    """
+    route = request.url_rule.rule if request.url_rule is not None else '<unmatched>'
+    metrics.observe_request(route, request.method, response.status_code,
+                            time.perf_counter() - g.request_started)
+    return response
 
 # BASELINE ENDPOINTS
 @app.route("/api/v1/heartbeat", methods=['GET'])
 def heartbeat():
     return { "status": "OK" }, 200
 
+@app.route("/api/v1/metrics", methods=['GET'])
+def prometheus_metrics():
+    """Timing histograms of db operations and requests in the Prometheus text format
+    """
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
 # USER ENDPOINTS
 @app.route("/api/v1/users", methods=['GET', 'POST'])
 def users():
     if request.method == 'GET':
-        action_results = db.get_all_users()
+        version = db.get_version(db.USERS_TABLE)
+        response = not_modified(version)
+        if response is not None:
+            return response
+        action_results = db.get_all_users(
+                **page_arguments(request.args),
+                first_name=request.args.get('first_name'),
+                last_name=request.args.get('last_name'))
+        return tagged_response(action_results, version, db.USERS_TABLE)
     elif request.method == 'POST':
         data = request.json
         action_results = db.add_user(
@@ -48,10 +133,23 @@ def users():
                 wishlist=data['wishlist'])
     return action_results, STATUS_CODE[action_results['STATUS']]
 
+@app.route("/api/v1/users/bulk", methods=['POST'])
+def bulk_add_users():
+    records = bulk_records()
+    if records is None:
+        action_results = db.make_response(status=db.Response.INVALID_REQUEST)
+    else:
+        action_results = db.add_users(records, batch_size=int_argument(request.args, 'batch_size'))
+    return action_results, STATUS_CODE[action_results['STATUS']]
+
 @app.route("/api/v1/users/<email>", methods=['GET', 'PUT', 'DELETE'])
 def user(email):
     if request.method == 'GET':
-        action_results = db.get_user(email=email)
+        version = db.get_version(db.USERS_TABLE, email)
+        response = not_modified(version)
+        if response is not None:
+            return response
+        return tagged_response(db.get_user(email=email), version, db.USERS_TABLE)
     elif request.method == 'PUT':
         data = request.json
         action_results = db.update_user(email=email, data=data)
@@ -59,30 +157,51 @@ def user(email):
         action_results = db.remove_user(email=email)
     return action_results, STATUS_CODE[action_results['STATUS']]
 
+@app.route("/api/v1/users/export", methods=['GET'])
+def export_users():
+    return ndjson_response(db.iter_users())
+
 # WISHLIST ENDPOINTS
 @app.route("/api/v1/users/<email>/wishlist", methods=['GET', 'POST'])
 def wishlist(email):
     """Interact with user's wishlist
     
+    GET - ?expand=books returns full book records instead of titles
     POST - add item to wishlist
     data = { 'isbn': '9828302754' }
     """
     if request.method == 'GET':
-        action_results = db.get_wishlist(email=email)
+        expand = request.args.get('expand') == 'books'
+        # titles and expanded records are read from the books, so they change with them too
+        version = db.get_version(db.USERS_TABLE, email) + '-' + db.get_version(db.BOOKS_TABLE)
+        response = not_modified(version)
+        if response is not None:
+            return response
+        return tagged_response(db.get_wishlist(email=email, expand=expand), version,
+                               db.BOOKS_TABLE if expand else None)
     elif request.method == 'POST':
         action_results = db.add_to_wishlist(email=email, isbn=request.json['isbn'])
-    return action_results, STATUS_CODE[action_results['STATUS']]
+    return json_response(action_results)
 
 @app.route("/api/v1/users/<email>/wishlist/<isbn>", methods=['DELETE'])
 def remove_from_wishlist(email, isbn):
     action_results = db.remove_from_wishlist(email=email, isbn=isbn)
-    return action_results, STATUS_CODE[action_results['STATUS']]
+    return json_response(action_results)
 
 # BOOK ENDPOINTS
 @app.route("/api/v1/books", methods=['GET', 'POST'])
 def books():
     if request.method == 'GET':
-        action_results = db.get_all_books()
+        version = db.get_version(db.BOOKS_TABLE)
+        response = not_modified(version)
+        if response is not None:
+            return response
+        action_results = db.get_all_books(
+                **page_arguments(request.args),
+                author=request.args.get('author'),
+                published_after=request.args.get('published_after'),
+                published_before=request.args.get('published_before'))
+        return tagged_response(action_results, version, db.BOOKS_TABLE)
     elif request.method == 'POST':
         data = request.json
         action_results = db.add_book(
@@ -92,10 +211,102 @@ def books():
                 publication_date=data['publication_date'])
     return action_results, STATUS_CODE[action_results['STATUS']]
 
+@app.route("/api/v1/books/search", methods=['GET'])
+def search_books():
+    version = db.get_version(db.BOOKS_TABLE)
+    response = not_modified(version)
+    if response is not None:
+        return response
+    action_results = db.search_books(
+            query=request.args.get('q', ''),
+            limit=int_argument(request.args, 'limit'))
+    return tagged_response(action_results, version, db.BOOKS_TABLE)
+
+@app.route("/api/v1/books/batch_get", methods=['POST'])
+def batch_get_books():
+    """Get many books in one request
+
+    data = { 'isbns': ['0593395565', ...] }
+    """
+    data = request.get_json(silent=True)
+    action_results = db.get_books(isbns=data.get('isbns') if isinstance(data, dict) else None)
+    return json_response(action_results, db.BOOKS_TABLE)
+
+@app.route("/api/v1/books/bulk", methods=['POST'])
+def bulk_add_books():
+    records = bulk_records()
+    if records is None:
+        action_results = db.make_response(status=db.Response.INVALID_REQUEST)
+    else:
+        action_results = db.add_books(records, batch_size=int_argument(request.args, 'batch_size'))
+    return action_results, STATUS_CODE[action_results['STATUS']]
+
+@app.route("/api/v1/books/export", methods=['GET'])
+def export_books():
+    return ndjson_response(db.iter_books())
+
 @app.route("/api/v1/books/<isbn>", methods=['GET', 'DELETE'])
 def book(isbn):
     if request.method == 'GET':
-        action_results = db.get_book(isbn=isbn)
+        version = db.get_version(db.BOOKS_TABLE, isbn)
+        response = not_modified(version)
+        if response is not None:
+            return response
+        return tagged_response(db.get_book(isbn=isbn), version, db.BOOKS_TABLE)
     elif request.method == 'DELETE':
-        action_results = db.remove_book(isbn=isbn)
-    return action_results, STATUS_CODE[action_results['STATUS']]
\ No newline at end of file
+        cascade = request.args.get('cascade', '').lower() in ('1', 'true', 'yes')
+        action_results = db.remove_book(isbn=isbn, cascade=cascade)
+    return action_results, STATUS_CODE[action_results['STATUS']]
+
+@app.route("/api/v1/books/<isbn>/wishers", methods=['GET'])
+def book_wishers(isbn):
+    # a removed book answers 404 however its wishers stand, so its version is part of the tag too
+    version = db.get_version(db.USERS_TABLE) + '-' + db.get_version(db.BOOKS_TABLE, isbn)
+    response = not_modified(version)
+    if response is not None:
+        return response
+    action_results = db.get_wishers(
+            isbn=isbn,
+            limit=int_argument(request.args, 'limit'),
+            cursor=request.args.get('cursor'))
+    return tagged_response(action_results, version)
+
+# AUTHOR ENDPOINTS
+@app.route("/api/v1/authors", methods=['GET'])
+def authors():
+    version = db.get_version(db.BOOKS_TABLE)
+    response = not_modified(version)
+    if response is not None:
+        return response
+    return tagged_response(db.get_authors(), version)
+
+@app.route("/api/v1/authors/<name>/books", methods=['GET'])
+def author_books(name):
+    version = db.get_version(db.BOOKS_TABLE)
+    response = not_modified(version)
+    if response is not None:
+        return response
+    return tagged_response(db.get_books_by_author(author=name), version, db.BOOKS_TABLE)
+
+# CHANGE FEED ENDPOINTS
+@app.route("/api/v1/changes", methods=['GET'])
+def changes():
+    """Long-poll for committed changes after the `after` cursor
+    """
+    action_results = db.get_changes(
+            after=request.args.get('after'),
+            limit=int_argument(request.args, 'limit'),
+            wait=request.args.get('wait', 0, type=float))
+    return action_results, STATUS_CODE[action_results['STATUS']]
+
+@app.route("/api/v1/changes/stream", methods=['GET'])
+def change_stream():
+    """Stream committed changes as Server-Sent Events, resuming after `Last-Event-ID` or `after`
+    """
+    after = request.headers.get('Last-Event-ID') or request.args.get('after')
+    # validate the cursor before committing to a 200 stream
+    action_results = db.get_changes(after=after, limit=0)
+    if action_results['STATUS'] != db.Response.SUCCESS:
+        return action_results, STATUS_CODE[action_results['STATUS']]
+    return Response(stream_with_context(sse_events(after)), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache'})
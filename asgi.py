@@ -0,0 +1,375 @@
+# ASGI entry point serving the same API as app.py without tying up a thread
+# per open connection: `uvicorn asgi:application`. Storage access runs on the
+# bounded executor in PyBrary/aio.py; payloads and status codes match app.py.
+
+# STANDARD LIBRARY
+import asyncio
+import json
+import math
+import time
+import traceback
+from urllib.parse import parse_qsl
+
+# 3RD PARTY MODULES
+from werkzeug.datastructures import Headers, MultiDict
+from werkzeug.exceptions import HTTPException
+from werkzeug.http import parse_etags, quote_etag
+from werkzeug.routing import Map, Rule
+
+# LOCAL MODULES
+from PyBrary import aio, config, db, metrics, serialize
+from PyBrary.responses import STATUS_CODE, int_argument, page_arguments, parse_ndjson_line, response_headers
+
+
+# UTILITY CLASSES
+class Request:
+    """The parts of an HTTP request the handlers need, read from an ASGI scope and body
+    """
+    def __init__(self, scope:dict, body:bytes):
+        self.method = scope['method']
+        self.path = scope['path']
+        self.args = MultiDict(parse_qsl(scope.get('query_string', b'').decode('latin-1'), keep_blank_values=True))
+        self.headers = Headers([(key.decode('latin-1'), value.decode('latin-1'))
+                                for key, value in scope.get('headers', ())])
+        self.body = body
+
+    @property
+    def mimetype(self) -> str:
+        return self.headers.get('Content-Type', '').split(';')[0].strip().lower()
+
+    @property
+    def json(self):
+        """The JSON body, or None if there is none or it does not parse
+        """
+        try:
+            return json.loads(self.body)
+        except ValueError:
+            return None
+
+
+class Response:
+    """A response body (bytes, or an async iterator of bytes for streaming), status and headers
+    """
+    def __init__(self, body=b'', status:int=200, headers:list=None, mimetype:str='application/json'):
+        self.body = body
+        self.status = status
+        self.headers = headers or []
+        if mimetype is not None:
+            self.headers.append(('Content-Type', mimetype))
+
+    async def send(self, send, include_body:bool=True) -> None:
+        headers = [(key.lower().encode('latin-1'), value.encode('latin-1')) for key, value in self.headers]
+        if isinstance(self.body, bytes):
+            headers.append((b'content-length', str(len(self.body)).encode()))
+        await send({'type': 'http.response.start', 'status': self.status, 'headers': headers})
+        if isinstance(self.body, bytes) or not include_body:
+            await send({'type': 'http.response.body', 'body': self.body if include_body else b''})
+            return
+        async for chunk in self.body:
+            await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+        await send({'type': 'http.response.body', 'body': b''})
+
+
+# UTILITY FUNCTIONS
+def dumps(data) -> bytes:
+    """Encodes `data` exactly like Flask's JSON responses: sorted keys, compact, trailing newline
+    """
+    return serialize.encode(data) + b'\n'
+
+def json_response(action_results:dict, table_name:str=None) -> Response:
+    """Encodes a payload like app.py, documents of `table_name` in DATA from cached fragments
+    """
+    return Response(serialize.dumps(action_results, table_name), STATUS_CODE[action_results['STATUS']],
+                    response_headers(action_results))
+
+def ndjson_response(documents) -> Response:
+    async def lines():
+        async for document in documents:
+            yield (json.dumps(document) + '\n').encode('utf-8')
+    return Response(lines(), mimetype='application/x-ndjson')
+
+def bulk_records(request:Request) -> list:
+    """Reads the records of a bulk upload (JSON array or NDJSON), or returns None if the body is unusable
+    """
+    if request.mimetype == 'application/x-ndjson':
+        return [parse_ndjson_line(line) for line in request.body.splitlines() if line.strip()]
+    records = request.json
+    if not isinstance(records, list):
+        return None
+    return records
+
+def not_modified(request:Request, version:str) -> Response:
+    """Returns a 304 response if the client's copy (If-None-Match) is at `version`, otherwise None
+    """
+    if parse_etags(request.headers.get('If-None-Match')).contains_weak(version):
+        return Response(status=304, headers=[('ETag', quote_etag(version))], mimetype=None)
+    return None
+
+def tagged_response(action_results:dict, version:str, table_name:str=None) -> Response:
+    response = json_response(action_results, table_name)
+    if response.status == 200:
+        response.headers.append(('ETag', quote_etag(version)))
+    return response
+
+async def cached_read(request:Request, version:str, read, table_name:str=None) -> Response:
+    """Answers a conditional GET with 304, or awaits `read()` and tags the result with `version`
+    """
+    response = not_modified(request, version)
+    if response is not None:
+        return response
+    return tagged_response(await read(), version, table_name)
+
+
+# BASELINE ENDPOINTS
+async def heartbeat(request:Request) -> Response:
+    return Response(dumps({"status": "OK"}))
+
+async def prometheus_metrics(request:Request) -> Response:
+    return Response(metrics.render().encode('utf-8'), mimetype='text/plain; version=0.0.4')
+
+# USER ENDPOINTS
+async def users(request:Request) -> Response:
+    if request.method == 'GET':
+        version = await aio.get_version(db.USERS_TABLE)
+        return await cached_read(request, version, lambda: aio.get_all_users(
+                **page_arguments(request.args),
+                first_name=request.args.get('first_name'),
+                last_name=request.args.get('last_name')), db.USERS_TABLE)
+    data = request.json
+    return json_response(await aio.add_user(
+            first_name=data['first_name'],
+            last_name=data['last_name'],
+            email=data['email'],
+            password=data['password'],
+            wishlist=data['wishlist']))
+
+async def bulk_add_users(request:Request) -> Response:
+    records = bulk_records(request)
+    if records is None:
+        return json_response(db.make_response(status=db.Response.INVALID_REQUEST))
+    return json_response(await aio.add_users(records, batch_size=int_argument(request.args, 'batch_size')))
+
+async def user(request:Request, email:str) -> Response:
+    if request.method == 'GET':
+        version = await aio.get_version(db.USERS_TABLE, email)
+        return await cached_read(request, version, lambda: aio.get_user(email=email), db.USERS_TABLE)
+    elif request.method == 'PUT':
+        return json_response(await aio.update_user(email=email, data=request.json))
+    return json_response(await aio.remove_user(email=email))
+
+async def export_users(request:Request) -> Response:
+    return ndjson_response(aio.iter_users())
+
+# WISHLIST ENDPOINTS
+async def wishlist(request:Request, email:str) -> Response:
+    if request.method == 'GET':
+        expand = request.args.get('expand') == 'books'
+        version = await aio.get_version(db.USERS_TABLE, email) + '-' + await aio.get_version(db.BOOKS_TABLE)
+        return await cached_read(request, version, lambda: aio.get_wishlist(email=email, expand=expand),
+                                 db.BOOKS_TABLE if expand else None)
+    return json_response(await aio.add_to_wishlist(email=email, isbn=request.json['isbn']))
+
+async def remove_from_wishlist(request:Request, email:str, isbn:str) -> Response:
+    return json_response(await aio.remove_from_wishlist(email=email, isbn=isbn))
+
+# BOOK ENDPOINTS
+async def books(request:Request) -> Response:
+    if request.method == 'GET':
+        version = await aio.get_version(db.BOOKS_TABLE)
+        return await cached_read(request, version, lambda: aio.get_all_books(
+                **page_arguments(request.args),
+                author=request.args.get('author'),
+                published_after=request.args.get('published_after'),
+                published_before=request.args.get('published_before')), db.BOOKS_TABLE)
+    data = request.json
+    return json_response(await aio.add_book(
+            title=data['title'],
+            author=data['author'],
+            isbn=data['isbn'],
+            publication_date=data['publication_date']))
+
+async def search_books(request:Request) -> Response:
+    version = await aio.get_version(db.BOOKS_TABLE)
+    return await cached_read(request, version, lambda: aio.search_books(
+            query=request.args.get('q', ''),
+            limit=int_argument(request.args, 'limit')), db.BOOKS_TABLE)
+
+async def batch_get_books(request:Request) -> Response:
+    data = request.json
+    return json_response(await aio.get_books(isbns=data.get('isbns') if isinstance(data, dict) else None),
+                         db.BOOKS_TABLE)
+
+async def bulk_add_books(request:Request) -> Response:
+    records = bulk_records(request)
+    if records is None:
+        return json_response(db.make_response(status=db.Response.INVALID_REQUEST))
+    return json_response(await aio.add_books(records, batch_size=int_argument(request.args, 'batch_size')))
+
+async def export_books(request:Request) -> Response:
+    return ndjson_response(aio.iter_books())
+
+async def book(request:Request, isbn:str) -> Response:
+    if request.method == 'GET':
+        version = await aio.get_version(db.BOOKS_TABLE, isbn)
+        return await cached_read(request, version, lambda: aio.get_book(isbn=isbn), db.BOOKS_TABLE)
+    cascade = request.args.get('cascade', '').lower() in ('1', 'true', 'yes')
+    return json_response(await aio.remove_book(isbn=isbn, cascade=cascade))
+
+async def book_wishers(request:Request, isbn:str) -> Response:
+    version = await aio.get_version(db.USERS_TABLE) + '-' + await aio.get_version(db.BOOKS_TABLE, isbn)
+    return await cached_read(request, version, lambda: aio.get_wishers(
+            isbn=isbn,
+            limit=int_argument(request.args, 'limit'),
+            cursor=request.args.get('cursor')))
+
+# AUTHOR ENDPOINTS
+async def authors(request:Request) -> Response:
+    version = await aio.get_version(db.BOOKS_TABLE)
+    return await cached_read(request, version, aio.get_authors)
+
+async def author_books(request:Request, name:str) -> Response:
+    version = await aio.get_version(db.BOOKS_TABLE)
+    return await cached_read(request, version, lambda: aio.get_books_by_author(author=name), db.BOOKS_TABLE)
+
+
+# CHANGE FEED ENDPOINTS
+class ChangeWaiter:
+    """Wakes a coroutine when the change log moves, without holding a thread while it waits
+    """
+    def __init__(self):
+        self._loop = asyncio.get_running_loop()
+        self._event = asyncio.Event()
+
+    def __call__(self) -> None:
+        self._loop.call_soon_threadsafe(self._event.set)
+
+    def __enter__(self):
+        db.CHANGES.subscribe(self)
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        db.CHANGES.unsubscribe(self)
+
+    async def wait(self, timeout:float) -> bool:
+        """Returns True if the log moved within `timeout` seconds
+        """
+        try:
+            await asyncio.wait_for(self._event.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+        finally:
+            self._event.clear()
+
+async def changes(request:Request) -> Response:
+    after = request.args.get('after')
+    limit = int_argument(request.args, 'limit')
+    wait = request.args.get('wait', 0, type=float)
+    if not math.isfinite(wait):
+        return json_response(db.make_response(status=db.Response.INVALID_REQUEST))
+    # subscribe before reading so a change committed in between still wakes us
+    with ChangeWaiter() as waiter:
+        action_results = await aio.get_changes(after=after, limit=limit, wait=min(wait, 0))
+        if action_results['STATUS'] == db.Response.SUCCESS and not action_results['DATA'] and wait > 0:
+            if await waiter.wait(min(wait, config.MAX_CHANGE_WAIT)):
+                action_results = await aio.get_changes(after=after, limit=limit)
+    return json_response(action_results)
+
+async def change_stream(request:Request) -> Response:
+    after = request.headers.get('Last-Event-ID') or request.args.get('after')
+    action_results = await aio.get_changes(after=after, limit=0)
+    if action_results['STATUS'] != db.Response.SUCCESS:
+        return json_response(action_results)
+
+    async def events():
+        cursor = after
+        with ChangeWaiter() as waiter:
+            while True:
+                action_results = await aio.get_changes(after=cursor, limit=config.MAX_PAGE_SIZE)
+                if action_results['STATUS'] != db.Response.SUCCESS:
+                    yield b"event: expired\ndata: {}\n\n"
+                    return
+                for change in action_results['DATA']:
+                    yield f"id: {change['SEQ']}\nevent: change\ndata: {json.dumps(change)}\n\n".encode('utf-8')
+                cursor = action_results['NEXT_CURSOR']
+                if not action_results['DATA'] and not await waiter.wait(config.SSE_KEEPALIVE):
+                    yield b": keepalive\n\n"
+    return Response(events(), headers=[('Cache-Control', 'no-cache')], mimetype='text/event-stream')
+
+
+# ROUTING
+# Same URLs and methods as app.py; static paths win over <variable> ones.
+url_map = Map([
+    Rule("/api/v1/heartbeat", methods=['GET'], endpoint=heartbeat),
+    Rule("/api/v1/metrics", methods=['GET'], endpoint=prometheus_metrics),
+    Rule("/api/v1/users", methods=['GET', 'POST'], endpoint=users),
+    Rule("/api/v1/users/bulk", methods=['POST'], endpoint=bulk_add_users),
+    Rule("/api/v1/users/export", methods=['GET'], endpoint=export_users),
+    Rule("/api/v1/users/<email>", methods=['GET', 'PUT', 'DELETE'], endpoint=user),
+    Rule("/api/v1/users/<email>/wishlist", methods=['GET', 'POST'], endpoint=wishlist),
+    Rule("/api/v1/users/<email>/wishlist/<isbn>", methods=['DELETE'], endpoint=remove_from_wishlist),
+    Rule("/api/v1/books", methods=['GET', 'POST'], endpoint=books),
+    Rule("/api/v1/books/search", methods=['GET'], endpoint=search_books),
+    Rule("/api/v1/books/bulk", methods=['POST'], endpoint=bulk_add_books),
+    Rule("/api/v1/books/batch_get", methods=['POST'], endpoint=batch_get_books),
+    Rule("/api/v1/books/export", methods=['GET'], endpoint=export_books),
+    Rule("/api/v1/books/<isbn>", methods=['GET', 'DELETE'], endpoint=book),
+    Rule("/api/v1/books/<isbn>/wishers", methods=['GET'], endpoint=book_wishers),
+    Rule("/api/v1/authors", methods=['GET'], endpoint=authors),
+    Rule("/api/v1/authors/<name>/books", methods=['GET'], endpoint=author_books),
+    Rule("/api/v1/changes", methods=['GET'], endpoint=changes),
+    Rule("/api/v1/changes/stream", methods=['GET'], endpoint=change_stream)
+])
+
+
+# APPLICATION
+async def read_body(receive) -> bytes:
+    chunks = []
+    while True:
+        message = await receive()
+        chunks.append(message.get('body', b''))
+        if not message.get('more_body'):
+            return b''.join(chunks)
+
+async def dispatch(request:Request) -> tuple:
+    """Routes and handles `request`, returning the matched route pattern and the response
+    """
+    adapter = url_map.bind('localhost')
+    try:
+        rule, arguments = adapter.match(request.path, method=request.method, return_rule=True)
+        # HEAD is answered like GET, as Flask does; the body is dropped when sending
+        if request.method == 'HEAD':
+            request.method = 'GET'
+    except HTTPException as error:
+        return '<unmatched>', Response(error.description.encode('utf-8'), error.code, mimetype='text/plain')
+    try:
+        return rule.rule, await rule.endpoint(request, **arguments)
+    except Exception:
+        # app.py lets these reach Flask, which answers 500
+        traceback.print_exc()
+        return rule.rule, Response(b'Internal Server Error', 500, mimetype='text/plain')
+
+async def lifespan(receive, send) -> None:
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            await aio.run(db.get_connection)
+            db.start_reconciler()
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            await aio.run(db.stop_reconciler)
+            await aio.run(db.close_database)
+            aio.shutdown_executor()
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+async def application(scope:dict, receive, send) -> None:
+    if scope['type'] == 'lifespan':
+        return await lifespan(receive, send)
+    if scope['type'] != 'http':
+        return
+    started = time.perf_counter()
+    request = Request(scope, await read_body(receive))
+    route, response = await dispatch(request)
+    await response.send(send, include_body=scope['method'] != 'HEAD')
+    metrics.observe_request(route, scope['method'], response.status, time.perf_counter() - started)
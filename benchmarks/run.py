@@ -0,0 +1,414 @@
+# Benchmark harness for db.py and the REST API.
+#
+#   python -m benchmarks.run --users 10000 --books 10000 --output results.json
+#   python -m benchmarks.run ... --baseline results.json
+#
+# Generates a synthetic catalog and user base, loads it into the BENCHMARK
+# environment, then drives a mixed read/write workload through the db.py
+# functions and through every app.py route (Flask test client). The
+# `concurrent` suite runs the db.py workload from --threads threads at once,
+# so lock contention shows up in the latencies, and the `export` suite walks
+# whole tables through the iter_* functions, cursor pagination and
+# export_tables. Latency percentiles and throughput per operation, and the
+# memory held by the opened database, are printed as JSON; compare backends
+# with --env (e.g. the BENCHMARK_COMPACT environment). With --baseline,
+# results are compared against an earlier run and the exit status is 1 if
+# any operation regressed by more than --tolerance.
+
+# STANDARD LIBRARY
+import argparse
+import json
+import random
+import resource
+import sys
+import threading
+import time
+import tracemalloc
+from typing import Callable
+
+# LOCAL MODULES
+from PyBrary import config, db, load_database
+
+
+# GLOBAL
+DEFAULT_ENV = "BENCHMARK"
+FIRST_NAMES = ["Ada", "Grace", "Alan", "Edsger", "Barbara", "Donald", "Frances", "Ken", "Margaret", "Dennis"]
+LAST_NAMES = ["Lovelace", "Hopper", "Turing", "Dijkstra", "Liskov", "Knuth", "Allen", "Thompson", "Hamilton", "Ritchie"]
+TITLE_WORDS = ["Star", "Empire", "Dune", "Machine", "Garden", "Night", "River", "Code", "Engine", "Signal",
+               "Winter", "Silent", "Foundation", "Stone", "Mirror", "Orbit", "Harbor", "Shadow", "Glass", "Storm"]
+PERCENTILES = (50, 95, 99)
+SUITES = ('db', 'api', 'concurrent', 'export')
+# times each export suite operation runs, as each one reads whole tables
+EXPORT_ROUNDS = 3
+
+
+# DATA GENERATION
+def make_isbn(n:int) -> str:
+    return f"{n:010d}"
+
+def generate_books(count:int, rng:random.Random, authors:int=None) -> list:
+    """Returns `count` books spread over roughly count/10 authors
+    """
+    authors = authors or max(1, count // 10)
+    return [{
+        'title': ' '.join(rng.choice(TITLE_WORDS) for _ in range(rng.randint(1, 4))),
+        'author': f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)} {rng.randrange(authors)}",
+        'isbn': make_isbn(n),
+        'publication_date': f"{rng.randint(1900, 2021)}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}"
+    } for n in range(count)]
+
+def generate_users(count:int, books:list, rng:random.Random, max_wishlist:int=5) -> list:
+    users = []
+    for n in range(count):
+        wishlist = {}
+        for book in rng.sample(books, min(len(books), rng.randint(0, max_wishlist))):
+            wishlist[book['isbn']] = book['title']
+        users.append({
+            'first_name': rng.choice(FIRST_NAMES),
+            'last_name': rng.choice(LAST_NAMES),
+            'email': f"user{n}@example.com",
+            'password': f"password{n}",
+            'wishlist': wishlist
+        })
+    return users
+
+
+# WORKLOADS
+class Workload:
+    """Picks operations against the generated data, keeping track of what the run itself created
+
+    Each operation is (name, is_write, callable). Writes only remove users and
+    books added earlier in the run, so reads keep hitting the generated data.
+    """
+    def __init__(self, users:list, books:list, rng:random.Random):
+        self.rng = rng
+        self.emails = [user['email'] for user in users]
+        self.isbns = [book['isbn'] for book in books]
+        self.authors = sorted({book['author'] for book in books})
+        self.created_users = []
+        self.created_books = []
+        self._counter = 0
+        self._counter_lock = threading.Lock()
+
+    def next_id(self) -> int:
+        # the concurrent suite draws ids from several threads
+        with self._counter_lock:
+            self._counter += 1
+            return self._counter
+
+    def email(self) -> str:
+        return self.rng.choice(self.emails)
+
+    def isbn(self) -> str:
+        return self.rng.choice(self.isbns)
+
+    def author(self) -> str:
+        return self.rng.choice(self.authors)
+
+    def word(self) -> str:
+        return self.rng.choice(TITLE_WORDS)
+
+    def new_user(self) -> dict:
+        n = self.next_id()
+        email = f"bench{n}@example.com"
+        self.created_users.append(email)
+        return {'first_name': "Bench", 'last_name': str(n), 'email': email, 'password': "password", 'wishlist': {}}
+
+    def new_book(self) -> dict:
+        n = self.next_id()
+        isbn = f"B{n:09d}"
+        self.created_books.append(isbn)
+        return {'title': f"Benchmark {self.word()}", 'author': "Bench Mark", 'isbn': isbn, 'publication_date': "2000-01-01"}
+
+    def created_user(self) -> str:
+        return self.created_users.pop() if self.created_users else f"missing{self.next_id()}@example.com"
+
+    def created_book(self) -> str:
+        return self.created_books.pop() if self.created_books else f"M{self.next_id():09d}"
+
+def db_operations(w:Workload) -> list:
+    return [
+        ('get_user', False, lambda: db.get_user(email=w.email())),
+        ('get_all_users', False, lambda: db.get_all_users(limit=100)),
+        ('get_wishlist', False, lambda: db.get_wishlist(email=w.email())),
+        ('get_wishlist expanded', False, lambda: db.get_wishlist(email=w.email(), expand=True)),
+        ('get_book', False, lambda: db.get_book(isbn=w.isbn())),
+        ('get_books', False, lambda: db.get_books(isbns=[w.isbn() for _ in range(20)])),
+        ('get_all_books', False, lambda: db.get_all_books(limit=100, author=w.author())),
+        ('search_books', False, lambda: db.search_books(query=w.word())),
+        ('get_wishers', False, lambda: db.get_wishers(isbn=w.isbn(), limit=100)),
+        ('get_authors', False, lambda: db.get_authors()),
+        ('get_books_by_author', False, lambda: db.get_books_by_author(author=w.author())),
+        ('get_changes', False, lambda: db.get_changes(limit=100)),
+        ('add_user', True, lambda: db.add_user(**w.new_user())),
+        ('update_user', True, lambda: db.update_user(email=w.email(), data={'last_name': w.word()})),
+        ('remove_user', True, lambda: db.remove_user(email=w.created_user())),
+        ('add_users', True, lambda: db.add_users([w.new_user() for _ in range(10)])),
+        ('add_to_wishlist', True, lambda: db.add_to_wishlist(email=w.email(), isbn=w.isbn())),
+        ('remove_from_wishlist', True, lambda: db.remove_from_wishlist(email=w.email(), isbn=w.isbn())),
+        ('add_book', True, lambda: db.add_book(**w.new_book())),
+        ('add_books', True, lambda: db.add_books([w.new_book() for _ in range(10)])),
+        ('remove_book', True, lambda: db.remove_book(isbn=w.created_book(), cascade=True))
+    ]
+
+def api_operations(w:Workload, client) -> list:
+    return [
+        ('GET /heartbeat', False, lambda: client.get('/api/v1/heartbeat')),
+        ('GET /metrics', False, lambda: client.get('/api/v1/metrics')),
+        ('GET /changes', False, lambda: client.get('/api/v1/changes?limit=100')),
+        ('GET /users', False, lambda: client.get('/api/v1/users?limit=100')),
+        ('GET /users/<email>', False, lambda: client.get(f'/api/v1/users/{w.email()}')),
+        ('GET /users/<email>/wishlist', False, lambda: client.get(f'/api/v1/users/{w.email()}/wishlist')),
+        ('GET /users/<email>/wishlist?expand=books', False,
+            lambda: client.get(f'/api/v1/users/{w.email()}/wishlist?expand=books')),
+        ('GET /users/export', False, lambda: client.get('/api/v1/users/export')),
+        ('GET /books', False, lambda: client.get(f'/api/v1/books?limit=100&author={w.author()}')),
+        ('GET /books/<isbn>', False, lambda: client.get(f'/api/v1/books/{w.isbn()}')),
+        ('POST /books/batch_get', False,
+            lambda: client.post('/api/v1/books/batch_get', json={'isbns': [w.isbn() for _ in range(20)]})),
+        ('GET /books/search', False, lambda: client.get(f'/api/v1/books/search?q={w.word()}')),
+        ('GET /books/<isbn>/wishers', False, lambda: client.get(f'/api/v1/books/{w.isbn()}/wishers')),
+        ('GET /books/export', False, lambda: client.get('/api/v1/books/export')),
+        ('GET /authors', False, lambda: client.get('/api/v1/authors')),
+        ('GET /authors/<name>/books', False, lambda: client.get(f'/api/v1/authors/{w.author()}/books')),
+        ('POST /users', True, lambda: client.post('/api/v1/users', json=w.new_user())),
+        ('PUT /users/<email>', True, lambda: client.put(f'/api/v1/users/{w.email()}', json={'last_name': w.word()})),
+        ('DELETE /users/<email>', True, lambda: client.delete(f'/api/v1/users/{w.created_user()}')),
+        ('POST /users/bulk', True, lambda: client.post('/api/v1/users/bulk', json=[w.new_user() for _ in range(10)])),
+        ('POST /users/<email>/wishlist', True,
+            lambda: client.post(f'/api/v1/users/{w.email()}/wishlist', json={'isbn': w.isbn()})),
+        ('DELETE /users/<email>/wishlist/<isbn>', True,
+            lambda: client.delete(f'/api/v1/users/{w.email()}/wishlist/{w.isbn()}')),
+        ('POST /books', True, lambda: client.post('/api/v1/books', json=w.new_book())),
+        ('POST /books/bulk', True, lambda: client.post('/api/v1/books/bulk', json=[w.new_book() for _ in range(10)])),
+        ('DELETE /books/<isbn>', True, lambda: client.delete(f'/api/v1/books/{w.created_book()}?cascade=true'))
+    ]
+
+
+def walk_pages(fetch:Callable) -> int:
+    """Follows NEXT_CURSOR from the first page returned by `fetch(cursor)` to the last; returns the documents read
+    """
+    count, cursor = 0, None
+    while True:
+        response = fetch(cursor)
+        count += len(response['DATA'])
+        cursor = response.get('NEXT_CURSOR')
+        if cursor is None:
+            return count
+
+def api_page(client, path:str) -> Callable:
+    return lambda cursor: client.get(path + (f'&cursor={cursor}' if cursor else '')).json
+
+def export_operations(client) -> list:
+    return [
+        ('iter_users', False, lambda: sum(1 for _ in db.iter_users())),
+        ('iter_books', False, lambda: sum(1 for _ in db.iter_books())),
+        ('get_all_users pages', False, lambda: walk_pages(lambda cursor: db.get_all_users(limit=100, cursor=cursor))),
+        ('get_all_books pages', False, lambda: walk_pages(lambda cursor: db.get_all_books(limit=100, cursor=cursor))),
+        ('export_tables', False, lambda: db.export_tables()),
+        ('GET /users pages', False, lambda: walk_pages(api_page(client, '/api/v1/users?limit=100'))),
+        ('GET /books pages', False, lambda: walk_pages(api_page(client, '/api/v1/books?limit=100'))),
+        ('GET /books/export', False, lambda: client.get('/api/v1/books/export').get_data())
+    ]
+
+
+# MEASUREMENT
+def percentile(sorted_samples:list, pct:float) -> float:
+    """Nearest-rank percentile of an already sorted list
+    """
+    if not sorted_samples:
+        return None
+    rank = max(1, -(-len(sorted_samples) * pct // 100))
+    return sorted_samples[int(rank) - 1]
+
+def summarize(samples:list) -> dict:
+    """Latency percentiles (ms) and throughput (ops/s) of a list of durations in seconds
+    """
+    ordered = sorted(samples)
+    total = sum(ordered)
+    summary = {'count': len(ordered), 'throughput': len(ordered) / total if total else None}
+    for pct in PERCENTILES:
+        value = percentile(ordered, pct)
+        summary[f'p{pct}_ms'] = value * 1000 if value is not None else None
+    summary['max_ms'] = ordered[-1] * 1000 if ordered else None
+    return summary
+
+def schedule(operations:list, count:int, read_ratio:float, rng:random.Random) -> list:
+    """Returns `count` operations to run, reads with probability `read_ratio`, starting with each one once
+    """
+    reads = [operation for operation in operations if not operation[1]]
+    writes = [operation for operation in operations if operation[1]]
+    # touch every operation once so each one is reported
+    operations_to_run = list(operations)
+    for _ in range(max(0, count - len(operations_to_run))):
+        pool = reads if (rng.random() < read_ratio or not writes) else writes
+        operations_to_run.append(rng.choice(pool))
+    return operations_to_run
+
+def measure(operations:list, schedules:list) -> dict:
+    """Runs each schedule on its own thread, all at once, and summarizes each operation
+    """
+    samples = {name: [] for name, _, _ in operations}
+
+    def work(operations_to_run:list) -> None:
+        for name, _, operation in operations_to_run:
+            start = time.perf_counter()
+            operation()
+            samples[name].append(time.perf_counter() - start)
+
+    threads = [threading.Thread(target=work, args=(operations_to_run,)) for operations_to_run in schedules[1:]]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    work(schedules[0])
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    every_sample = [sample for durations in samples.values() for sample in durations]
+    overall = summarize(every_sample)
+    overall['throughput'] = len(every_sample) / elapsed if elapsed else None
+    return {'overall': overall, 'operations': {name: summarize(durations) for name, durations in samples.items()}}
+
+def run_workload(operations:list, count:int, read_ratio:float, rng:random.Random) -> dict:
+    """Runs `count` operations, reads with probability `read_ratio`, and summarizes each one
+    """
+    return measure(operations, [schedule(operations, count, read_ratio, rng)])
+
+def run_concurrent(operations:list, count:int, read_ratio:float, threads:int, rng:random.Random) -> dict:
+    """Like `run_workload`, but with the `count` operations shared out between `threads` threads running at once
+
+    Overall throughput is measured over the wall-clock time of the run, so
+    it shows how well operations overlap; per-operation latencies include
+    any time spent waiting on other threads.
+    """
+    per_thread = -(-count // threads)
+    return measure(operations, [schedule(operations, per_thread, read_ratio, random.Random(rng.random()))
+                                for _ in range(threads)])
+
+def timed(func:Callable) -> float:
+    start = time.perf_counter()
+    func()
+    return time.perf_counter() - start
+
+def allocated(func:Callable) -> dict:
+    """Bytes allocated by `func` that are still held once it returns, and its peak allocation
+    """
+    tracemalloc.start()
+    try:
+        func()
+        held, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {'held_bytes': held, 'peak_bytes': peak}
+
+def max_rss() -> int:
+    """Peak resident set size of this process so far, in bytes
+    """
+    usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return usage if sys.platform == 'darwin' else usage * 1024
+
+
+# BASELINE COMPARISON
+def compare(results:dict, baseline:dict, tolerance:float) -> list:
+    """Returns the operations whose p95 latency rose, or throughput fell, by more than `tolerance`
+    """
+    regressions = []
+    for suite, suite_results in results['suites'].items():
+        baseline_suite = baseline.get('suites', {}).get(suite)
+        if baseline_suite is None:
+            continue
+        for name, current in suite_results['operations'].items():
+            previous = baseline_suite['operations'].get(name)
+            if not previous or not current['count'] or not previous['count']:
+                continue
+            if current['p95_ms'] > previous['p95_ms'] * (1 + tolerance):
+                regressions.append({'suite': suite, 'operation': name, 'metric': 'p95_ms',
+                                    'baseline': previous['p95_ms'], 'current': current['p95_ms']})
+            if current['throughput'] < previous['throughput'] * (1 - tolerance):
+                regressions.append({'suite': suite, 'operation': name, 'metric': 'throughput',
+                                    'baseline': previous['throughput'], 'current': current['throughput']})
+    return regressions
+
+
+# ENTRY POINT
+def run(users:int, books:int, operations:int, read_ratio:float=0.9, suites=SUITES,
+        env:str=DEFAULT_ENV, seed:int=0, threads:int=8) -> dict:
+    """Generates and loads the data set, runs each suite and returns the results
+    """
+    if 'api' in suites or 'export' in suites:
+        # importing app opens its default environment, so do it before opening ours
+        from app import app
+    rng = random.Random(seed)
+    setup = {}
+    start = time.perf_counter()
+    book_data = generate_books(books, rng)
+    user_data = generate_users(users, book_data, rng)
+    setup['generate_s'] = time.perf_counter() - start
+    db.close_database()
+    setup['load_s'] = timed(lambda: load_database(env, {config.USERS_TABLE_NAME: user_data,
+                                                         config.BOOKS_TABLE_NAME: book_data}))
+    setup['open_s'] = timed(lambda: db.open_database(env))
+    # memory of the opened database (documents, caches and indexes), measured on a second
+    # open since tracing allocations slows it down
+    db.close_database()
+    memory = allocated(lambda: db.open_database(env))
+    results = {
+        'config': {'users': users, 'books': books, 'operations': operations, 'read_ratio': read_ratio,
+                   'env': env, 'backend': config.ENVIRONMENTS[env]['BACKEND'], 'seed': seed, 'threads': threads},
+        'setup': setup,
+        'memory': memory,
+        'suites': {}
+    }
+    try:
+        if 'db' in suites:
+            workload = Workload(user_data, book_data, rng)
+            results['suites']['db'] = run_workload(db_operations(workload), operations, read_ratio, rng)
+        if 'api' in suites:
+            workload = Workload(user_data, book_data, rng)
+            with app.test_client() as client:
+                results['suites']['api'] = run_workload(
+                        api_operations(workload, client), operations, read_ratio, rng)
+        if 'concurrent' in suites:
+            workload = Workload(user_data, book_data, rng)
+            results['suites']['concurrent'] = run_concurrent(
+                    db_operations(workload), operations, read_ratio, threads, rng)
+        if 'export' in suites:
+            with app.test_client() as client:
+                export = export_operations(client)
+                results['suites']['export'] = run_workload(export, len(export) * EXPORT_ROUNDS, 1.0, rng)
+    finally:
+        db.close_database()
+    memory['max_rss_bytes'] = max_rss()
+    return results
+
+def main(argv:list=None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the PyBrary db layer and REST API")
+    parser.add_argument('--users', type=int, default=10000)
+    parser.add_argument('--books', type=int, default=10000)
+    parser.add_argument('--operations', type=int, default=5000, help="operations per suite")
+    parser.add_argument('--read-ratio', type=float, default=0.9)
+    parser.add_argument('--suite', action='append', choices=SUITES, help="default: all of them")
+    parser.add_argument('--env', default=DEFAULT_ENV, help="environment to load; its database is replaced")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--threads', type=int, default=8, help="threads of the concurrent suite")
+    parser.add_argument('--output', help="also write the results to this file")
+    parser.add_argument('--baseline', help="results file of an earlier run to compare against")
+    parser.add_argument('--tolerance', type=float, default=0.2, help="allowed relative regression")
+    arguments = parser.parse_args(argv)
+
+    results = run(arguments.users, arguments.books, arguments.operations, arguments.read_ratio,
+                  arguments.suite or SUITES, arguments.env, arguments.seed, arguments.threads)
+    if arguments.baseline:
+        with open(arguments.baseline) as f:
+            results['regressions'] = compare(results, json.load(f), arguments.tolerance)
+    if arguments.output:
+        with open(arguments.output, 'w') as f:
+            json.dump(results, f, indent=2)
+    json.dump(results, sys.stdout, indent=2)
+    print()
+    return 1 if results.get('regressions') else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,14 @@
+# Multi-worker serving: `PYBRARY_ENV=SERVER gunicorn app:app`
+# The SERVER environment enables MULTIPROCESS (see PyBrary/coordination.py),
+# which every environment served by more than one worker needs.
+
+# STANDARD LIBRARY
+import multiprocessing
+import os
+
+# SETUP
+os.environ.setdefault("PYBRARY_ENV", "SERVER")
+bind = "127.0.0.1:5000"
+workers = multiprocessing.cpu_count()
+# each worker must open the database itself, after the fork
+preload_app = False
@@ -0,0 +1,143 @@
+# STANDARD LIBRARY
+import asyncio
+import json
+import subprocess
+import sys
+
+# 3RD PARTY MODULES
+import pytest
+
+# LOCAL MODULES
+from app import app
+from asgi import application
+from PyBrary import aio, config, db, initialize_database
+
+# TESTING DATA
+with open(config.TEST_USERS_FILE) as f:
+    TEST_USER = json.load(f)
+
+# UTILITY FUNCTIONS
+async def call(method:str, path:str, body:bytes=b'', headers:dict=None) -> tuple:
+    """Sends one request through the ASGI app, returning (status, headers, body)
+    """
+    path, _, query = path.partition('?')
+    scope = {
+        'type': 'http',
+        'method': method,
+        'path': path,
+        'query_string': query.encode(),
+        'headers': [(key.lower().encode(), value.encode()) for key, value in (headers or {}).items()]
+    }
+    messages = []
+
+    async def receive():
+        return {'type': 'http.request', 'body': body, 'more_body': False}
+
+    async def send(message):
+        messages.append(message)
+
+    await application(scope, receive, send)
+    start = messages[0]
+    response_headers = {key.decode(): value.decode() for key, value in start['headers']}
+    return start['status'], response_headers, b''.join(message.get('body', b'') for message in messages[1:])
+
+def request(*args, **kwargs) -> tuple:
+    return asyncio.run(call(*args, **kwargs))
+
+def post_json(path:str, data) -> tuple:
+    return request('POST', path, json.dumps(data).encode(), {'Content-Type': 'application/json'})
+
+# FIXTURES
+@pytest.fixture
+def client():
+    initialize_database(env='TEST')
+    db.open_database('TEST')
+    with app.test_client() as client:
+        yield client
+    aio.shutdown_executor()
+
+# TESTS
+@pytest.mark.parametrize('path', [
+    '/api/v1/heartbeat',
+    '/api/v1/users?limit=2',
+    '/api/v1/users?limit=abc',
+    '/api/v1/users/ada@firstprogrammer.com',
+    '/api/v1/users/nobody@example.com',
+    '/api/v1/books?author=Andy%20Weir',
+    '/api/v1/books/search?q=hail',
+    '/api/v1/authors',
+    '/api/v1/books/0593395565/wishers',
+    '/api/v1/changes?wait=nan',
+    '/api/v1/changes?wait=inf'
+])
+def test_get_matches_flask(client, path):
+    expected = client.get(path)
+    status, headers, body = request('GET', path)
+    assert status == expected.status_code
+    assert body == expected.data
+    assert headers.get('etag') == expected.headers.get('ETag')
+
+def test_writes_return_same_payloads(client):
+    status, _, body = post_json('/api/v1/users', TEST_USER['BETTY'])
+    assert status == 201
+    assert json.loads(body)['STATUS'] == "USER CREATED"
+    status, _, body = post_json('/api/v1/users', TEST_USER['BETTY'])
+    assert status == 406
+    email = TEST_USER['BETTY']['email']
+    status, _, body = post_json(f'/api/v1/users/{email}/wishlist', {'isbn': '0593395565'})
+    assert status == 200
+    assert json.loads(body)['STATUS'] == "WISHLIST UPDATED"
+    status, _, _ = request('DELETE', f'/api/v1/users/{email}')
+    assert status == 200
+    assert client.get(f'/api/v1/users/{email}').status_code == 404
+
+def test_bulk_rejects_bad_batch_size(client):
+    for batch_size in ('0', 'abc'):
+        status, _, body = post_json(f'/api/v1/users/bulk?batch_size={batch_size}', [TEST_USER['BETTY']])
+        assert status == 400
+    assert client.get(f"/api/v1/users/{TEST_USER['BETTY']['email']}").status_code == 404
+
+def test_wishlist_writes_throttled(client, monkeypatch):
+    monkeypatch.setattr(db.WRITE_QUEUES[config.USERS_TABLE_NAME], 'max_depth', 0)
+    status, headers, body = post_json('/api/v1/users/alan@turingcomplete.com/wishlist', {'isbn': '0765308630'})
+    assert status == 429
+    assert int(headers['retry-after']) >= 1
+    assert json.loads(body)['STATUS'] == "SERVER BUSY"
+
+def test_not_modified(client):
+    _, headers, _ = request('GET', '/api/v1/books')
+    status, _, body = request('GET', '/api/v1/books', headers={'If-None-Match': headers['etag']})
+    assert status == 304
+    assert body == b''
+
+def test_export_streams_ndjson(client):
+    status, headers, body = request('GET', '/api/v1/books/export')
+    assert status == 200
+    assert headers['content-type'] == 'application/x-ndjson'
+    assert body == client.get('/api/v1/books/export').data
+
+def test_unknown_route_and_method(client):
+    assert request('GET', '/api/v1/nothing')[0] == 404
+    assert request('PATCH', '/api/v1/books')[0] == 405
+
+def test_concurrent_requests(client):
+    async def many():
+        return await asyncio.gather(*(call('GET', '/api/v1/books/0593395565') for _ in range(200)))
+    assert {status for status, _, _ in asyncio.run(many())} == {200}
+
+def test_changes_long_poll_wakes_on_commit(client):
+    async def poll_and_write():
+        _, _, body = await call('GET', '/api/v1/changes')
+        head = json.loads(body)['NEXT_CURSOR']
+        poll = asyncio.ensure_future(call('GET', f'/api/v1/changes?after={head}&wait=5'))
+        await asyncio.sleep(0.05)
+        await aio.remove_user(email="ada@firstprogrammer.com")
+        return await poll
+    status, _, body = asyncio.run(poll_and_write())
+    assert status == 200
+    assert [change['KEY'] for change in json.loads(body)['DATA']] == ["ada@firstprogrammer.com"]
+
+def test_does_not_load_the_flask_app():
+    # asgi.py is an alternative entry point; importing app.py would open the database and start Flask's setup
+    result = subprocess.run([sys.executable, '-c', "import sys, asgi; assert 'app' not in sys.modules"])
+    assert result.returncode == 0
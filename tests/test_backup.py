@@ -0,0 +1,165 @@
+# STANDARD LIBRARY
+import contextlib
+import json
+import os
+
+# 3RD PARTY MODULES
+import pytest
+
+# LOCAL MODULES
+from PyBrary import backends, backup_database, config, db, initialize_database, restore_database
+from PyBrary.backup import BackupNotFound, BackupStore
+from PyBrary.changes import ChangesExpired
+
+
+# GLOBAL
+USERS_TABLE = config.USERS_TABLE_NAME
+BOOKS_TABLE = config.BOOKS_TABLE_NAME
+with open(config.EXAMPLE_DATA) as f:
+    EXAMPLE_DATA = json.load(f)
+NEW_BOOK = {'title': 'Project Hail Mary', 'author': 'Andy Weir', 'isbn': '0593135202', 'publication_date': '2021-05-04'}
+
+
+# FIXTURES
+@pytest.fixture(params=config.TEST_ENVIRONMENTS)
+def setup_database(request):
+    initialize_database(request.param)
+    db.open_database(request.param)
+    yield request.param
+    db.close_database()
+
+@pytest.fixture
+def store(tmp_path):
+    return BackupStore(str(tmp_path), chunk_size=4)
+
+
+# UTILITY FUNCTIONS
+def contents() -> dict:
+    return {USERS_TABLE: db.get_all_users()['DATA'], BOOKS_TABLE: db.get_all_books()['DATA']}
+
+def chunk_files(store:BackupStore) -> list:
+    return [name for _, _, names in os.walk(os.path.join(store.path, 'chunks')) for name in names]
+
+
+# TESTS
+def test_backup_and_restore(setup_database, store):
+    manifest = backup_database(store=store)
+    assert manifest['environment'] == setup_database
+    assert manifest['records'] == len(EXAMPLE_DATA[USERS_TABLE]) + len(EXAMPLE_DATA[BOOKS_TABLE])
+    assert store.read(manifest['id']) == {USERS_TABLE: EXAMPLE_DATA[USERS_TABLE], BOOKS_TABLE: EXAMPLE_DATA[BOOKS_TABLE]}
+    expected = contents()
+    db.remove_user(email=EXAMPLE_DATA[USERS_TABLE][0]['email'])
+    db.add_book(**NEW_BOOK)
+    restore_database(manifest['id'], setup_database, store)
+    db.open_database(setup_database)
+    assert contents() == expected
+
+def test_restore_to_another_environment(store):
+    initialize_database("TEST")
+    db.open_database("TEST")
+    db.add_book(**NEW_BOOK)
+    manifest = backup_database(store=store)
+    expected = contents()
+    restore_database(manifest['id'], "TEST_SQLITE", store)
+    db.open_database("TEST_SQLITE")
+    assert contents() == expected
+    db.close_database()
+
+@pytest.mark.parametrize('env', ["TEST_SQLITE", "TEST_MULTIPROCESS"])
+def test_backup_another_environment(env, store):
+    initialize_database(env)
+    initialize_database("TEST")
+    db.open_database("TEST")
+    db.add_book(**NEW_BOOK)
+    manifest = backup_database(env, store)
+    assert manifest['environment'] == env
+    assert store.read(manifest['id']) == {USERS_TABLE: EXAMPLE_DATA[USERS_TABLE], BOOKS_TABLE: EXAMPLE_DATA[BOOKS_TABLE]}
+    # the open database is left alone
+    assert db._environment == "TEST"
+    assert db.get_book(isbn=NEW_BOOK['isbn'])['DATA'] == NEW_BOOK
+    db.close_database()
+
+def test_restore_into_another_environment_leaves_open_one_alone(store):
+    initialize_database("TEST")
+    db.open_database("TEST")
+    manifest = backup_database(store=store)
+    initialize_database("TEST_SQLITE")
+    db.open_database("TEST_SQLITE")
+    db.add_book(**NEW_BOOK)
+    version = db.get_version(BOOKS_TABLE)
+    head = db.get_changes()['NEXT_CURSOR']
+    restore_database(manifest['id'], "TEST", store)
+    assert db._environment == "TEST_SQLITE"
+    assert isinstance(db.get_connection(), backends.SQLiteBackend)
+    assert db.get_book(isbn=NEW_BOOK['isbn'])['DATA'] == NEW_BOOK
+    assert db.get_version(BOOKS_TABLE) == version
+    assert db.get_changes(after=head)['STATUS'] == db.Response.SUCCESS
+    db.close_database()
+
+def test_unchanged_chunks_stored_once(setup_database, store):
+    first = backup_database(store=store)
+    assert first['written'] == first['chunks']
+    again = backup_database(store=store)
+    assert again['written'] == 0
+    db.add_book(**NEW_BOOK)
+    # only the last chunk of books changes
+    third = backup_database(store=store)
+    assert third['written'] == 1
+    assert len(chunk_files(store)) == first['chunks'] + 1
+    assert [manifest['id'] for manifest in store.list()] == [first['id'], again['id'], third['id']]
+
+def test_collect_garbage(setup_database, store):
+    first = backup_database(store=store)
+    db.add_book(**NEW_BOOK)
+    second = backup_database(store=store)
+    store.delete(first['id'])
+    assert store.collect_garbage() == 1
+    assert len(chunk_files(store)) == second['chunks']
+    with pytest.raises(BackupNotFound):
+        store.read(first['id'])
+    assert BOOKS_TABLE in store.read(second['id'])
+
+def test_export_is_point_in_time(setup_database, monkeypatch):
+    transaction = db.transaction
+    calls = []
+
+    @contextlib.contextmanager
+    def writing_transaction():
+        # commits writes between the export's batches, as other threads would
+        with transaction():
+            yield
+        calls.append(None)
+        if len(calls) == 2:
+            db.remove_book(isbn=EXAMPLE_DATA[BOOKS_TABLE][0]['isbn'])
+            db.update_user(email=EXAMPLE_DATA[USERS_TABLE][0]['email'], data={'first_name': 'Changed'})
+            db.add_book(**NEW_BOOK)
+
+    monkeypatch.setattr(db, 'transaction', writing_transaction)
+    tables = db.export_tables(batch_size=2)
+    monkeypatch.setattr(db, 'transaction', transaction)
+    expected = contents()
+    assert {table_name: list(documents.values()) for table_name, documents in tables.items()} == expected
+    assert expected[USERS_TABLE][0]['first_name'] == 'Changed'
+
+def test_export_without_change_log(setup_database, monkeypatch):
+    expected = contents()
+
+    def expired(*args, **kwargs):
+        raise ChangesExpired()
+
+    monkeypatch.setattr(db.CHANGES, 'read', expired)
+    tables = db.export_tables(batch_size=2)
+    assert {table_name: list(documents.values()) for table_name, documents in tables.items()} == expected
+
+def test_repeated_restores_read_from_cache(store):
+    initialize_database("TEST")
+    db.open_database("TEST")
+    manifest = backup_database(store=store)
+    db.close_database()
+    for directory, _, names in os.walk(os.path.join(store.path, 'chunks')):
+        for name in names:
+            os.remove(os.path.join(directory, name))
+    restore_database(manifest['id'], "TEST", store)
+    db.open_database("TEST")
+    assert contents() == {USERS_TABLE: EXAMPLE_DATA[USERS_TABLE], BOOKS_TABLE: EXAMPLE_DATA[BOOKS_TABLE]}
+    db.close_database()
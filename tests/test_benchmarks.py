@@ -0,0 +1,38 @@
+# STANDARD LIBRARY
+import copy
+
+# LOCAL MODULES
+from benchmarks import run as benchmarks
+
+
+# TESTS
+def test_run_reports_every_operation():
+    results = benchmarks.run(users=50, books=50, operations=60, env="TEST", threads=4)
+    for suite in ('db', 'api'):
+        operations = results['suites'][suite]['operations']
+        assert all(stats['count'] >= 1 for stats in operations.values())
+        assert results['suites'][suite]['overall']['count'] == max(60, len(operations))
+        assert set(operations['get_book' if suite == 'db' else 'GET /books/<isbn>']) >= {'p50_ms', 'p95_ms', 'p99_ms'}
+    # every thread of the concurrent suite runs each operation at least once
+    concurrent = results['suites']['concurrent']['operations']
+    assert all(stats['count'] >= 4 for stats in concurrent.values())
+    export = results['suites']['export']['operations']
+    assert set(export) >= {'iter_users', 'get_all_books pages', 'export_tables', 'GET /books pages'}
+    assert all(stats['count'] >= 1 for stats in export.values())
+    assert 0 < results['memory']['held_bytes'] <= results['memory']['peak_bytes']
+    assert results['memory']['max_rss_bytes'] > 0
+
+def test_percentile():
+    samples = list(range(1, 101))
+    assert benchmarks.percentile(samples, 50) == 50
+    assert benchmarks.percentile(samples, 99) == 99
+    assert benchmarks.percentile([], 50) is None
+
+def test_compare_flags_regressions():
+    stats = {'count': 10, 'throughput': 100.0, 'p50_ms': 1.0, 'p95_ms': 2.0, 'p99_ms': 3.0, 'max_ms': 4.0}
+    baseline = {'suites': {'db': {'operations': {'get_book': dict(stats), 'get_user': dict(stats)}}}}
+    results = copy.deepcopy(baseline)
+    results['suites']['db']['operations']['get_book'].update(p95_ms=3.0, throughput=50.0)
+    results['suites']['db']['operations']['get_user'].update(p95_ms=2.1)
+    regressions = benchmarks.compare(results, baseline, tolerance=0.2)
+    assert {(r['operation'], r['metric']) for r in regressions} == {('get_book', 'p95_ms'), ('get_book', 'throughput')}
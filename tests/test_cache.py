@@ -0,0 +1,48 @@
+# LOCAL MODULES
+from PyBrary.cache import MISSING, LRUCache
+
+
+# UTILITY CLASSES
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+# TESTS
+def test_get_and_put():
+    cache = LRUCache(max_size=2)
+    assert cache.get('a') is MISSING
+    cache.put('a', 1)
+    assert cache.get('a') == 1
+    assert cache.stats()['hits'] == 1
+    assert cache.stats()['misses'] == 1
+
+def test_evicts_least_recently_used():
+    cache = LRUCache(max_size=2)
+    cache.put('a', 1)
+    cache.put('b', 2)
+    cache.get('a')
+    cache.put('c', 3)
+    assert 'b' not in cache
+    assert cache.get('a') == 1
+    assert cache.get('c') == 3
+    assert cache.stats()['evictions'] == 1
+
+def test_entries_expire():
+    clock = FakeClock()
+    cache = LRUCache(max_size=2, ttl=10, clock=clock)
+    cache.put('a', 1)
+    clock.now = 9
+    assert cache.get('a') == 1
+    clock.now = 10
+    assert cache.get('a') is MISSING
+    assert cache.stats()['expirations'] == 1
+
+def test_invalidate():
+    cache = LRUCache(max_size=2)
+    cache.put('a', 1)
+    cache.invalidate('a')
+    assert cache.get('a') is MISSING
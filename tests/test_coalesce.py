@@ -0,0 +1,144 @@
+# STANDARD LIBRARY
+import threading
+import time
+
+# 3RD PARTY MODULES
+import pytest
+
+# LOCAL MODULES
+from PyBrary.coalesce import QueueFull, SingleFlight, WriteQueue, _Write
+
+
+# UTILITY FUNCTIONS
+def start(target, count:int) -> list:
+    threads = [threading.Thread(target=target) for _ in range(count)]
+    for thread in threads:
+        thread.start()
+    return threads
+
+def wait_until(condition, timeout:float=5.0) -> None:
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.001)
+
+
+# SINGLE FLIGHT TESTS
+def test_concurrent_calls_share_one_result():
+    flight = SingleFlight(share=list)
+    release = threading.Event()
+    calls, results = [], []
+
+    def read():
+        calls.append(None)
+        release.wait()
+        return [1]
+
+    leader = start(lambda: results.append(flight.do('key', read)), 1)
+    wait_until(lambda: calls)
+    followers = start(lambda: results.append(flight.do('key', read)), 4)
+    wait_until(lambda: flight.shared == 4)
+    release.set()
+    for thread in leader + followers:
+        thread.join()
+    assert len(calls) == 1
+    assert results == [[1]] * 5
+    # followers get their own copies
+    assert len({id(result) for result in results}) == 5
+    assert len(flight) == 0
+
+def test_errors_reach_every_caller():
+    flight = SingleFlight()
+    release = threading.Event()
+    errors = []
+
+    def read():
+        release.wait()
+        raise KeyError('key')
+
+    def call():
+        try:
+            flight.do('key', read)
+        except KeyError as error:
+            errors.append(error)
+
+    threads = start(call, 1)
+    wait_until(lambda: len(flight) == 1)
+    threads += start(call, 2)
+    wait_until(lambda: flight.shared == 2)
+    release.set()
+    for thread in threads:
+        thread.join()
+    assert len(errors) == 3
+
+def test_forget_starts_a_new_call():
+    flight = SingleFlight()
+    release = threading.Event()
+    threads = start(lambda: flight.do('key', release.wait), 1)
+    wait_until(lambda: len(flight) == 1)
+    flight.forget('key')
+    assert flight.do('key', lambda: 'fresh') == 'fresh'
+    release.set()
+    threads[0].join()
+
+
+# WRITE QUEUE TESTS
+class BlockingCommit:
+    """Commits writes in order, holding the first batch until released
+    """
+    def __init__(self):
+        self.batches = []
+        self.started = threading.Event()
+        self.release = threading.Event()
+
+    def __call__(self, writes:list) -> list:
+        self.started.set()
+        self.release.wait()
+        self.batches.append(len(writes))
+        return [func(*args, **kwargs) for func, args, kwargs in writes]
+
+
+def test_queued_writes_share_a_commit():
+    commit = BlockingCommit()
+    queue = WriteQueue(commit, max_depth=100, max_batch=10)
+    results = []
+    threads = start(lambda: results.append(queue.submit(lambda: 'first')), 1)
+    commit.started.wait()
+    threads += start(lambda: results.append(queue.submit(lambda: 'queued')), 8)
+    wait_until(lambda: len(queue) == 8)
+    commit.release.set()
+    for thread in threads:
+        thread.join()
+    assert commit.batches == [1, 8]
+    assert sorted(results) == ['first'] + ['queued'] * 8
+
+def test_full_queue_rejects_writes():
+    commit = BlockingCommit()
+    queue = WriteQueue(commit, max_depth=2, max_batch=10)
+    threads = start(lambda: queue.submit(lambda: None), 1)
+    commit.started.wait()
+    threads += start(lambda: queue.submit(lambda: None), 2)
+    wait_until(lambda: len(queue) == 2)
+    with pytest.raises(QueueFull) as error:
+        queue.submit(lambda: None)
+    assert error.value.retry_after >= 1
+    assert queue.rejected == 1
+    commit.release.set()
+    for thread in threads:
+        thread.join()
+
+def test_failed_write_only_fails_its_caller():
+    def commit(writes:list) -> list:
+        return [func(*args, **kwargs) for func, args, kwargs in writes]
+
+    def fail():
+        raise ValueError("bad write")
+
+    queue = WriteQueue(commit, max_depth=10, max_batch=10)
+    # one batch holding a good and a bad write, as concurrent callers would queue them
+    good, bad = _Write(lambda: 'ok', (), {}), _Write(fail, (), {})
+    queue._commit([good, bad])
+    assert good.result == 'ok' and good.error is None
+    assert isinstance(bad.error, ValueError)
+    with pytest.raises(ValueError):
+        queue.submit(fail)
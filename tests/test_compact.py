@@ -0,0 +1,94 @@
+# STANDARD LIBRARY
+import json
+
+# 3RD PARTY MODULES
+import pytest
+
+# LOCAL MODULES
+from PyBrary import config
+from PyBrary.backends import COMPACT_SCHEMAS, CompactBackend
+from PyBrary.compact import CompactDocuments, CompactStorage, StringPool
+
+
+# GLOBAL
+BOOKS = config.BOOKS_TABLE_NAME
+USERS = config.USERS_TABLE_NAME
+with open(config.EXAMPLE_DATA) as f:
+    EXAMPLE_DATA = json.load(f)
+
+
+# FIXTURES
+@pytest.fixture
+def books():
+    return CompactDocuments(COMPACT_SCHEMAS[BOOKS], StringPool())
+
+
+# TESTS
+def test_round_trip(books):
+    book = {'title': 'Artemis', 'author': 'Andy Weir', 'isbn': '0553448145', 'publication_date': '2017-11-14'}
+    books['1'] = book
+    books['2'] = dict(book, isbn='9780553448146')
+    assert books['1'] == book
+    assert list(books['1']) == list(book)
+    assert books['2']['isbn'] == '9780553448146'
+    assert books.compacted() == 2
+    assert dict(books.field_items('isbn')) == {'1': '0553448145', '2': '9780553448146'}
+
+def test_authors_are_interned():
+    pool = StringPool()
+    books = CompactDocuments(COMPACT_SCHEMAS[BOOKS], pool)
+    for n in range(100):
+        books[str(n)] = {'title': f"Book {n}", 'author': 'Andy Weir', 'isbn': str(n), 'publication_date': '2017-11-14'}
+    assert len(pool) == 101
+
+def test_irregular_documents_kept_as_dicts(books):
+    books['1'] = {'isbn': '1', 'title': 'No author'}
+    books['2'] = {'title': 'T', 'author': 'A', 'isbn': 'an isbn that is too long', 'publication_date': '2000-01-01'}
+    assert books.compacted() == 0
+    assert books['1'] == {'isbn': '1', 'title': 'No author'}
+    assert dict(books.field_items('isbn')) == {'1': '1', '2': 'an isbn that is too long'}
+
+def test_rows_are_reused(books):
+    book = {'title': 'T', 'author': 'A', 'isbn': '1', 'publication_date': '2000-01-01'}
+    books['1'] = book
+    books['2'] = dict(book, isbn='2')
+    del books['1']
+    books['3'] = dict(book, isbn='3')
+    assert list(books) == ['2', '3']
+    assert books['3']['isbn'] == '3'
+    assert books._size == 2
+    # a document that stops fitting frees its row
+    books['2'] = {'isbn': '2'}
+    assert books.compacted() == 1
+
+def test_wishlists(tmp_path):
+    path = str(tmp_path / 'db.json')
+    with open(path, 'w') as f:
+        json.dump({USERS: {str(n): user for n, user in enumerate(EXAMPLE_DATA[USERS], 1)}}, f)
+    storage = CompactStorage(path, COMPACT_SCHEMAS)
+    users = storage.read()[USERS]
+    assert users.compacted() == len(EXAMPLE_DATA[USERS])
+    assert [users[doc_id] for doc_id in users] == EXAMPLE_DATA[USERS]
+    storage.write({USERS: users})
+    storage.close()
+    with open(path) as f:
+        assert list(json.load(f)[USERS].values()) == EXAMPLE_DATA[USERS]
+
+def test_backend_keeps_tables_compact(tmp_path):
+    backend = CompactBackend(str(tmp_path / 'db.json'))
+    backend.load({USERS: EXAMPLE_DATA[USERS], BOOKS: EXAMPLE_DATA[BOOKS]})
+    backend.close()
+    backend = CompactBackend(str(tmp_path / 'db.json'))
+    books = backend.table(BOOKS)
+    book = EXAMPLE_DATA[BOOKS][0]
+    backend.begin()
+    books.update(book['isbn'], {'title': 'Retitled'})
+    books.remove(EXAMPLE_DATA[BOOKS][2]['isbn'])
+    backend.rollback()
+    documents = books._documents()
+    assert isinstance(documents, CompactDocuments)
+    assert documents.compacted() == len(EXAMPLE_DATA[BOOKS])
+    # restored documents are read back in id order, wherever the storage put them
+    assert [document for _, document in books.page()] == EXAMPLE_DATA[BOOKS]
+    assert books.get(book['isbn']) == book
+    backend.close()
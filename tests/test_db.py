@@ -1,13 +1,15 @@
 # STANDARD LIBRARY
 import json
 import pdb
+import threading
+import time
 
 # 3RD PARTY MODULES
 import pytest
-from tinydb import TinyDB, Query
 
 # LOCAL MODULES
 from PyBrary import config, db, initialize_database
+from PyBrary.index import InvertedIndex, KeyedTable
 
 
 # GLOBAL
@@ -26,19 +28,20 @@ with open(config.TEST_BOOKS_FILE) as f:
 
 # UTILITY FUNCTIONS
 @db.db_handler(table_name=USERS_TABLE)
-def user_exists(table:TinyDB.table, email:str) -> bool:
-    User = Query()
-    return table.contains(User.email == email)
+def user_exists(table:KeyedTable, email:str) -> bool:
+    return table.contains(email)
 
 @db.db_handler(table_name=BOOKS_TABLE)
-def book_exists(table:TinyDB.table, isbn:str) -> bool:
-    Book = Query()
-    return table.contains(Book.isbn == isbn)
+def book_exists(table:KeyedTable, isbn:str) -> bool:
+    return table.contains(isbn)
 
 # FIXTURE DEFINITIONS
-@pytest.fixture
-def setup_database():
-    initialize_database('TEST')
+@pytest.fixture(params=config.TEST_ENVIRONMENTS)
+def setup_database(request):
+    initialize_database(request.param)
+    db.open_database(request.param)
+    yield
+    db.close_database()
 
 @pytest.fixture
 def setup_database_with_betty(setup_database):
@@ -71,6 +74,16 @@ def test_get_all_users(setup_database):
         expected_results = json.load(f)
     assert expected_results[USERS_TABLE] == test_results['DATA']
 
+def test_get_all_users_paginated(setup_database):
+    first_page = db.get_all_users(limit=2, fields=['email'])
+    assert first_page['DATA'] == [{'email': user['email']} for user in EXAMPLE_USERS[:2]]
+    second_page = db.get_all_users(limit=2, cursor=first_page['NEXT_CURSOR'], fields=['email'])
+    assert second_page['DATA'] == [{'email': EXAMPLE_USERS[2]['email']}]
+    assert second_page['NEXT_CURSOR'] is None
+
+def test_iter_users(setup_database):
+    assert list(db.iter_users(batch_size=2)) == EXAMPLE_USERS
+
 def test_add_user(setup_database):
     user = TEST_USER['BOB']
     res = db.add_user(
@@ -93,6 +106,14 @@ def test_add_duplicate_user(setup_database_with_betty):
         wishlist=user['wishlist'])
     assert res['STATUS'] == db.Response.USER_ALREADY_EXISTS
 
+def test_add_users(setup_database):
+    res = db.add_users(iter([TEST_USER['BOB'], EXAMPLE_USERS[0], TEST_USER['RICH']]))
+    assert [result['STATUS'] for result in res['DATA']] == [
+        db.Response.USER_CREATED,
+        db.Response.USER_ALREADY_EXISTS,
+        db.Response.USER_CREATED]
+    assert user_exists(email=TEST_USER['RICH']['email'])
+
 def test_update_user(setup_database):
     user_email = 'ada@firstprogrammer.com'
     user_update_data = {
@@ -106,6 +127,26 @@ def test_update_user(setup_database):
     test_results = db.get_user(email=user_email)
     assert test_results['STATUS'] == db.Response.SUCCESS
     assert test_results['DATA']['first_name'] == user_update_data['first_name']
+
+def test_update_user_to_existing_email(setup_database):
+    user_0, user_1 = EXAMPLE_USERS[0], EXAMPLE_USERS[1]
+    user_update_data = dict(user_0, email=user_1['email'])
+    res = db.update_user(email=user_0['email'], data=user_update_data)
+    assert res['STATUS'] == db.Response.USER_ALREADY_EXISTS
+    assert db.get_user(email=user_0['email'])['DATA'] == user_0
+    
+def test_update_user_invalidates_cache(setup_database):
+    email = EXAMPLE_USERS[0]['email']
+    db.get_user(email=email)
+    db.get_user(email=email)
+    assert db.cache_stats()[USERS_TABLE]['hits'] >= 1
+    db.update_user(email=email, data={'last_name': 'Byron'})
+    assert db.get_user(email=email)['DATA']['last_name'] == 'Byron'
+
+def test_cached_user_is_a_copy(setup_database):
+    email = EXAMPLE_USERS[1]['email']
+    db.get_user(email=email)['DATA']['wishlist'].clear()
+    assert db.get_user(email=email)['DATA'] == EXAMPLE_USERS[1]
     
 def test_remove_existing_user(setup_database_with_betty):
     user = TEST_USER['BETTY']
@@ -124,7 +165,15 @@ def test_remove_nonexistant_user(setup_database):
 def test_get_wishlist(setup_database):
     user_1 = EXAMPLE_USERS[1]
     wishlist = db.get_wishlist(email=user_1['email'])
-    assert wishlist['DATA'] == user_1['wishlist']
+    # titles come from the books, not the copies stored with the user
+    assert wishlist['DATA'] == {isbn: db.get_book(isbn=isbn)['DATA']['title'] for isbn in user_1['wishlist']}
+
+def test_get_wishlist_expanded(setup_database):
+    user_1 = EXAMPLE_USERS[1]
+    wishlist = db.get_wishlist(email=user_1['email'], expand=True)
+    assert list(wishlist['DATA']) == list(user_1['wishlist'])
+    for isbn, book in wishlist['DATA'].items():
+        assert book == db.get_book(isbn=isbn)['DATA']
 
 def test_add_to_wishlist(setup_database):
     wishlist_item = "0425069974"
@@ -146,18 +195,268 @@ def test_remove_from_wishlist(setup_database):
     updated_wishlist = db.get_wishlist(email=email)
     assert wishlist_item not in updated_wishlist['DATA']
 
+def test_concurrent_wishlist_updates(setup_database):
+    email = EXAMPLE_USERS[0]['email']
+    isbns = {book['isbn'] for book in EXAMPLE_BOOKS}
+    threads = [
+        threading.Thread(target=db.add_to_wishlist, kwargs={'email': email, 'isbn': isbn})
+        for isbn in isbns]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wishlist = db.get_wishlist(email=email)
+    assert set(wishlist['DATA']) == isbns
+
+def test_wishlist_writes_rejected_when_queue_full(setup_database, monkeypatch):
+    monkeypatch.setattr(db.WRITE_QUEUES[USERS_TABLE], 'max_depth', 0)
+    response = db.add_to_wishlist(email=EXAMPLE_USERS[0]['email'], isbn=EXAMPLE_BOOKS[0]['isbn'])
+    assert response['STATUS'] == db.Response.BUSY
+    assert response['DATA']['retry_after'] >= 1
+
+def test_wishlist_write_joins_open_transaction(setup_database):
+    email = EXAMPLE_USERS[0]['email']
+    isbn = '0553448145'
+    with pytest.raises(RuntimeError):
+        with db.transaction():
+            assert db.add_to_wishlist(email=email, isbn=isbn)['STATUS'] == db.Response.WISHLIST_UPDATED
+            raise RuntimeError("roll back")
+    assert isbn not in db.get_wishlist(email=email)['DATA']
+
+def test_concurrent_book_lookups_share_a_read(setup_database, monkeypatch):
+    isbn = EXAMPLE_BOOKS[0]['isbn']
+    release = threading.Event()
+    flight = db.FLIGHTS[BOOKS_TABLE]
+    table_class = type(db.get_table(BOOKS_TABLE))
+    table_get = table_class.get
+    reads = []
+
+    def slow_get(table, key):
+        reads.append(key)
+        assert release.wait(timeout=5)
+        return table_get(table, key)
+
+    monkeypatch.setattr(table_class, 'get', slow_get)
+    db.invalidate(BOOKS_TABLE, isbn)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(db.get_book(isbn=isbn))) for _ in range(5)]
+    shared = flight.shared
+    threads[0].start()
+    deadline = time.monotonic() + 5
+    while not reads and time.monotonic() < deadline:
+        time.sleep(0.001)
+    for thread in threads[1:]:
+        thread.start()
+    while flight.shared < shared + 4 and time.monotonic() < deadline:
+        time.sleep(0.001)
+    release.set()
+    for thread in threads:
+        thread.join()
+    assert reads == [isbn]
+    assert results == [{'STATUS': db.Response.SUCCESS, 'DATA': EXAMPLE_BOOKS[0]}] * 5
+
+def test_lookup_in_transaction_skips_waiting_flight(setup_database):
+    email = EXAMPLE_USERS[0]['email']
+    flight = db.FLIGHTS[USERS_TABLE]
+    in_transaction = threading.Event()
+    results = {}
+
+    def writer():
+        with db.transaction():
+            in_transaction.set()
+            # the reader's flight now waits for this transaction's lock
+            deadline = time.monotonic() + 5
+            while not len(flight) and time.monotonic() < deadline:
+                time.sleep(0.001)
+            results['writer'] = db.get_user(email=email)
+
+    def reader():
+        in_transaction.wait(timeout=5)
+        results['reader'] = db.get_user(email=email)
+
+    db.invalidate(USERS_TABLE, email)
+    threads = [threading.Thread(target=writer, daemon=True), threading.Thread(target=reader, daemon=True)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=10)
+    assert not any(thread.is_alive() for thread in threads)
+    assert results == {name: {'STATUS': db.Response.SUCCESS, 'DATA': EXAMPLE_USERS[0]} for name in ('writer', 'reader')}
+
+# WISHLIST RECONCILIATION SECTION
+def retitle_book(isbn:str, title:str) -> None:
+    book = db.get_book(isbn=isbn)['DATA']
+    db.remove_book(isbn=isbn)
+    db.add_book(**dict(book, title=title))
+
+def test_wishlist_titles_resolved_at_read_time(setup_database):
+    isbn = "0553448145"
+    email = EXAMPLE_USERS[0]['email']
+    db.add_to_wishlist(email=email, isbn=isbn)
+    retitle_book(isbn, "Retitled")
+    assert db.get_wishlist(email=email)['DATA'][isbn] == "Retitled"
+    # the stored copy is stale until reconciled, and is used once the book is gone
+    assert db.get_user(email=email)['DATA']['wishlist'][isbn] == "Artemis"
+    db.remove_book(isbn=isbn)
+    assert db.get_wishlist(email=email)['DATA'][isbn] == "Artemis"
+
+def test_reconcile_wishlists(setup_database):
+    isbn = "0553448145"
+    emails = [user['email'] for user in EXAMPLE_USERS[:2]]
+    for email in emails:
+        db.add_to_wishlist(email=email, isbn=isbn)
+    retitle_book(isbn, "Retitled")
+    res = db.reconcile_wishlists(batch_size=1)
+    assert res['DATA'] == {'wishlists_updated': 2}
+    for email in emails:
+        assert db.get_user(email=email)['DATA']['wishlist'][isbn] == "Retitled"
+    assert db.reconcile_wishlists()['DATA'] == {'wishlists_updated': 0}
+
+def test_reconcile_wishlists_full(setup_database_with_betty):
+    email = TEST_USER['BETTY']['email']
+    isbn = "0553448145"
+    db.update_user(email=email, data={'wishlist': {isbn: "Wrong title"}})
+    assert db.reconcile_wishlists()['DATA'] == {'wishlists_updated': 0}
+    assert db.reconcile_wishlists(full=True)['DATA']['wishlists_updated'] >= 1
+    assert db.get_user(email=email)['DATA']['wishlist'] == {isbn: "Artemis"}
+    assert db.reconcile_wishlists(full=True)['DATA'] == {'wishlists_updated': 0}
+
+def test_background_reconciler(setup_database):
+    isbn = "0553448145"
+    email = EXAMPLE_USERS[0]['email']
+    db.add_to_wishlist(email=email, isbn=isbn)
+    db.start_reconciler(interval=0.01)
+    try:
+        retitle_book(isbn, "Retitled")
+        for _ in range(500):
+            if db.get_user(email=email)['DATA']['wishlist'][isbn] == "Retitled":
+                break
+            time.sleep(0.01)
+        assert db.get_user(email=email)['DATA']['wishlist'][isbn] == "Retitled"
+    finally:
+        db.stop_reconciler()
+
+# TRANSACTIONS SECTION
+def test_transaction_rollback(setup_database):
+    email = EXAMPLE_USERS[0]['email']
+    with pytest.raises(RuntimeError):
+        with db.transaction():
+            db.remove_user(email=email)
+            db.add_to_wishlist(email=EXAMPLE_USERS[1]['email'], isbn=EXAMPLE_BOOKS[0]['isbn'])
+            raise RuntimeError
+    assert user_exists(email=email)
+    assert db.get_user(email=EXAMPLE_USERS[1]['email'])['DATA'] == EXAMPLE_USERS[1]
+
+def test_rollback_undoes_indexes_without_rebuilding(setup_database, monkeypatch):
+    def rebuild(*args):
+        raise AssertionError("rollback rebuilt an index")
+
+    with db.transaction():
+        for table_name, indexes in db.SECONDARY_INDEXES.items():
+            for name in indexes:
+                db.secondary_index(table_name, name)
+    monkeypatch.setattr(db, 'build_index', rebuild)
+    monkeypatch.setattr(KeyedTable, 'rebuild', rebuild)
+    book = EXAMPLE_BOOKS[2]
+    wishers = db.get_wishers(isbn=book['isbn'])['DATA']
+    with pytest.raises(RuntimeError):
+        with db.transaction():
+            db.remove_book(isbn=book['isbn'], cascade=True)
+            db.add_book(**dict(TEST_BOOK['RUFF'], author=book['author']))
+            db.update_user(email=EXAMPLE_USERS[0]['email'], data={'email': 'renamed@example.com'})
+            raise RuntimeError
+    assert db.get_book(isbn=book['isbn'])['DATA'] == book
+    assert db.get_book(isbn=TEST_BOOK['RUFF']['isbn'])['STATUS'] == db.Response.BOOK_NONEXISTENT
+    assert db.get_user(email=EXAMPLE_USERS[0]['email'])['DATA'] == EXAMPLE_USERS[0]
+    assert db.get_user(email='renamed@example.com')['STATUS'] == db.Response.USER_NONEXISTENT
+    assert db.get_wishers(isbn=book['isbn'])['DATA'] == wishers
+    assert db.get_books_by_author(author=book['author'])['DATA'] == [
+        other for other in EXAMPLE_BOOKS if other['author'] == book['author']]
+    assert db.search_books(query=book['title'])['DATA'][0] == book
+    assert db.get_all_books()['DATA'] == EXAMPLE_BOOKS
+
+def test_indexes_are_built_on_first_use(setup_database):
+    assert not db._built_indexes
+    assert db.get_books_by_author(author=EXAMPLE_BOOKS[0]['author'])['STATUS'] == db.Response.SUCCESS
+    assert db._built_indexes == {(config.BOOKS_TABLE_NAME, 'author')}
+    # built indexes follow writes from then on
+    db.add_book(**TEST_BOOK['RUFF'])
+    assert db.get_books_by_author(author=TEST_BOOK['RUFF']['author'])['DATA'] == [TEST_BOOK['RUFF']]
+
+def test_rollback_restores_duplicate_keys(setup_database):
+    isbn = '0425069974'
+    duplicates = [book for book in EXAMPLE_BOOKS if book['isbn'] == isbn]
+    with pytest.raises(RuntimeError):
+        with db.transaction():
+            db.remove_book(isbn=isbn)
+            raise RuntimeError
+    assert db.get_book(isbn=isbn)['DATA'] == duplicates[0]
+    assert [book for book in db.get_all_books()['DATA'] if book['isbn'] == isbn] == duplicates
+
 # BOOKS SECTION
 def test_get_book(setup_database):
     book_0 = EXAMPLE_BOOKS[0]
     res = db.get_book(isbn=book_0['isbn'])
     assert book_0 == res['DATA']
 
+def test_get_books(setup_database):
+    isbns = [EXAMPLE_BOOKS[2]['isbn'], "0000000000", EXAMPLE_BOOKS[0]['isbn']]
+    db.get_book(isbn=EXAMPLE_BOOKS[0]['isbn'])  # one cached, one not
+    res = db.get_books(isbns=isbns)
+    assert res['STATUS'] == db.Response.SUCCESS
+    assert list(res['DATA']) == isbns
+    assert res['DATA'][isbns[0]] == EXAMPLE_BOOKS[2]
+    assert res['DATA'][isbns[1]] is None
+    assert res['DATA'][isbns[2]] == EXAMPLE_BOOKS[0]
+
+def test_get_books_invalid(setup_database):
+    assert db.get_books(isbns="0593395565")['STATUS'] == db.Response.INVALID_REQUEST
+    assert db.get_books(isbns=[1])['STATUS'] == db.Response.INVALID_REQUEST
+    assert db.get_books(isbns=["x"] * (config.MAX_BATCH_SIZE + 1))['STATUS'] == db.Response.INVALID_REQUEST
+
 def test_get_all_books(setup_database):
     test_results = db.get_all_books()
     with open(config.EXAMPLE_DATA, 'r') as f:
         expected_results = json.load(f)
     assert expected_results[BOOKS_TABLE] == test_results['DATA']
 
+def test_get_all_books_paginated(setup_database):
+    books, cursor = [], None
+    while True:
+        res = db.get_all_books(limit=3, cursor=cursor)
+        assert len(res['DATA']) <= 3
+        books.extend(res['DATA'])
+        cursor = res['NEXT_CURSOR']
+        if cursor is None:
+            break
+    assert books == EXAMPLE_BOOKS
+
+def test_get_all_books_filtered(setup_database):
+    res = db.get_all_books(author='Andy Weir', published_after='2019-01-01', fields=['title'])
+    assert res['DATA'] == [{'title': 'Hail Mary'}]
+
+def test_get_all_books_paginated_after_removals(setup_database):
+    for book in EXAMPLE_BOOKS[1:3]:
+        db.remove_book(isbn=book['isbn'])
+    db.add_book(**TEST_BOOK['RUFF'])
+    expected = db.get_all_books()['DATA']
+    pages, cursor = [], None
+    while True:
+        page = db.get_all_books(limit=2, cursor=cursor)
+        pages.extend(page['DATA'])
+        cursor = page['NEXT_CURSOR']
+        if cursor is None:
+            break
+    assert pages == expected
+    assert pages[-1] == TEST_BOOK['RUFF']
+
+def test_get_all_books_invalid_cursor(setup_database):
+    res = db.get_all_books(limit=2, cursor='not a cursor')
+    assert res['STATUS'] == db.Response.INVALID_REQUEST
+
+def test_iter_books(setup_database):
+    assert list(db.iter_books(batch_size=3)) == EXAMPLE_BOOKS
+
 def test_add_book(setup_database):
     book = TEST_BOOK['RUFF']
     res = db.add_book(
@@ -178,14 +477,175 @@ def test_add_duplicate_book(setup_database_with_n20):
         publication_date=book['publication_date'])
     assert res['STATUS'] == db.Response.BOOK_ALREADY_EXISTS
 
+def test_add_books(setup_database):
+    new_books = [TEST_BOOK['RUFF'], TEST_BOOK['N2O'], TEST_BOOK['RUFF'], EXAMPLE_BOOKS[0], {'isbn': '1'}]
+    res = db.add_books(new_books, batch_size=2)
+    assert [result['STATUS'] for result in res['DATA']] == [
+        db.Response.BOOK_CREATED,
+        db.Response.BOOK_CREATED,
+        db.Response.BOOK_ALREADY_EXISTS,
+        db.Response.BOOK_ALREADY_EXISTS,
+        db.Response.INVALID_REQUEST]
+    assert book_exists(isbn=TEST_BOOK['N2O']['isbn'])
+    assert not book_exists(isbn='1')
+
+def test_add_books_invalid_batch_size(setup_database):
+    for batch_size in (0, -1, 'abc'):
+        res = db.add_books([TEST_BOOK['RUFF']], batch_size=batch_size)
+        assert res['STATUS'] == db.Response.INVALID_REQUEST
+    assert not book_exists(isbn=TEST_BOOK['RUFF']['isbn'])
+
 def test_remove_existing_book(setup_database_with_n20):
     book = TEST_BOOK['N2O']
     res = db.remove_book(isbn=book['isbn'])
     assert res['STATUS'] == db.Response.BOOK_REMOVED
     assert not book_exists(isbn=book['isbn'])
 
+def test_remove_book_with_duplicate_isbn(setup_database):
+    isbn = '0425069974'
+    duplicates = [book for book in EXAMPLE_BOOKS if book['isbn'] == isbn]
+    assert len(duplicates) == 2
+    assert db.remove_book(isbn=isbn)['STATUS'] == db.Response.BOOK_REMOVED
+    assert isbn not in [book['isbn'] for book in db.get_all_books()['DATA']]
+    assert db.get_book(isbn=isbn)['STATUS'] == db.Response.BOOK_NONEXISTENT
+    assert db.add_book(**duplicates[1])['STATUS'] == db.Response.BOOK_CREATED
+    assert [book for book in db.get_all_books()['DATA'] if book['isbn'] == isbn] == [duplicates[1]]
+
 def test_remove_nonexistant_book(setup_database):
     fake_isbn = '7777777777'
     assert not book_exists(isbn=fake_isbn)
     res = db.remove_book(isbn=fake_isbn)
-    assert res['STATUS'] == db.Response.BOOK_NONEXISTENT
\ No newline at end of file
+    assert res['STATUS'] == db.Response.BOOK_NONEXISTENT
+
+def test_search_books(setup_database):
+    res = db.search_books(query='weir')
+    assert [book['title'] for book in res['DATA']] == ['Hail Mary', 'Artemis']
+
+def test_search_books_prefix_and_rank(setup_database):
+    res = db.search_books(query='we')
+    # a title match outranks an author match
+    assert res['DATA'][0]['title'] == 'We Are Legion (We Are Bob)'
+    assert {book['title'] for book in res['DATA']} == {'We Are Legion (We Are Bob)', 'Hail Mary', 'Artemis'}
+
+def test_search_books_follows_writes(setup_database_with_n20):
+    book = TEST_BOOK['N2O']
+    assert db.search_books(query='laughing matt')['DATA'] == [book]
+    db.remove_book(isbn=book['isbn'])
+    assert db.search_books(query='laughing')['DATA'] == []
+
+def test_search_books_short_terms_match_whole_words(setup_database):
+    assert db.search_books(query='w')['DATA'] == []
+    assert [book['title'] for book in db.search_books(query='we')['DATA']][:1] == ['We Are Legion (We Are Bob)']
+
+def test_search_books_skips_books_removed_after_lookup(setup_database, monkeypatch):
+    book = EXAMPLE_BOOKS[0]
+    rank = InvertedIndex.rank
+
+    def rank_then_remove(scores:dict, limit:int=None) -> list:
+        # another thread removes a match between the lookup and the fetch
+        db.remove_book(isbn=book['isbn'])
+        return rank(scores, limit)
+
+    monkeypatch.setattr(InvertedIndex, 'rank', staticmethod(rank_then_remove))
+    assert db.search_books(query=book['title'])['DATA'] == []
+
+def test_search_stops_once_limit_results_score_best():
+    index = InvertedIndex({'title': 2.0, 'author': 1.0})
+    index.index(0, {'title': 'Dunes Messiah', 'author': 'Frank Herbert'})
+    for n in range(1, 6):
+        index.index(n, {'title': 'Dune Messiah', 'author': 'Frank Herbert'})
+    assert index.lookup('dune messiah', limit=2) == {1: 4.0, 2: 4.0}
+    assert index.search('dune messiah', limit=2) == [(1, 4.0), (2, 4.0)]
+    assert len(index.lookup('dune messiah')) == 6
+
+def test_search_books_empty_query(setup_database):
+    assert db.search_books(query='  ')['STATUS'] == db.Response.INVALID_REQUEST
+
+def test_get_wishers(setup_database):
+    isbn = "0425069974"
+    res = db.get_wishers(isbn=isbn, limit=1)
+    assert res['DATA'] == {'count': 2, 'users': [EXAMPLE_USERS[1]['email']]}
+    res = db.get_wishers(isbn=isbn, limit=1, cursor=res['NEXT_CURSOR'])
+    assert res['DATA'] == {'count': 2, 'users': [EXAMPLE_USERS[2]['email']]}
+    assert res['NEXT_CURSOR'] is None
+
+def test_wishers_follow_wishlist_changes(setup_database):
+    isbn = "0553448145"
+    email = EXAMPLE_USERS[0]['email']
+    assert db.get_wishers(isbn=isbn)['DATA']['count'] == 0
+    db.add_to_wishlist(email=email, isbn=isbn)
+    assert db.get_wishers(isbn=isbn)['DATA']['users'] == [email]
+    db.remove_from_wishlist(email=email, isbn=isbn)
+    assert db.get_wishers(isbn=isbn)['DATA']['count'] == 0
+
+def test_remove_book_cascade(setup_database):
+    isbn = "0425069974"
+    res = db.remove_book(isbn=isbn, cascade=True)
+    assert res['DATA'] == {'wishlists_updated': 2}
+    for user in EXAMPLE_USERS:
+        assert isbn not in db.get_wishlist(email=user['email'])['DATA']
+
+# AUTHORS SECTION
+def test_get_authors(setup_database):
+    res = db.get_authors()
+    assert {'author': 'Andy Weir', 'book_count': 2} in res['DATA']
+
+def test_get_books_by_author(setup_database):
+    res = db.get_books_by_author(author='  andy   WEIR ')
+    assert res['DATA'] == [book for book in EXAMPLE_BOOKS if book['author'] == 'Andy Weir']
+
+def test_author_index_follows_writes(setup_database_with_n20):
+    book = TEST_BOOK['N2O']
+    assert db.get_books_by_author(author=book['author'])['DATA'] == [book]
+    db.remove_book(isbn=book['isbn'])
+    res = db.get_books_by_author(author=book['author'])
+    assert res['STATUS'] == db.Response.AUTHOR_NONEXISTENT
+
+# CHANGES SECTION
+def test_get_changes(setup_database):
+    email = EXAMPLE_USERS[0]['email']
+    isbn = EXAMPLE_BOOKS[0]['isbn']
+    head = db.get_changes()['NEXT_CURSOR']
+    db.add_to_wishlist(email=email, isbn=isbn)
+    db.add_book(**TEST_BOOK['TOAST'])
+    db.remove_book(isbn=TEST_BOOK['TOAST']['isbn'])
+    res = db.get_changes(after=head)
+    assert res['STATUS'] == db.Response.SUCCESS
+    assert [(change['TABLE'], change['KEY'], change['OP']) for change in res['DATA']] == [
+        (USERS_TABLE, email, 'update'),
+        (BOOKS_TABLE, TEST_BOOK['TOAST']['isbn'], 'insert'),
+        (BOOKS_TABLE, TEST_BOOK['TOAST']['isbn'], 'remove')]
+    assert res['DATA'][0]['FIELDS'] == ['wishlist']
+    assert isbn in res['DATA'][0]['DATA']['wishlist']
+    assert res['DATA'][2]['DATA'] is None
+    # resuming from the last change returns nothing new
+    assert db.get_changes(after=res['NEXT_CURSOR'])['DATA'] == []
+    assert db.get_changes(after=head, limit=1)['NEXT_CURSOR'] == res['DATA'][0]['SEQ']
+
+def test_get_changes_skips_rolled_back_writes(setup_database):
+    head = db.get_changes()['NEXT_CURSOR']
+    with pytest.raises(RuntimeError):
+        with db.transaction():
+            db.remove_user(email=EXAMPLE_USERS[0]['email'])
+            raise RuntimeError
+    db.remove_user(email=EXAMPLE_USERS[1]['email'])
+    changes = db.get_changes(after=head)['DATA']
+    assert [change['KEY'] for change in changes] == [EXAMPLE_USERS[1]['email']]
+
+def test_get_changes_waits_for_a_change(setup_database):
+    head = db.get_changes()['NEXT_CURSOR']
+    timer = threading.Timer(0.1, db.remove_user, kwargs={'email': EXAMPLE_USERS[0]['email']})
+    timer.start()
+    res = db.get_changes(after=head, wait=5)
+    timer.join()
+    assert [change['OP'] for change in res['DATA']] == ['remove']
+
+def test_get_changes_bad_cursors(setup_database):
+    assert db.get_changes(after="nonsense")['STATUS'] == db.Response.INVALID_REQUEST
+    for wait in (float('nan'), float('inf')):
+        assert db.get_changes(wait=wait)['STATUS'] == db.Response.INVALID_REQUEST
+    head = db.get_changes()['NEXT_CURSOR']
+    db.remove_user(email=EXAMPLE_USERS[0]['email'])
+    # reopening starts a new epoch; earlier cursors can't be resumed
+    db.open_database(db._environment)
+    assert db.get_changes(after=head)['STATUS'] == db.Response.CHANGES_EXPIRED
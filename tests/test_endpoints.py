@@ -26,6 +26,7 @@ with open(config.TEST_BOOKS_FILE) as f:
 @pytest.fixture
 def client():
     initialize_database(env='TEST')
+    db.open_database('TEST')
     with app.test_client() as client:
         yield client
 
@@ -63,12 +64,54 @@ def test_remove_user(client):
     response = client.delete(f'/api/v1/users/{email}')
     assert response.status_code == 200
 
+def test_export_users(client):
+    response = client.get('/api/v1/users/export')
+    assert response.status_code == 200
+    lines = response.get_data(as_text=True).splitlines()
+    assert [json.loads(line) for line in lines] == EXAMPLE_USERS
+
 # /api/v1/users/<email>/wishlist
 def test_get_wishlist(client):
     email = "alan@turingcomplete.com"
     response = client.get(f'/api/v1/users/{email}/wishlist')
     assert response.status_code == 200
 
+def test_get_wishlist_not_modified(client):
+    email = "alan@turingcomplete.com"
+    response = client.get(f'/api/v1/users/{email}/wishlist')
+    etag = response.headers['ETag']
+    response = client.get(f'/api/v1/users/{email}/wishlist', headers={'If-None-Match': etag})
+    assert response.status_code == 304
+    client.post(f'/api/v1/users/{email}/wishlist', json={"isbn": "0553448145"})
+    response = client.get(f'/api/v1/users/{email}/wishlist', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert "0553448145" in response.json['DATA']
+
+def test_get_wishlist_follows_book_titles(client):
+    email = "alan@turingcomplete.com"
+    client.post(f'/api/v1/users/{email}/wishlist', json={"isbn": "0553448145"})
+    response = client.get(f'/api/v1/users/{email}/wishlist')
+    etag = response.headers['ETag']
+    book = client.get('/api/v1/books/0553448145').json['DATA']
+    client.delete('/api/v1/books/0553448145')
+    client.post('/api/v1/books', json=dict(book, title="Artemis (Reissue)"))
+    response = client.get(f'/api/v1/users/{email}/wishlist', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.json['DATA']["0553448145"] == "Artemis (Reissue)"
+
+def test_get_wishlist_expanded(client):
+    email = "alan@turingcomplete.com"
+    client.post(f'/api/v1/users/{email}/wishlist', json={"isbn": "0553448145"})
+    response = client.get(f'/api/v1/users/{email}/wishlist?expand=books')
+    assert response.status_code == 200
+    assert response.json['DATA']["0553448145"]['title'] == "Artemis"
+    etag = response.headers['ETag']
+    # a change to a listed book invalidates the expanded copy
+    client.delete('/api/v1/books/0553448145')
+    response = client.get(f'/api/v1/users/{email}/wishlist?expand=books', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.json['DATA']["0553448145"] is None
+
 def test_add_to_wishlist(client):
     email = "alan@turingcomplete.com"
     data = { "isbn": "0765308630" }
@@ -81,11 +124,56 @@ def test_remove_from_wishlist(client):
     response = client.delete(f'/api/v1/users/{email}/wishlist/{isbn}')
     assert response.status_code == 200
 
+def test_wishlist_writes_throttled(client, monkeypatch):
+    monkeypatch.setattr(db.WRITE_QUEUES[USERS_TABLE], 'max_depth', 0)
+    email = "alan@turingcomplete.com"
+    response = client.post(f'/api/v1/users/{email}/wishlist', json={ "isbn": "0765308630" })
+    assert response.status_code == 429
+    assert int(response.headers['Retry-After']) >= 1
+    response = client.delete(f'/api/v1/users/{email}/wishlist/0765308630')
+    assert response.status_code == 429
+
 # /api/v1/books* ENDPOINT TESTS
 def test_get_all_books(client):
     response = client.get(f'/api/v1/books')
     assert response.status_code == 200
 
+def test_get_books_page(client):
+    response = client.get('/api/v1/books?limit=2&fields=isbn,title')
+    assert response.status_code == 200
+    assert len(response.json['DATA']) == 2
+    assert set(response.json['DATA'][0]) == {'isbn', 'title'}
+    response = client.get(f"/api/v1/books?limit=2&cursor={response.json['NEXT_CURSOR']}")
+    assert response.json['DATA'][0] == EXAMPLE_BOOKS[2]
+
+def test_get_books_bad_cursor(client):
+    response = client.get('/api/v1/books?limit=2&cursor=bogus')
+    assert response.status_code == 400
+
+def test_get_books_bad_limit(client):
+    for path in ('/api/v1/books?limit=abc', '/api/v1/books?limit=0', '/api/v1/books/search?q=hail&limit=abc'):
+        assert client.get(path).status_code == 400
+
+def test_export_books(client):
+    response = client.get('/api/v1/books/export')
+    assert response.status_code == 200
+    assert response.mimetype == 'application/x-ndjson'
+    lines = response.get_data(as_text=True).splitlines()
+    assert [json.loads(line) for line in lines] == EXAMPLE_BOOKS
+
+def test_get_all_books_not_modified(client):
+    etag = client.get('/api/v1/books').headers['ETag']
+    response = client.get('/api/v1/books', headers={'If-None-Match': etag})
+    assert response.status_code == 304
+    client.post('/api/v1/books', json=TEST_BOOK['N2O'])
+    response = client.get('/api/v1/books', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+
+def test_search_books(client):
+    response = client.get('/api/v1/books/search?q=draco')
+    assert response.status_code == 200
+    assert response.json['DATA'][0]['isbn'] == "0765308630"
+
 def test_get_book(client):
     isbn = "0765308630"
     response = client.get(f'/api/v1/books/{isbn}')
@@ -96,7 +184,92 @@ def test_add_book(client):
     response = client.post(f'/api/v1/books', json=data)
     assert response.status_code == 201
 
+def test_bulk_add_books(client):
+    response = client.post('/api/v1/books/bulk', json=list(TEST_BOOK.values()))
+    assert response.status_code == 200
+    assert [result['STATUS'] for result in response.json['DATA']] == [db.Response.BOOK_CREATED] * 3
+
+def test_bulk_add_books_ndjson(client):
+    lines = [json.dumps(book) for book in TEST_BOOK.values()] + ['{not json', json.dumps(EXAMPLE_BOOKS[0])]
+    response = client.post('/api/v1/books/bulk', data='\n'.join(lines), content_type='application/x-ndjson')
+    assert response.status_code == 200
+    assert [result['STATUS'] for result in response.json['DATA']] == [db.Response.BOOK_CREATED] * 3 + [
+        db.Response.INVALID_REQUEST, db.Response.BOOK_ALREADY_EXISTS]
+
+def test_bulk_add_books_rejects_bad_batch_size(client):
+    for batch_size in ('0', '-5', 'abc'):
+        response = client.post(f'/api/v1/books/bulk?batch_size={batch_size}', json=list(TEST_BOOK.values()))
+        assert response.status_code == 400
+    assert client.get(f"/api/v1/books/{TEST_BOOK['RUFF']['isbn']}").status_code == 404
+
+def test_bulk_add_users_rejects_non_array(client):
+    response = client.post('/api/v1/users/bulk', json=TEST_USER)
+    assert response.status_code == 400
+
+def test_batch_get_books(client):
+    response = client.post('/api/v1/books/batch_get', json={'isbns': ["0593395565", "0000000000"]})
+    assert response.status_code == 200
+    assert response.json['DATA']["0593395565"]['title'] == "Hail Mary"
+    assert response.json['DATA']["0000000000"] is None
+    response = client.post('/api/v1/books/batch_get', json=["0593395565"])
+    assert response.status_code == 400
+
 def test_remove_book(client):
     isbn = "0765308630"
     response = client.delete(f'/api/v1/books/{isbn}')
-    assert response.status_code == 200
\ No newline at end of file
+    assert response.status_code == 200
+
+def test_get_book_wishers(client):
+    response = client.get('/api/v1/books/0425069974/wishers')
+    assert response.status_code == 200
+    assert response.json['DATA']['count'] == 2
+
+def test_get_book_wishers_follows_the_book(client):
+    response = client.get('/api/v1/books/0425069974/wishers')
+    etag = response.headers['ETag']
+    client.delete('/api/v1/books/0425069974')
+    response = client.get('/api/v1/books/0425069974/wishers', headers={'If-None-Match': etag})
+    assert response.status_code == 404
+
+def test_remove_book_cascade(client):
+    isbn = "0765308630"
+    response = client.delete(f'/api/v1/books/{isbn}?cascade=true')
+    assert response.status_code == 200
+    assert response.json['DATA'] == {'wishlists_updated': 1}
+
+# /api/v1/authors* ENDPOINT TESTS
+def test_get_authors(client):
+    response = client.get('/api/v1/authors')
+    assert response.status_code == 200
+
+def test_get_author_books(client):
+    response = client.get('/api/v1/authors/andy weir/books')
+    assert response.status_code == 200
+    assert len(response.json['DATA']) == 2
+
+def test_get_unknown_author_books(client):
+    response = client.get('/api/v1/authors/nobody/books')
+    assert response.status_code == 404
+
+# /api/v1/changes* ENDPOINT TESTS
+def test_get_changes(client):
+    head = client.get('/api/v1/changes').json['NEXT_CURSOR']
+    client.delete('/api/v1/users/ada@firstprogrammer.com')
+    response = client.get(f'/api/v1/changes?after={head}&wait=1')
+    assert response.status_code == 200
+    assert response.json['DATA'][0]['KEY'] == 'ada@firstprogrammer.com'
+    assert client.get('/api/v1/changes?after=x.1').status_code == 410
+    assert client.get('/api/v1/changes?after=bad').status_code == 400
+    assert client.get('/api/v1/changes?wait=nan').status_code == 400
+    assert client.get('/api/v1/changes?wait=inf').status_code == 400
+
+def test_change_stream(client):
+    head = client.get('/api/v1/changes').json['NEXT_CURSOR']
+    client.delete('/api/v1/users/ada@firstprogrammer.com')
+    response = client.get('/api/v1/changes/stream', headers={'Last-Event-ID': head})
+    assert response.status_code == 200
+    assert response.mimetype == 'text/event-stream'
+    first = next(response.response).decode()
+    response.close()
+    assert first.startswith('id: ')
+    assert '"KEY": "ada@firstprogrammer.com"' in first
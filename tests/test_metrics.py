@@ -0,0 +1,58 @@
+# STANDARD LIBRARY
+import logging
+
+# 3RD PARTY MODULES
+import pytest
+
+# LOCAL MODULES
+from app import app
+from PyBrary import config, db, initialize_database, metrics
+
+
+# FIXTURES
+@pytest.fixture
+def client():
+    initialize_database(env='TEST')
+    metrics.reset()
+    with app.test_client() as client:
+        yield client
+
+# TESTS
+def test_histogram_renders_cumulative_buckets():
+    histogram = metrics.Histogram('test_seconds', "Test", labelnames=('name',), buckets=(0.1, 1.0))
+    histogram.observe(0.05, name='a')
+    histogram.observe(0.5, name='a')
+    histogram.observe(5, name='a')
+    lines = histogram.render()
+    assert '# TYPE test_seconds histogram' in lines
+    assert 'test_seconds_bucket{name="a",le="0.1"} 1' in lines
+    assert 'test_seconds_bucket{name="a",le="1.0"} 2' in lines
+    assert 'test_seconds_bucket{name="a",le="+Inf"} 3' in lines
+    assert 'test_seconds_sum{name="a"} 5.55' in lines
+    assert 'test_seconds_count{name="a"} 3' in lines
+
+def test_db_operations_are_timed_by_phase(client):
+    db.add_to_wishlist(email="ada@firstprogrammer.com", isbn="0593395565")
+    for phase in ('open', 'query', 'write', 'total'):
+        assert metrics.DB_OPERATION_SECONDS.count(operation='add_to_wishlist', phase=phase) == 1
+    # nested lookups count towards the outer operation only
+    db.get_wishlist(email="ada@firstprogrammer.com")
+    assert metrics.DB_OPERATION_SECONDS.count(operation='get_wishlist', phase='total') == 1
+    assert metrics.DB_OPERATION_SECONDS.count(operation='get_user', phase='total') == 0
+
+def test_metrics_endpoint(client):
+    client.get('/api/v1/books/0593395565')
+    response = client.get('/api/v1/metrics')
+    assert response.status_code == 200
+    assert response.mimetype == 'text/plain'
+    body = response.get_data(as_text=True)
+    assert 'pybrary_http_request_seconds_count{route="/api/v1/books/<isbn>",method="GET",status="200"} 1' in body
+    assert 'pybrary_db_operation_seconds_count{operation="get_book",phase="total"} 1' in body
+
+def test_slow_operation_log(client, monkeypatch, caplog):
+    monkeypatch.setattr(config, 'SLOW_OPERATION_THRESHOLD', 0)
+    with caplog.at_level(logging.WARNING, logger='PyBrary.metrics'):
+        client.get('/api/v1/books')
+    messages = [record.getMessage() for record in caplog.records]
+    assert any(message.startswith('slow db operation get_all_books') for message in messages)
+    assert any(message.startswith('slow request GET /api/v1/books') for message in messages)
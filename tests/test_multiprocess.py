@@ -0,0 +1,132 @@
+# STANDARD LIBRARY
+import json
+import multiprocessing
+
+# 3RD PARTY MODULES
+import pytest
+
+# LOCAL MODULES
+from PyBrary import config, db, initialize_database
+from PyBrary.coordination import ProcessCoordinator, WriteConflict
+
+
+# GLOBAL
+ENV = "TEST_MULTIPROCESS"
+with open(config.EXAMPLE_DATA) as f:
+    EXAMPLE_DATA = json.load(f)
+CONTEXT = multiprocessing.get_context('spawn')
+
+# UTILITY FUNCTIONS
+def add_users(worker:int, count:int) -> None:
+    db.open_database(ENV)
+    for n in range(count):
+        email = f"worker{worker}.{n}@example.com"
+        assert db.add_user("Worker", str(worker), email, "password", {})['STATUS'] == db.Response.USER_CREATED
+    db.close_database()
+
+def rename_user(email:str, first_name:str) -> None:
+    db.open_database(ENV)
+    assert db.update_user(email=email, data={'first_name': first_name})['STATUS'] == db.Response.USER_UPDATED
+    db.close_database()
+
+def run_in_process(target, *args) -> None:
+    process = CONTEXT.Process(target=target, args=args)
+    process.start()
+    process.join()
+    assert process.exitcode == 0
+
+# FIXTURE DEFINITIONS
+@pytest.fixture
+def setup_database():
+    initialize_database(ENV)
+    db.open_database(ENV)
+    yield
+    db.close_database()
+
+# TESTS
+def test_concurrent_writers_do_not_lose_commits(setup_database):
+    before = len(db.get_table(config.USERS_TABLE_NAME))
+    processes = [CONTEXT.Process(target=add_users, args=(worker, 10)) for worker in range(4)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+        assert process.exitcode == 0
+    assert sum(1 for _ in db.iter_users()) == before + 40
+
+def test_reader_sees_other_process_commits(setup_database):
+    email = "worker0.0@example.com"
+    assert db.get_user(email)['STATUS'] == db.Response.USER_NONEXISTENT
+    version = db.get_version(config.USERS_TABLE_NAME)
+    run_in_process(add_users, 0, 1)
+    assert db.get_user(email)['STATUS'] == db.Response.SUCCESS
+    assert db.get_version(config.USERS_TABLE_NAME) != version
+
+def test_write_on_stale_data_is_retried(setup_database):
+    attempts = []
+
+    def add_after_other_process(email:str):
+        attempts.append(email)
+        if len(attempts) == 1:
+            run_in_process(add_users, 1, 1)
+        return db.add_user("Late", "Writer", email, "password", {})
+
+    response = db.run_transaction(add_after_other_process, "late@example.com")
+    assert response['STATUS'] == db.Response.USER_CREATED
+    assert len(attempts) == 2
+    assert db.get_user("worker1.0@example.com")['STATUS'] == db.Response.SUCCESS
+
+def test_conflict_rolls_back(setup_database):
+    with pytest.raises(WriteConflict):
+        with db.transaction():
+            run_in_process(add_users, 2, 1)
+            db.add_user("Late", "Writer", "late@example.com", "password", {})
+    assert db.get_user("late@example.com")['STATUS'] == db.Response.USER_NONEXISTENT
+    assert db.get_user("worker2.0@example.com")['STATUS'] == db.Response.SUCCESS
+
+def test_journal_replays_commits_until_it_restarts(tmp_path):
+    path = str(tmp_path / 'db.json')
+    writer = ProcessCoordinator(path, journal_bytes=200)
+    reader = ProcessCoordinator(path, journal_bytes=200)
+    assert reader.read_changes() == []
+    writer.publish([['users', '1', None, {'email': 'a'}]])
+    writer.publish([['users', '2', None, {'email': 'b'}]])
+    assert [change[1] for change in reader.read_changes()] == ['1', '2']
+    reader.mark_loaded()
+    # a commit published without its changes, e.g. a replaced database
+    writer.publish()
+    assert reader.read_changes() is None
+    reader.mark_loaded()
+    for n in range(10):
+        writer.publish([['users', str(n), None, {'email': 'x' * 20}]])
+    # the journal restarted after the reader's last generation
+    assert reader.read_changes() is None
+    reader.mark_loaded()
+    writer.publish([['users', '10', None, {'email': 'c'}]])
+    assert [change[1] for change in reader.read_changes()] == ['10']
+
+def test_other_process_commits_are_applied_without_reloading(setup_database, monkeypatch):
+    cursor = db.get_changes()['NEXT_CURSOR']
+    run_in_process(add_users, 3, 2)
+
+    def reopen(*args, **kwargs):
+        raise AssertionError("reloaded the whole database")
+
+    monkeypatch.setattr(db, 'open_backend', reopen)
+    assert db.get_user("worker3.1@example.com")['STATUS'] == db.Response.SUCCESS
+    changes = db.get_changes(after=cursor)['DATA']
+    assert [(change['OP'], change['KEY']) for change in changes] == [
+        ('insert', "worker3.0@example.com"), ('insert', "worker3.1@example.com")]
+
+def test_cached_lookup_sees_other_process_commits(setup_database):
+    email = EXAMPLE_DATA[config.USERS_TABLE_NAME][0]['email']
+    assert db.get_user(email)['DATA']['first_name'] != "Renamed"
+    run_in_process(rename_user, email, "Renamed")
+    assert db.get_user(email)['DATA']['first_name'] == "Renamed"
+
+def test_replaced_database_is_reloaded(setup_database):
+    assert db.add_user("Late", "Writer", "late@example.com", "password", {})['STATUS'] == db.Response.USER_CREATED
+    assert db.get_user("late@example.com")['STATUS'] == db.Response.SUCCESS
+    run_in_process(initialize_database, ENV)
+    assert db.get_user("late@example.com")['STATUS'] == db.Response.USER_NONEXISTENT
+    assert sum(1 for _ in db.iter_users()) == len(EXAMPLE_DATA[config.USERS_TABLE_NAME])
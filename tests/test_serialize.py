@@ -0,0 +1,86 @@
+# STANDARD LIBRARY
+import json
+
+# 3RD PARTY MODULES
+import pytest
+
+# LOCAL MODULES
+from app import app
+from PyBrary import config, db, initialize_database, serialize
+
+
+# GLOBAL
+BOOKS_TABLE = config.BOOKS_TABLE_NAME
+USERS_TABLE = config.USERS_TABLE_NAME
+VALUES = [
+    {'title': 'Artemis', 'isbn': '0553448145', 'tags': [1, -2, None, True, False]},
+    {'title': 'Café   \x7f \x01 "quoted" \\ / \n\t'},
+    {'b': 1.5, 'a': [1e16, 0.1]},
+    {'nested': {'z': {}, 'y': []}},
+    [],
+    None,
+    2 ** 70
+]
+
+
+# FIXTURES
+@pytest.fixture(params=['orjson', 'stdlib'])
+def encoder(request, monkeypatch):
+    if request.param == 'stdlib':
+        monkeypatch.setattr(serialize, 'orjson', None)
+    elif serialize.orjson is None:
+        pytest.skip("orjson is not installed")
+
+@pytest.fixture
+def setup_database():
+    initialize_database("TEST")
+    db.open_database("TEST")
+    yield
+    db.close_database()
+
+
+# UTILITY FUNCTIONS
+def flask_json(data) -> bytes:
+    with app.app_context():
+        return app.json.response(data).get_data()
+
+
+# TESTS
+@pytest.mark.parametrize('value', VALUES)
+def test_encode_matches_flask(encoder, value):
+    assert serialize.encode(value) + b'\n' == flask_json(value)
+
+def test_dumps_matches_flask(encoder, setup_database):
+    payloads = [
+        (db.get_all_books(), BOOKS_TABLE),
+        (db.get_all_books(fields=['title']), BOOKS_TABLE),
+        (db.get_book(isbn='0553448145'), BOOKS_TABLE),
+        (db.get_book(isbn='missing'), BOOKS_TABLE),
+        (db.get_books(isbns=['0553448145', 'missing']), BOOKS_TABLE),
+        (db.get_all_users(), USERS_TABLE),
+        (db.get_wishlist(email='alan@turingcomplete.com', expand=True), BOOKS_TABLE),
+        (db.get_wishlist(email='alan@turingcomplete.com'), None)
+    ]
+    for action_results, table_name in payloads:
+        # twice: once filling the fragment cache and once reading from it
+        assert serialize.dumps(action_results, table_name) == flask_json(action_results)
+        assert serialize.dumps(action_results, table_name) == flask_json(action_results)
+
+def test_fragments_invalidated_on_mutation(setup_database):
+    isbn = '0553448145'
+    serialize.dumps(db.get_book(isbn=isbn), BOOKS_TABLE)
+    assert isbn in serialize.FRAGMENTS[BOOKS_TABLE]
+    db.remove_book(isbn=isbn)
+    assert isbn not in serialize.FRAGMENTS[BOOKS_TABLE]
+
+def test_fragments_only_reused_for_equal_documents(setup_database):
+    book = db.get_book(isbn='0553448145')['DATA']
+    serialize.encode_record(book, BOOKS_TABLE)
+    changed = dict(book, title='Retitled')
+    assert json.loads(serialize.encode_record(changed, BOOKS_TABLE))['title'] == 'Retitled'
+
+def test_endpoint_matches_flask(setup_database):
+    with app.test_client() as client:
+        response = client.get('/api/v1/books')
+        assert response.mimetype == 'application/json'
+        assert response.get_data() == flask_json(db.get_all_books())
@@ -0,0 +1,72 @@
+# STANDARD LIBRARY
+import json
+
+# 3RD PARTY MODULES
+import pytest
+
+# LOCAL MODULES
+from PyBrary import config
+from PyBrary.backends import TABLE_KEYS, SnapshotBackend
+from PyBrary.snapshot import SnapshotError, SnapshotStorage, convert, read_snapshot, write_snapshot
+
+
+# GLOBAL
+BOOKS = config.BOOKS_TABLE_NAME
+USERS = config.USERS_TABLE_NAME
+
+
+# FIXTURES
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / 'db.snapshot')
+
+
+# TESTS
+def test_round_trip_decodes_lazily(path):
+    tables = {BOOKS: {'1': {'isbn': 'a', 'title': 'A'}, '2': {'isbn': 'b', 'title': 'B'}}}
+    write_snapshot(path, tables, TABLE_KEYS)
+    storage = SnapshotStorage(path)
+    books = storage.read()[BOOKS]
+    assert list(books) == ['1', '2']
+    assert books.decoded() == 0
+    assert books['2'] == {'isbn': 'b', 'title': 'B'}
+    assert books.decoded() == 1
+    assert dict(books.field_items('isbn')) == {'1': 'a', '2': 'b'}
+    assert books.decoded() == 1
+    storage.close()
+
+def test_rewrite_keeps_undecoded_records(path):
+    write_snapshot(path, {BOOKS: {'1': {'isbn': 'a'}, '2': {'isbn': 'b'}}}, TABLE_KEYS)
+    storage = SnapshotStorage(path, TABLE_KEYS)
+    tables = storage.read()
+    tables[BOOKS]['1'] = {'isbn': 'c'}
+    del tables[BOOKS]['2']
+    tables[BOOKS]['3'] = {'isbn': 'd'}
+    storage.write(tables)
+    storage.close()
+
+    reread = SnapshotStorage(path)
+    assert dict(reread.read()[BOOKS]) == {'1': {'isbn': 'c'}, '3': {'isbn': 'd'}}
+    reread.close()
+
+def test_rejects_other_files(path):
+    with pytest.raises(SnapshotError):
+        read_snapshot(b'{"BOOKS": {}}')
+
+def test_convert_example_data(path):
+    convert(config.EXAMPLE_DATA, path, TABLE_KEYS)
+    with open(config.EXAMPLE_DATA) as f:
+        example = json.load(f)
+    backend = SnapshotBackend(path)
+    assert len(backend.table(BOOKS)) == len({book['isbn'] for book in example[BOOKS]})
+    first = example[USERS][0]
+    assert backend.table(USERS).get(first['email'])['first_name'] == first['first_name']
+    backend.close()
+
+def test_convert_tinydb_file(tmp_path, path):
+    source = tmp_path / 'db.json'
+    source.write_text(json.dumps({BOOKS: {'4': {'isbn': 'a', 'title': 'A'}}}))
+    convert(str(source), path, TABLE_KEYS)
+    storage = SnapshotStorage(path)
+    assert dict(storage.read()[BOOKS]) == {'4': {'isbn': 'a', 'title': 'A'}}
+    storage.close()
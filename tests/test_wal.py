@@ -0,0 +1,113 @@
+# STANDARD LIBRARY
+import json
+import threading
+
+# 3RD PARTY MODULES
+import pytest
+
+# LOCAL MODULES
+from PyBrary.config import BOOKS_TABLE_NAME as BOOKS_TABLE
+from PyBrary.backends import WALBackend
+from PyBrary.wal import WriteAheadLog, read_snapshot
+
+
+# FIXTURES
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / 'db.json')
+
+
+# TESTS
+def test_recover_replays_log_over_snapshot(path):
+    log = WriteAheadLog(path)
+    log.checkpoint({'books': {'1': {'isbn': 'a'}}})
+    log.sync(log.append([['books', '2', {'isbn': 'b'}]]))
+    log.sync(log.append([['books', '1', None]]))
+    log.close()
+
+    data = WriteAheadLog(path).recover()
+    assert data == {'books': {'2': {'isbn': 'b'}}}
+
+def test_recover_discards_torn_tail(path):
+    log = WriteAheadLog(path)
+    log.sync(log.append([['books', '1', {'isbn': 'a'}]]))
+    log.close()
+    with open(log.segments()[-1][1], 'a') as f:
+        f.write('{"lsn": 2, "ops": [["books", "2"')
+
+    recovered = WriteAheadLog(path)
+    assert recovered.recover() == {'books': {'1': {'isbn': 'a'}}}
+    assert recovered.append([]) == 2
+
+def test_compact_folds_closed_segments_into_snapshot(path):
+    log = WriteAheadLog(path)
+    log.append([['users', '1', {'email': 'a@b.c'}]])
+    log.rotate()
+    log.append([['users', '2', {'email': 'd@e.f'}]])
+    log.compact()
+
+    assert read_snapshot(path) == {'users': {'1': {'email': 'a@b.c'}}}
+    assert len(log.segments()) == 1
+    log.close()
+    assert WriteAheadLog(path).recover()['users'].keys() == {'1', '2'}
+
+def test_group_commit_covers_earlier_appends(path):
+    log = WriteAheadLog(path, fsync=False)
+    lsns = [log.append([['books', str(n), {'isbn': str(n)}]]) for n in range(1, 4)]
+    log.sync(lsns[-1])
+    with open(log.segments()[-1][1]) as f:
+        assert [json.loads(line)['lsn'] for line in f] == lsns
+    log.close()
+
+def test_concurrent_commits_are_all_durable(path):
+    log = WriteAheadLog(path, fsync=False)
+
+    def commit(n):
+        log.sync(log.append([['books', str(n), {'isbn': str(n)}]]))
+
+    threads = [threading.Thread(target=commit, args=(n,)) for n in range(1, 21)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    log.close()
+    assert len(WriteAheadLog(path).recover()['books']) == 20
+
+def test_backend_survives_reopen_without_checkpoint(path):
+    backend = WALBackend(path, WAL_SYNC=False)
+    backend.begin()
+    backend.table(BOOKS_TABLE).insert({'isbn': '1', 'title': 'T', 'author': 'A', 'year_published': 2000})
+    backend.sync(backend.commit())
+    # simulate a crash: stop the compactor without writing a checkpoint
+    backend._stopping.set()
+    backend.log.close()
+
+    reopened = WALBackend(path, WAL_SYNC=False)
+    assert reopened.table(BOOKS_TABLE).get('1')['title'] == 'T'
+    reopened.close()
+
+def test_backend_rollback_is_not_logged(path):
+    backend = WALBackend(path, WAL_SYNC=False)
+    backend.begin()
+    backend.table(BOOKS_TABLE).insert({'isbn': '1', 'title': 'T', 'author': 'A', 'year_published': 2000})
+    backend.rollback()
+    backend.begin()
+    assert backend.commit() is None
+    backend.close()
+    assert not WALBackend(path).table(BOOKS_TABLE).contains('1')
+
+def test_compactor_keeps_running_after_a_failure(path):
+    backend = WALBackend(path, WAL_SYNC=False, WAL_COMPACT_INTERVAL=0.01, WAL_COMPACT_BYTES=0)
+    attempts = []
+    compacted = threading.Event()
+
+    def compact():
+        attempts.append(None)
+        if len(attempts) == 1:
+            raise ValueError("I/O operation on closed file")
+        compacted.set()
+
+    backend.log.compact = compact
+    assert compacted.wait(5)
+    assert backend._compactor.is_alive()
+    backend.close()